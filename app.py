@@ -1,12 +1,30 @@
 import os
+import io
 import cv2
+import shutil
+import tempfile
 import time
+import json
 import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime
 from flask import Flask, render_template, Response, request, jsonify, send_from_directory
 import numpy as np
-import tensorflow as tf
-from utils import preprocess_roi, ensure_dir
+from utils import ensure_dir, decode_image, scale_predictions
+from inference import (InputBuffer, decode_keras_output, keras_boxes, yolo_boxes, tile_grid,
+                       pest_scores, merge_tile_boxes)
+from batching import MicroBatcher
+from cameras import Camera, MultiCameraDetector, parse_sources
+from prediction_cache import PredictionCache, content_key
+from snapshot_store import SnapshotWriter
+from backends import DEFAULT_PATHS, load_backend, import_runtime
+from model_registry import ModelBundle, ModelRegistry, version_id
+from archives import iter_images, ARCHIVE_ERRORS
+import video_analysis
+from worker_pool import ModelWorkerPool
+import metrics
 
 HAS_CORS = False
 try:
@@ -15,15 +33,14 @@ try:
 except ImportError:
     pass
 
+# Try YOLO first when its weights exist; ultralytics is only imported then
 USE_YOLO = True
-try:
-    from ultralytics import YOLO
-except ImportError:
-    USE_YOLO = False
+STARTED_AT = time.time()
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MODEL_KERAS = os.path.join(BASE_DIR, 'models', 'insect_rat_model.keras')
 MODEL_YOLO = os.path.join(BASE_DIR, 'runs', 'train', 'pest_detector_v1', 'weights', 'best.pt')
+CLASS_FILE = os.path.join(os.path.dirname(MODEL_KERAS), 'class_names.txt')
 STATIC_DIR = os.path.join(BASE_DIR, 'static')
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 SNAPSHOT_DIR = os.path.join(BASE_DIR, 'snapshots')
@@ -34,124 +51,424 @@ ensure_dir(TEMPLATES_DIR)
 
 CONFIDENCE_THRESHOLD = 0.6
 INPUT_SIZE = (224, 224)
+YOLO_IMGSZ = 640
+# Uploads are decoded at reduced JPEG scale while both sides stay >= this multiple of the model input
+DECODE_OVERSAMPLE = float(os.environ.get('DECODE_OVERSAMPLE', 2))
+
+# Classifier backend when YOLO is not used: keras, tflite or onnxruntime (see export_model.py)
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'keras')
+
+# Model files are polled this often and reloaded without downtime when they change (0 disables)
+MODEL_POLL_SECONDS = float(os.environ.get('MODEL_POLL_SECONDS', 2))
+
+# Serving mode: 'thread' runs the model in this process, 'pool' in POOL_WORKERS processes
+SERVING_MODE = os.environ.get('SERVING_MODE', 'thread')
+POOL_WORKERS = int(os.environ.get('POOL_WORKERS', 2))
+POOL_THREADS_PER_WORKER = int(os.environ.get('POOL_THREADS_PER_WORKER', max(1, (os.cpu_count() or 1) // max(1, POOL_WORKERS))))
+POOL_SLOT_MB = int(os.environ.get('POOL_SLOT_MB', 16))
+
+# Micro-batching: concurrent requests are grouped into one forward pass
+BATCH_MAX_SIZE = int(os.environ.get('BATCH_MAX_SIZE', 8))
+BATCH_MAX_WAIT_MS = float(os.environ.get('BATCH_MAX_WAIT_MS', 10))
+
+# Live feed cameras: comma-separated device indices and/or video file paths
+CAMERA_SOURCES = parse_sources(os.environ.get('CAMERA_SOURCES', '0'))
+# Per camera: display rate cap and share of one core inference may use
+VIDEO_TARGET_FPS = float(os.environ.get('VIDEO_TARGET_FPS', 15))
+VIDEO_CPU_BUDGET = float(os.environ.get('VIDEO_CPU_BUDGET', 0.5))
+VIDEO_MAX_SKIP = int(os.environ.get('VIDEO_MAX_SKIP', 30))
+
+# Upload prediction cache (keyed by image bytes + model identity)
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 256))
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 8 * 1024 * 1024))
+CACHE_TTL_SECONDS = float(os.environ.get('CACHE_TTL_SECONDS', 3600))
+
+# Tiled classifier inference (/api/predict_image?mode=tiled): window size in pixels, overlap
+# fraction, and the tile cap (requests may ask for fewer); larger images use larger windows
+TILE_SIZE = int(os.environ.get('TILE_SIZE', 224))
+TILE_OVERLAP = float(os.environ.get('TILE_OVERLAP', 0.25))
+TILE_MAX = int(os.environ.get('TILE_MAX', 64))
+TILE_BATCH_SIZE = int(os.environ.get('TILE_BATCH_SIZE', 32))
+
+# /api/predict_batch: total upload size (many files or an archive) and parallel decoders
+UPLOAD_MAX_BYTES = 16 * 1024 * 1024
+BATCH_UPLOAD_MAX_MB = int(os.environ.get('BATCH_UPLOAD_MAX_MB', 2048))
+BATCH_DECODE_WORKERS = int(os.environ.get('BATCH_DECODE_WORKERS', min(4, os.cpu_count() or 1)))
+
+# Background snapshot writer; 0 disables a quota
+SNAPSHOT_MAX_FILES = int(os.environ.get('SNAPSHOT_MAX_FILES', 1000))
+SNAPSHOT_MAX_BYTES = int(os.environ.get('SNAPSHOT_MAX_BYTES', 500 * 1024 * 1024))
+SNAPSHOT_QUEUE_SIZE = int(os.environ.get('SNAPSHOT_QUEUE_SIZE', 64))
+SNAPSHOT_QUEUE_POLICY = os.environ.get('SNAPSHOT_QUEUE_POLICY', 'drop')
 
 app = Flask(__name__, template_folder=TEMPLATES_DIR, static_folder=STATIC_DIR)
 app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+# the global limit is for the bulk endpoints; every other route is held to UPLOAD_MAX_BYTES below
+app.config['MAX_CONTENT_LENGTH'] = max(UPLOAD_MAX_BYTES, BATCH_UPLOAD_MAX_MB * 1024 * 1024)
+BULK_UPLOAD_ENDPOINTS = ('api_predict_batch', 'api_analyze_video')
+
+@app.before_request
+def limit_upload_size():
+    if request.endpoint in BULK_UPLOAD_ENDPOINTS:
+        return None
+    # enforced by Werkzeug while the body is read, so chunked uploads without a Content-Length are capped too
+    request.max_content_length = UPLOAD_MAX_BYTES
+    if (request.content_length or 0) > UPLOAD_MAX_BYTES:
+        return jsonify({'error': 'Upload too large'}), 413
 
 if HAS_CORS:
     CORS(app, resources={r"/api/*": {"origins": "*"}})
 
-model_yolo = None
-model_keras = None
+worker_pool = None
+model_type = 'None'
+model_backend = None
+model_version = None
 model_names = ['hygienic', 'insects', 'ratimages']
 model_status = "Initializing..."
 models_loaded = False
+load_phases = []
 webcam_available = False
-cap = None
+cameras = []
+
+prediction_cache = PredictionCache(CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_TTL_SECONDS)
+snapshot_writer = SnapshotWriter(SNAPSHOT_DIR, max_files=SNAPSHOT_MAX_FILES, max_bytes=SNAPSHOT_MAX_BYTES,
+                                 queue_size=SNAPSHOT_QUEUE_SIZE, policy=SNAPSHOT_QUEUE_POLICY)
+
+def _record_capture(seconds, ok):
+    metrics.STAGE_LATENCY.observe(seconds, 'video_feed', 'capture')
+    if not ok:
+        metrics.STAGE_ERRORS.inc('video_feed', 'capture')
+
+_cameras_lock = threading.Lock()
+cameras_initialized = False
+
+def init_cameras():
+    """
+    Open every configured source; /video_feed serves the first one.
+    Called on the first /video_feed request rather than at start-up, so
+    instances that never stream do not pay for opening cameras.
+    """
+    global cameras_initialized
+    with _cameras_lock:
+        if cameras_initialized:
+            return webcam_available
+        cameras_initialized = True
+        with metrics.stage('video_feed', 'camera_init'):
+            _open_cameras()
+    return webcam_available
 
-def init_webcam():
-    global cap, webcam_available
+def _open_cameras():
+    global webcam_available
+    governor_kwargs = {'target_fps': VIDEO_TARGET_FPS, 'cpu_budget': VIDEO_CPU_BUDGET, 'max_skip': VIDEO_MAX_SKIP}
+    for i, source in enumerate(CAMERA_SOURCES):
+        cam = Camera(i, source, render_frame, governor_kwargs=governor_kwargs,
+                     on_read=_record_capture, notify=camera_detector.notify)
+        cam.open()
+        cameras.append(cam)
+    webcam_available = any(cam.available for cam in cameras)
+    return webcam_available
+
+def get_camera(cam_id):
+    for cam in cameras:
+        if cam.cam_id == str(cam_id):
+            return cam
+    return None
+
+@contextmanager
+def load_phase(phase, target):
+    """Record one model start-up step (import, load, warmup) with its timing for /api/ready."""
+    entry = {'phase': phase, 'target': target, 'status': 'running',
+             'started': round(time.time() - STARTED_AT, 3), 'seconds': None}
+    load_phases.append(entry)
+    t0 = time.perf_counter()
     try:
-        cap = cv2.VideoCapture(0)
-        if cap and cap.isOpened():
-            ret, _ = cap.read()
-            if ret:
-                webcam_available = True
-                return True
-        cap = None
-        webcam_available = False
-        return False
-    except:
-        cap = None
-        webcam_available = False
-        return False
+        with metrics.stage('load', f"{target}_{phase}"):
+            yield entry
+        entry['status'] = 'done'
+    except Exception as e:
+        entry['status'] = 'failed'
+        entry['error'] = str(e)
+        raise
+    finally:
+        entry['seconds'] = round(time.perf_counter() - t0, 3)
+
+def model_files():
+    """Files whose change triggers a reload of the serving model."""
+    files = [MODEL_YOLO] if USE_YOLO else []
+    if INFERENCE_BACKEND == 'keras':
+        files.append(MODEL_KERAS)
+    elif INFERENCE_BACKEND == 'tflite':
+        files += [DEFAULT_PATHS['tflite'], DEFAULT_PATHS['tflite-fp16']]
+    else:
+        files.append(DEFAULT_PATHS[INFERENCE_BACKEND])
+    files.append(CLASS_FILE)
+    return files
 
-def load_models():
-    global model_yolo, model_keras, model_names, model_status, models_loaded
-    if USE_YOLO:
+def _state_of(state, *paths):
+    return tuple(entry for entry in state if entry[0] in paths)
+
+def load_model_bundle(state):
+    """
+    Load and warm the model the files currently describe. Runs on the
+    registry thread, both at start-up and for every hot reload.
+    """
+    global load_phases, model_status
+    load_phases = []
+    if SERVING_MODE == 'pool':
+        return load_pool_bundle()
+    if USE_YOLO and os.path.exists(MODEL_YOLO):
         try:
-            if os.path.exists(MODEL_YOLO):
-                model_yolo = YOLO(MODEL_YOLO)
-                try:
-                    model_names = list(model_yolo.names.values()) if hasattr(model_yolo.names, 'values') else model_yolo.names
-                except:
-                    pass
-                model_status = "YOLO Ready"
-                models_loaded = True
-                return
-        except:
-            pass
+            t0 = time.perf_counter()
+            with load_phase('import', 'yolo'):
+                from ultralytics import YOLO
+            with load_phase('load', 'yolo'):
+                yolo = YOLO(MODEL_YOLO)
+            with load_phase('warmup', 'yolo'):
+                yolo(np.zeros((YOLO_IMGSZ, YOLO_IMGSZ, 3), np.uint8), verbose=False)
+            metrics.MODEL_LOAD_SECONDS.set(time.perf_counter() - t0, 'yolo')
+            names = list(yolo.names.values()) if hasattr(yolo.names, 'values') else list(yolo.names)
+            return ModelBundle('YOLO', 'ultralytics', yolo, names,
+                               version_id('YOLO', 'ultralytics', _state_of(state, MODEL_YOLO)))
+        except Exception as e:
+            print(f"YOLO load failed: {e}")
     
-    if os.path.exists(MODEL_KERAS):
+    if os.path.exists(MODEL_KERAS) or INFERENCE_BACKEND != 'keras':
         try:
-            model_keras = tf.keras.models.load_model(MODEL_KERAS, safe_mode=False)
-            class_file = os.path.join(os.path.dirname(MODEL_KERAS), 'class_names.txt')
-            if os.path.exists(class_file):
-                with open(class_file, 'r', encoding='utf-8') as f:
-                    model_names = [line.strip() for line in f.readlines() if line.strip()]
-            model_status = "Keras Ready"
-            models_loaded = True
-            return
-        except:
-            pass
+            t0 = time.perf_counter()
+            with load_phase('import', INFERENCE_BACKEND):
+                import_runtime(INFERENCE_BACKEND)
+            with load_phase('load', INFERENCE_BACKEND):
+                backend = load_backend(INFERENCE_BACKEND, path=MODEL_KERAS if INFERENCE_BACKEND == 'keras' else None)
+            with load_phase('warmup', INFERENCE_BACKEND):
+                backend.predict(np.zeros((1, INPUT_SIZE[1], INPUT_SIZE[0], 3), np.float32))
+            metrics.MODEL_LOAD_SECONDS.set(time.perf_counter() - t0, INFERENCE_BACKEND)
+            names = model_names
+            if os.path.exists(CLASS_FILE):
+                with open(CLASS_FILE, 'r', encoding='utf-8') as f:
+                    names = [line.strip() for line in f.readlines() if line.strip()]
+            return ModelBundle('Keras', backend.name, backend, names,
+                               version_id('Keras', backend.name, _state_of(state, backend.path, CLASS_FILE)))
+        except Exception as e:
+            print(f"{INFERENCE_BACKEND} model load failed: {e}")
     
-    model_status = "No models available"
-    models_loaded = False
-
-loader_thread = threading.Thread(target=load_models, daemon=True)
-loader_thread.start()
-init_webcam()
-
-def gen_frames():
-    while True:
-        if not webcam_available or cap is None or not cap.isOpened():
-            time.sleep(0.5)
-            continue
+    if not models_loaded:
+        model_status = "No models available"
+    raise RuntimeError("No models available")
+
+def load_pool_bundle():
+    """Start the worker pool, or roll a reload through its workers if it is already running."""
+    global worker_pool, model_status
+    t0 = time.perf_counter()
+    if worker_pool is None:
+        config = {
+            'yolo_path': MODEL_YOLO if USE_YOLO else None,
+            'backend': INFERENCE_BACKEND,
+            'keras_path': MODEL_KERAS if INFERENCE_BACKEND == 'keras' else None,
+            'class_file': CLASS_FILE,
+            'default_names': model_names,
+            'conf': CONFIDENCE_THRESHOLD,
+            'input_size': INPUT_SIZE,
+        }
+        model_status = f"Starting {POOL_WORKERS} model workers..."
         try:
-            success, frame = cap.read()
-            if not success:
-                continue
-            annotated = frame.copy()
-            if model_yolo is not None:
-                try:
-                    results = model_yolo(frame, conf=CONFIDENCE_THRESHOLD, verbose=False)
-                    for result in results:
-                        boxes = result.boxes
-                        if boxes is not None:
-                            for box in boxes:
-                                x1, y1, x2, y2 = map(int, box.xyxy[0].cpu().numpy())
-                                conf = float(box.conf[0].cpu().numpy())
-                                cls_id = int(box.cls[0].cpu().numpy())
-                                label = model_yolo.names[cls_id]
-                                color = (0, 255, 0) if 'hygi' in label.lower() else (0, 0, 255)
-                                cv2.rectangle(annotated, (x1, y1), (x2, y2), color, 2)
-                                cv2.putText(annotated, f"{label} {conf*100:.1f}%", (x1, y1-6), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-                except:
-                    pass
-            elif model_keras is not None:
-                try:
-                    h, w = frame.shape[:2]
-                    resized = cv2.resize(frame, INPUT_SIZE)
-                    inp = preprocess_roi(resized, target_size=INPUT_SIZE)
-                    preds = model_keras.predict(inp, verbose=0)
-                    if preds.shape[-1] > 1:
-                        idx = int(np.argmax(preds.ravel()))
-                        conf = float(preds.ravel()[idx])
-                        label = model_names[idx] if idx < len(model_names) else str(idx)
-                    else:
-                        prob = float(preds.ravel()[0])
-                        label = model_names[1] if prob >= 0.5 else model_names[0]
-                        conf = prob if label == model_names[1] else (1.0 - prob)
-                    color = (0, 255, 0) if 'hygi' in label.lower() else (0, 0, 255)
-                    cv2.putText(annotated, f"{label} {conf*100:.1f}%", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
-                except:
-                    pass
-            ret, buffer = cv2.imencode('.jpg', annotated)
-            frame_bytes = buffer.tobytes()
-            yield (b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
-        except:
-            time.sleep(0.1)
+            # workers import, load and warm up their model before reporting ready
+            with load_phase('workers', 'pool'):
+                worker_pool = ModelWorkerPool(config, num_workers=POOL_WORKERS, threads_per_worker=POOL_THREADS_PER_WORKER,
+                                              slot_bytes=POOL_SLOT_MB * 1024 * 1024, max_batch=BATCH_MAX_SIZE)
+                if not worker_pool.wait_ready():
+                    raise RuntimeError(worker_pool.failure)
+        except Exception as e:
+            model_status = f"No models available ({e})"
+            # tear the half-started pool down so the registry's retry starts a fresh one
+            if worker_pool is not None:
+                worker_pool.close()
+                worker_pool = None
+            raise
+        info = worker_pool.info
+    else:
+        with load_phase('reload', 'pool'):
+            info = worker_pool.reload()
+    metrics.MODEL_LOAD_SECONDS.set(time.perf_counter() - t0, 'pool')
+    return ModelBundle(info['model_type'], info['backend'], None, info['classes'], info['version'])
+
+def on_model_swap(bundle, old):
+    global model_type, model_backend, model_names, model_version, model_status, models_loaded
+    model_names = bundle.names
+    model_type, model_backend, model_version = bundle.kind, bundle.backend, bundle.version
+    workers = f", {POOL_WORKERS} workers" if SERVING_MODE == 'pool' else ''
+    model_status = f"{bundle.kind} Ready ({bundle.backend}{workers})"
+    models_loaded = True
+    if old is not None:
+        prediction_cache.clear()  # entries are keyed by version; drop the stale ones now
+
+registry = ModelRegistry(load_model_bundle, model_files, poll_interval=MODEL_POLL_SECONDS, on_swap=on_model_swap)
+registry.start()
+
+def decode_min_size():
+    """Smallest decoded upload size that still oversamples the active model's input."""
+    w, h = (YOLO_IMGSZ, YOLO_IMGSZ) if model_type == 'YOLO' else INPUT_SIZE
+    return (int(w * DECODE_OVERSAMPLE), int(h * DECODE_OVERSAMPLE))
+
+input_buffer = InputBuffer(INPUT_SIZE, capacity=BATCH_MAX_SIZE)
+# one forward pass at a time across batchers (TFLite interpreters are not thread-safe)
+_forward_lock = threading.Lock()
+
+def run_inference_batch(images):
+    """
+    Runs one forward pass over a list of BGR images.
+    Returns one (predictions, model_version) pair per image, where predictions
+    is a list of {'label', 'confidence', 'box'}. The whole batch runs on the
+    model that was current when it started, even if a reload swaps it meanwhile.
+    """
+    bundle = registry.current
+    if bundle is None or bundle.model is None:
+        raise RuntimeError("No model loaded")
+    if bundle.kind == 'YOLO':
+        with _forward_lock, metrics.stage('batch', 'inference'):
+            results = list(bundle.model(list(images), conf=CONFIDENCE_THRESHOLD, verbose=False))
+        with metrics.stage('batch', 'box_extraction'):
+            outputs = yolo_boxes(results, bundle.model.names)
+    else:
+        with metrics.stage('batch', 'preprocess'):
+            inp = input_buffer.fill(images)
+        with _forward_lock, metrics.stage('batch', 'inference'):
+            preds = bundle.model.predict(inp)
+        with metrics.stage('batch', 'box_extraction'):
+            outputs = keras_boxes(preds, images, bundle.names)
+    return [(p, bundle.version) for p in outputs]
+
+batcher = MicroBatcher(run_inference_batch, max_batch_size=BATCH_MAX_SIZE, max_wait_ms=BATCH_MAX_WAIT_MS, name="inference-batcher")
+
+tile_buffer = InputBuffer(INPUT_SIZE, capacity=TILE_BATCH_SIZE)
+
+def run_tile_batch(tiles):
+    """Raw classifier probabilities for a list of BGR tiles; one (probs, bundle) per tile."""
+    bundle = registry.current
+    if bundle is None or bundle.kind != 'Keras' or bundle.model is None:
+        raise RuntimeError("Tiled inference needs the in-process classifier")
+    with metrics.stage('tiles', 'preprocess'):
+        inp = tile_buffer.fill(tiles)
+    with _forward_lock, metrics.stage('tiles', 'inference'):
+        probs = np.asarray(bundle.model.predict(inp))
+    return [(row, bundle) for row in probs]
+
+tile_batcher = MicroBatcher(run_tile_batch, max_batch_size=TILE_BATCH_SIZE, max_wait_ms=0, name="tile-batcher")
+
+def is_clean_label(label):
+    return 'hygi' in label.lower()
+
+def tiled_min_size(tile, overlap, max_tiles):
+    """Decode size at which max_tiles windows of tile pixels just cover the image."""
+    per_side = max(1, int(max_tiles ** 0.5))
+    side = tile + (per_side - 1) * max(1, int(tile * (1.0 - overlap)))
+    return (side, side)
+
+def predict_tiled(img, tile=TILE_SIZE, overlap=TILE_OVERLAP, max_tiles=TILE_MAX):
+    """
+    Classify overlapping windows of a large image in batched passes so small
+    pests are not lost to downscaling. Returns (predictions, tiles, heatmap,
+    model_version): merged pest boxes (or one whole-image clean prediction),
+    per-tile scores, and a rows x cols grid of pest probability.
+    """
+    h, w = img.shape[:2]
+    windows, rows, cols = tile_grid(w, h, tile, overlap, max_tiles)
+    results = tile_batcher.submit_many([img[y:y + th, x:x + tw] for x, y, tw, th in windows])
+    bundle = results[0][1]
+    probs = np.stack([row for row, _ in results])
+    scores = pest_scores(probs, bundle.names, is_clean_label)
+    tiles = []
+    for (x, y, tw, th), row, score in zip(windows, probs, scores):
+        label, conf = decode_keras_output(row, bundle.names)
+        tiles.append({'label': label, 'confidence': conf, 'pest_score': round(float(score), 4),
+                      'is_pest': not is_clean_label(label), 'box': [x, y, tw, th]})
+    predictions = merge_tile_boxes(tiles, CONFIDENCE_THRESHOLD)
+    if not predictions:
+        clean = next((n for n in bundle.names if is_clean_label(n)), 'hygienic')
+        predictions = [{'label': clean, 'confidence': round(1.0 - float(scores.max()), 4), 'box': [0, 0, w, h]}]
+    heatmap = {'rows': rows, 'cols': cols, 'values': np.round(scores.reshape(rows, cols), 3).tolist()}
+    return predictions, tiles, heatmap, bundle.version
+
+def predict(img):
+    """
+    Predict a single BGR image through the worker pool or the shared batching
+    queue; returns (predictions, model_version).
+    """
+    if worker_pool is not None:
+        return worker_pool.predict(img)
+    return batcher.submit(img)
+
+def model_identity():
+    """Everything besides the image bytes that changes a prediction."""
+    return (model_version or '', CONFIDENCE_THRESHOLD)
+
+def annotate(frame, predictions, boxes=None):
+    """Draw predictions; boxes defaults to True only for YOLO, whose boxes are real detections."""
+    if boxes is None:
+        boxes = model_type == 'YOLO'
+    for p in predictions:
+        label, conf = p['label'], p['confidence']
+        color = (0, 255, 0) if 'hygi' in label.lower() else (0, 0, 255)
+        if boxes:
+            x, y, w, h = p['box']
+            cv2.rectangle(frame, (x, y), (x + w, y + h), color, 2)
+            cv2.putText(frame, f"{label} {conf*100:.1f}%", (x, y-6), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+        else:
+            cv2.putText(frame, f"{label} {conf*100:.1f}%", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
+
+def predict_versioned_many(images):
+    """Predict several images in as few forward passes as possible; one (predictions, model_version) each."""
+    if worker_pool is not None:
+        futures = [worker_pool.submit(img) for img in images]
+        return [f.result(timeout=30.0) for f in futures]
+    return batcher.submit_many(images)
+
+def predict_many(images):
+    """Predict several frames together, e.g. one per camera."""
+    return [preds for preds, _ in predict_versioned_many(images)]
+
+def detect_live(frames):
+    if not models_loaded:
+        return [[] for _ in frames]
+    with metrics.stage('video_feed', 'inference'):
+        return predict_many(frames)
+
+def render_frame(frame, predictions):
+    """Annotate a camera frame with its latest detections and JPEG-encode it."""
+    camera_detector.start()
+    annotated = frame.copy()
+    try:
+        with metrics.stage('video_feed', 'annotation'):
+            annotate(annotated, predictions)
+    except Exception:
+        pass
+    with metrics.stage('video_feed', 'mjpeg_encode'):
+        ret, buffer = cv2.imencode('.jpg', annotated)
+    if not ret:
+        metrics.STAGE_ERRORS.inc('video_feed', 'mjpeg_encode')
+        return None
+    return buffer.tobytes()
+
+camera_detector = MultiCameraDetector(cameras, detect_live, max_batch=BATCH_MAX_SIZE)
+
+def _per_camera(key):
+    return lambda: {(cam.cam_id,): cam.stats()[key] for cam in cameras if cam.available}
+
+metrics.gauge('hygiene_video_feed_fps', 'Frames per second published to /video_feed viewers.',
+              _per_camera('fps'), ('camera',))
+metrics.gauge('hygiene_video_feed_subscribers', 'Connected /video_feed viewers.',
+              _per_camera('subscribers'), ('camera',))
+metrics.gauge('hygiene_video_inference_fps', 'Live feed inferences per second.',
+              _per_camera('inference_fps'), ('camera',))
+metrics.gauge('hygiene_video_skip_frames', 'Captured frames skipped between live feed inferences.',
+              _per_camera('skip_frames'), ('camera',))
+metrics.gauge('hygiene_batch_queue_depth', 'Requests waiting for a batched forward pass.',
+              lambda: batcher.queue_depth())
+metrics.gauge('hygiene_models_loaded', '1 when a model is loaded and serving.',
+              lambda: 1.0 if models_loaded else 0.0)
+
+def gen_frames(cam):
+    for frame_bytes in cam.subscribe():
+        yield (b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + frame_bytes + b'\r\n')
 
 @app.route('/')
 def index():
@@ -163,17 +480,53 @@ def api_status():
         'status': 'online',
         'models_loaded': models_loaded,
         'model_status': model_status,
-        'model_type': 'YOLO' if model_yolo else ('Keras' if model_keras else 'None'),
+        'model_type': model_type,
+        'backend': model_backend,
+        'model_version': model_version,
+        'model_registry': registry.stats(),
+        'serving_mode': SERVING_MODE,
         'classes': model_names,
-        'webcam_available': webcam_available,
-        'confidence_threshold': CONFIDENCE_THRESHOLD
+        'webcam_available': webcam_available if cameras_initialized else None,
+        'confidence_threshold': CONFIDENCE_THRESHOLD,
+        'batching': batcher.stats(),
+        'worker_pool': worker_pool.stats() if worker_pool else None,
+        'prediction_cache': prediction_cache.stats(),
+        'snapshots': snapshot_writer.stats(),
+        'cameras': {cam.cam_id: cam.stats() for cam in cameras},
+        'camera_detector': camera_detector.stats()
     })
 
+@app.route('/api/ready')
+def api_ready():
+    """Readiness probe: 200 once the chosen model is loaded and warm, 503 before; lists load phases."""
+    body = {
+        'ready': models_loaded,
+        'model_status': model_status,
+        'model_type': model_type,
+        'backend': model_backend,
+        'model_version': model_version,
+        'uptime_seconds': round(time.time() - STARTED_AT, 3),
+        'phases': load_phases,
+    }
+    return jsonify(body), (200 if models_loaded else 503)
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route('/video_feed')
-def video_feed():
-    if not webcam_available:
+@app.route('/video_feed/<cam_id>')
+def video_feed(cam_id=None):
+    init_cameras()
+    if cam_id is None:
+        cam = next((c for c in cameras if c.available), None)
+    else:
+        cam = get_camera(cam_id)
+        if cam is None:
+            return jsonify({'error': 'Unknown camera'}), 404
+    if cam is None or not cam.available:
         return jsonify({'error': 'Webcam not available'}), 503
-    return Response(gen_frames(), mimetype='multipart/x-mixed-replace; boundary=frame')
+    return Response(gen_frames(cam), mimetype='multipart/x-mixed-replace; boundary=frame')
 
 @app.route('/api/predict_image', methods=['POST'])
 def api_predict_image():
@@ -182,59 +535,259 @@ def api_predict_image():
     file = request.files.get('image')
     if not file:
         return jsonify({'error': 'No image'}), 400
+    tiled = request.values.get('mode', 'whole') == 'tiled'
+    tiling = ()
+    if tiled:
+        if model_type != 'Keras' or worker_pool is not None:
+            return jsonify({'error': 'Tiled mode needs the in-process Keras classifier'}), 400
+        try:
+            tile = min(max(int(request.values.get('tile_size', TILE_SIZE)), 32), 4096)
+            overlap = min(max(float(request.values.get('overlap', TILE_OVERLAP)), 0.0), 0.9)
+            max_tiles = min(max(int(request.values.get('max_tiles', TILE_MAX)), 1), TILE_MAX)
+        except ValueError:
+            return jsonify({'error': 'Invalid tiling parameters'}), 400
+        tiling = ('tiled', tile, overlap, max_tiles)
     try:
-        data = file.read()
-        npimg = np.frombuffer(data, np.uint8)
-        img = cv2.imdecode(npimg, cv2.IMREAD_COLOR)
+        with metrics.stage('predict_image', 'upload_read'):
+            data = file.read()
+        cache_key = content_key(data, *model_identity(), *tiling)
+        cached = prediction_cache.get(cache_key)
+        if cached is not None and snapshot_writer.exists(cached['annotated_filename'], wait=2.0):
+            return jsonify(dict(cached, cached=True))
+        with metrics.stage('predict_image', 'decode'):
+            img, orig_size = decode_image(data, tiled_min_size(tile, overlap, max_tiles) if tiled else decode_min_size())
         if img is None:
+            metrics.STAGE_ERRORS.inc('predict_image', 'decode')
             return jsonify({'error': 'Invalid image'}), 400
+        orig_w, orig_h = orig_size
         annotated = img.copy()
         predictions = []
-        if model_yolo is not None:
-            try:
-                results = model_yolo(img, conf=CONFIDENCE_THRESHOLD, verbose=False)
-                for result in results:
-                    boxes = result.boxes
-                    if boxes is not None:
-                        for box in boxes:
-                            x1, y1, x2, y2 = map(int, box.xyxy[0].cpu().numpy())
-                            conf = float(box.conf[0].cpu().numpy())
-                            cls_id = int(box.cls[0].cpu().numpy())
-                            label = model_yolo.names[cls_id]
-                            color = (0, 255, 0) if 'hygi' in label.lower() else (0, 0, 255)
-                            cv2.rectangle(annotated, (x1, y1), (x2, y2), color, 2)
-                            cv2.putText(annotated, f"{label} {conf*100:.1f}%", (x1, y1-6), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
-                            predictions.append({'label': label, 'confidence': float(conf), 'box': [int(x1), int(y1), int(x2-x1), int(y2-y1)]})
-            except:
-                pass
-        elif model_keras is not None:
-            try:
-                h, w = img.shape[:2]
-                resized = cv2.resize(img, INPUT_SIZE)
-                inp = preprocess_roi(resized, target_size=INPUT_SIZE)
-                preds = model_keras.predict(inp, verbose=0)
-                if preds.shape[-1] > 1:
-                    idx = int(np.argmax(preds.ravel()))
-                    conf = float(preds.ravel()[idx])
-                    label = model_names[idx] if idx < len(model_names) else str(idx)
-                else:
-                    prob = float(preds.ravel()[0])
-                    label = model_names[1] if prob >= 0.5 else model_names[0]
-                    conf = prob if label == model_names[1] else (1.0 - prob)
-                color = (0, 255, 0) if 'hygi' in label.lower() else (0, 0, 255)
-                cv2.putText(annotated, f"{label} {conf*100:.1f}%", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
-                predictions.append({'label': label, 'confidence': float(conf), 'box': [0, 0, int(w), int(h)]})
-            except:
-                pass
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        output_path = os.path.join(SNAPSHOT_DIR, f"pred_{timestamp}.jpg")
-        cv2.imwrite(output_path, annotated)
-        return jsonify({'predictions': predictions, 'annotated_filename': os.path.basename(output_path), 'image_size': [int(img.shape[1]), int(img.shape[0])]})
+        extra = {}
+        version = model_version
+        inferred = False
+        try:
+            sx, sy = orig_w / img.shape[1], orig_h / img.shape[0]
+            if tiled:
+                with metrics.stage('predict_image', 'tiled_inference'):
+                    predictions, tiles, heatmap, version = predict_tiled(img, tile, overlap, max_tiles)
+                with metrics.stage('predict_image', 'annotation'):
+                    annotate(annotated, predictions, boxes=True)
+                extra = {'mode': 'tiled', 'tiles': scale_predictions(tiles, sx, sy), 'heatmap': heatmap,
+                         'tiling': {'count': len(tiles), 'rows': heatmap['rows'], 'cols': heatmap['cols'],
+                                    'window': int(round(tiles[0]['box'][2] * sx)), 'overlap': overlap}}
+            else:
+                with metrics.stage('predict_image', 'inference'):
+                    predictions, version = predict(img)
+                with metrics.stage('predict_image', 'annotation'):
+                    annotate(annotated, predictions)
+            # report boxes in the coordinates of the uploaded image
+            predictions = scale_predictions(predictions, sx, sy)
+            inferred = True
+        except Exception:
+            pass
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')[:-3]
+        with metrics.stage('predict_image', 'snapshot_enqueue'):
+            output_path = snapshot_writer.save(annotated, f"pred_{timestamp}.jpg")
+        annotated_filename = os.path.basename(output_path) if output_path else None
+        # the snapshot is drawn on the decoded image, which large JPEGs give at 1/2-1/8 size
+        result = {'predictions': predictions, 'annotated_filename': annotated_filename,
+                  'image_size': [int(orig_w), int(orig_h)], 'decode_scale': round(img.shape[1] / orig_w, 4),
+                  'model_version': version}
+        result.update(extra)
+        if inferred and annotated_filename:
+            prediction_cache.put(cache_key, result)
+        return jsonify(result)
     except Exception as e:
+        metrics.STAGE_ERRORS.inc('predict_image', 'request')
         return jsonify({'error': str(e)[:100]}), 500
 
+def _decode_ahead(entries, executor, window):
+    """
+    Decode entries on the executor, keeping up to window in flight; yields
+    (name, img, orig_size, error) in order, with img None and error set for
+    entries that could not be read or decoded.
+    """
+    def decode(data):
+        if data is None:
+            return None, None, 'Image too large'
+        if isinstance(data, Exception):
+            return None, None, f"Unreadable upload: {type(data).__name__}: {data}"[:100]
+        with metrics.stage('predict_batch', 'decode'):
+            img, orig_size = decode_image(data, decode_min_size())
+        return img, orig_size, None if img is not None else 'Invalid image'
+    pending = deque()
+    for name, data in entries:
+        pending.append((name, executor.submit(decode, data)))
+        if len(pending) >= window:
+            name, fut = pending.popleft()
+            yield (name,) + fut.result()
+    while pending:
+        name, fut = pending.popleft()
+        yield (name,) + fut.result()
+
+def _detach_upload(f):
+    """
+    Flask closes request files as soon as the view returns, before a streamed
+    response has read them; keep our own handle on the spooled temp file.
+    """
+    try:
+        handle = os.fdopen(os.dup(f.stream.fileno()), 'rb')
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return io.BytesIO(f.stream.read())  # small uploads are kept in memory anyway
+    handle.seek(0)
+    return handle
+
+def _uploaded_images(uploads):
+    """(name, data) per image; a corrupt upload ends with (upload name, the exception) and the next one starts."""
+    for name, stream in uploads:
+        try:
+            yield from iter_images(name, stream, max_member_bytes=UPLOAD_MAX_BYTES)
+        except ARCHIVE_ERRORS as e:
+            yield name, e
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+@app.route('/api/predict_batch', methods=['POST'])
+def api_predict_batch():
+    """
+    Score many images in one request: any number of 'images' files, each an
+    image or a zip/tar archive of images. Results stream back as NDJSON, one
+    line per image, followed by a summary line. ?annotate=1 also draws the
+    boxes and saves a snapshot per image.
+    """
+    if not models_loaded:
+        return jsonify({'error': 'Models loading'}), 503
+    files = request.files.getlist('images') or request.files.getlist('image')
+    if not files:
+        return jsonify({'error': 'No images'}), 400
+    do_annotate = request.values.get('annotate', '0').lower() in ('1', 'true', 'yes')
+    uploads = [(f.filename or 'upload', _detach_upload(f)) for f in files]
+
+    def generate():
+        t0 = time.perf_counter()
+        count = errors = 0
+        try:
+            with ThreadPoolExecutor(max_workers=max(1, BATCH_DECODE_WORKERS), thread_name_prefix="batch-decode") as executor:
+                decoded = _decode_ahead(_uploaded_images(uploads), executor, window=2 * BATCH_MAX_SIZE + BATCH_DECODE_WORKERS)
+                for chunk in _chunks(decoded, BATCH_MAX_SIZE):
+                    valid = [item for item in chunk if item[1] is not None]
+                    outputs = {}
+                    if valid:
+                        try:
+                            with metrics.stage('predict_batch', 'inference'):
+                                results = predict_versioned_many([img for _, img, _, _ in valid])
+                            outputs = {id(item): res for item, res in zip(valid, results)}
+                        except Exception as e:
+                            outputs = {id(item): e for item in valid}
+                    for item in chunk:
+                        name, img, orig_size, error = item
+                        count += 1
+                        res = outputs.get(id(item))
+                        if img is None or isinstance(res, Exception):
+                            errors += 1
+                            line = {'name': name, 'error': error if img is None else str(res)[:100]}
+                            yield json.dumps(line) + '\n'
+                            continue
+                        predictions, version = res
+                        line = {'name': name, 'image_size': [int(orig_size[0]), int(orig_size[1])], 'model_version': version}
+                        if do_annotate:
+                            annotated = img.copy()
+                            with metrics.stage('predict_batch', 'annotation'):
+                                annotate(annotated, predictions)
+                            timestamp = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+                            with metrics.stage('predict_batch', 'snapshot_enqueue'):
+                                output_path = snapshot_writer.save(annotated, f"batch_{timestamp}_{count}.jpg")
+                            line['annotated_filename'] = os.path.basename(output_path) if output_path else None
+                            line['decode_scale'] = round(img.shape[1] / orig_size[0], 4)
+                        line['predictions'] = scale_predictions(predictions, orig_size[0] / img.shape[1],
+                                                                orig_size[1] / img.shape[0])
+                        yield json.dumps(line) + '\n'
+        except Exception as e:
+            # anything unexpected still ends the stream with an error line and the summary
+            metrics.STAGE_ERRORS.inc('predict_batch', 'request')
+            yield json.dumps({'error': str(e)[:100]}) + '\n'
+        summary = {'images': count, 'errors': errors, 'seconds': round(time.perf_counter() - t0, 3),
+                   'model_version': model_version}
+        yield json.dumps({'summary': summary}) + '\n'
+
+    def stream():
+        try:
+            yield from generate()
+        finally:
+            for _, handle in uploads:
+                handle.close()
+
+    return Response(stream(), mimetype='application/x-ndjson')
+
+@app.route('/api/analyze_video', methods=['POST'])
+def api_analyze_video():
+    """
+    Scan an uploaded video file ('video') for detections. Streams NDJSON:
+    {'progress': ...} lines while it runs, then one {'result': ...} line with
+    the timeline of detection intervals. Optional form/query fields: stride,
+    sample_fps, scene_threshold, min_confidence.
+    """
+    if not models_loaded:
+        return jsonify({'error': 'Models loading'}), 503
+    file = request.files.get('video')
+    if not file:
+        return jsonify({'error': 'No video'}), 400
+    try:
+        stride = request.values.get('stride', type=int)
+        sample_fps = float(request.values.get('sample_fps', video_analysis.SAMPLE_FPS))
+        scene_threshold = float(request.values.get('scene_threshold', 0.0))
+        min_confidence = float(request.values.get('min_confidence', CONFIDENCE_THRESHOLD))
+    except ValueError:
+        return jsonify({'error': 'Invalid parameters'}), 400
+    # OpenCV reads from a path, so the upload is spooled to a named temp file
+    suffix = os.path.splitext(file.filename or '')[1] or '.mp4'
+    tmp = tempfile.NamedTemporaryFile(prefix='analyze_', suffix=suffix, delete=False)
+    with tmp:
+        shutil.copyfileobj(file.stream, tmp, 1024 * 1024)
+    try:
+        sampler = video_analysis.FrameSampler(tmp.name, stride=stride, sample_fps=sample_fps,
+                                              scene_threshold=scene_threshold)
+    except ValueError:
+        os.unlink(tmp.name)
+        return jsonify({'error': 'Invalid video'}), 400
+    analysis = video_analysis.run(sampler, predict_many, batch_size=BATCH_MAX_SIZE, min_confidence=min_confidence,
+                                  ignore=lambda label: 'hygi' in label.lower())
+
+    def generate():
+        try:
+            for kind, payload in analysis:
+                if kind == 'result':
+                    payload['summary']['video'] = file.filename
+                    payload['summary']['model_version'] = model_version
+                yield json.dumps({kind: payload}) + '\n'
+        except Exception as e:
+            metrics.STAGE_ERRORS.inc('analyze_video', 'request')
+            yield json.dumps({'error': str(e)[:100]}) + '\n'
+
+    def cleanup():
+        # runs when the response is closed, even if the stream was never iterated
+        sampler.close()
+        try:
+            os.unlink(tmp.name)
+        except FileNotFoundError:
+            pass
+
+    response = Response(generate(), mimetype='application/x-ndjson')
+    response.call_on_close(cleanup)
+    return response
+
 @app.route('/snapshots/<path:filename>')
 def get_snapshot(filename):
+    if not snapshot_writer.exists(filename, wait=2.0):
+        return jsonify({'error': 'Not found'}), 404
     try:
         return send_from_directory(SNAPSHOT_DIR, filename)
     except:
@@ -0,0 +1,71 @@
+# archives.py
+"""
+Expands uploads into individual images. Each upload is either an image
+itself or a zip/tar archive (optionally gzip/bz2/xz compressed) whose image
+members are read one at a time, so a large archive never has to fit in
+memory.
+"""
+import os
+import tarfile
+import zipfile
+import zlib
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp', '.tif', '.tiff')
+# what a corrupt or truncated upload raises while it is being read
+ARCHIVE_ERRORS = (zipfile.BadZipFile, tarfile.TarError, EOFError, OSError, zlib.error)
+
+
+def _kind(stream):
+    """'zip', 'tar' or 'file', from the first bytes of a seekable stream."""
+    pos = stream.tell()
+    head = stream.read(512)
+    stream.seek(pos)
+    if head[:4] == b'PK\x03\x04':
+        return 'zip'
+    if head[:2] == b'\x1f\x8b' or head[:3] == b'BZh' or head[:6] == b'\xfd7zXZ\x00':
+        return 'tar'
+    if len(head) > 262 and head[257:262] == b'ustar':
+        return 'tar'
+    return 'file'
+
+
+def _is_image(name):
+    base = os.path.basename(name)
+    return not base.startswith('.') and base.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def iter_images(name, stream, max_member_bytes=None):
+    """
+    Yield (name, data) for every image in one upload. Archive members are
+    named '<archive>/<member>'; members that are not images are skipped, and
+    members (or a plain upload) larger than max_member_bytes are yielded with
+    data=None. A corrupt archive raises one of ARCHIVE_ERRORS part-way.
+    """
+    kind = _kind(stream)
+    if kind == 'zip':
+        with zipfile.ZipFile(stream) as zf:
+            for info in zf.infolist():
+                if info.is_dir() or not _is_image(info.filename):
+                    continue
+                member = f"{name}/{info.filename}"
+                if max_member_bytes and info.file_size > max_member_bytes:
+                    yield member, None
+                    continue
+                yield member, zf.read(info)
+    elif kind == 'tar':
+        # stream mode: members are read in archive order without seeking back
+        with tarfile.open(fileobj=stream, mode='r|*') as tf:
+            for info in tf:
+                if not info.isfile() or not _is_image(info.name):
+                    continue
+                member = f"{name}/{info.name}"
+                if max_member_bytes and info.size > max_member_bytes:
+                    yield member, None
+                    continue
+                f = tf.extractfile(info)
+                yield member, f.read() if f is not None else None
+    else:
+        data = stream.read(max_member_bytes + 1) if max_member_bytes else stream.read()
+        if max_member_bytes and len(data) > max_member_bytes:
+            data = None
+        yield name, data
@@ -0,0 +1,133 @@
+# backends.py
+"""
+Interchangeable CPU inference backends for the Keras classifier.
+Every backend takes a float32 batch of RGB images in [0, 255] with shape
+(N, 224, 224, 3), exactly what utils.preprocess_roi produces, and returns
+the same (N, num_classes) probabilities as the Keras model.
+"""
+import os
+import numpy as np
+
+BACKENDS = ('keras', 'tflite', 'onnxruntime')
+
+MODELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'models')
+DEFAULT_PATHS = {
+    'keras': os.path.join(MODELS_DIR, 'insect_rat_model.keras'),
+    'tflite': os.path.join(MODELS_DIR, 'insect_rat_model_int8.tflite'),
+    'tflite-fp16': os.path.join(MODELS_DIR, 'insect_rat_model_fp16.tflite'),
+    'onnxruntime': os.path.join(MODELS_DIR, 'insect_rat_model.onnx'),
+}
+
+
+class KerasBackend:
+    name = 'keras'
+
+    def __init__(self, path):
+        import tensorflow as tf
+        self.path = path
+        self.model = tf.keras.models.load_model(path, safe_mode=False)
+
+    def predict(self, batch):
+        return np.asarray(self.model.predict(batch, verbose=0))
+
+
+class TFLiteBackend:
+    """Runs float16 or int8 TFLite exports; int8 inputs/outputs are (de)quantized here."""
+    name = 'tflite'
+
+    def __init__(self, path, num_threads=None):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+        self.path = path
+        self.interpreter = Interpreter(model_path=path, num_threads=num_threads or os.cpu_count())
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch = int(self._input['shape'][0])
+
+    def _resize(self, n):
+        if n != self._batch:
+            shape = list(self._input['shape'])
+            shape[0] = n
+            self.interpreter.resize_tensor_input(self._input['index'], shape)
+            self.interpreter.allocate_tensors()
+            self._input = self.interpreter.get_input_details()[0]
+            self._output = self.interpreter.get_output_details()[0]
+            self._batch = n
+
+    def predict(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        self._resize(len(batch))
+        dtype = self._input['dtype']
+        if dtype != np.float32:
+            scale, zero_point = self._input['quantization']
+            info = np.iinfo(dtype)
+            batch = np.clip(np.round(batch / scale + zero_point), info.min, info.max).astype(dtype)
+        self.interpreter.set_tensor(self._input['index'], batch)
+        self.interpreter.invoke()
+        out = self.interpreter.get_tensor(self._output['index'])
+        if out.dtype != np.float32:
+            scale, zero_point = self._output['quantization']
+            out = (out.astype(np.float32) - zero_point) * scale
+        return out
+
+
+class OnnxBackend:
+    name = 'onnxruntime'
+
+    def __init__(self, path, num_threads=None):
+        import onnxruntime as ort
+        self.path = path
+        opts = ort.SessionOptions()
+        if num_threads:
+            opts.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(path, sess_options=opts, providers=['CPUExecutionProvider'])
+        self._input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch):
+        batch = np.asarray(batch, dtype=np.float32)
+        return self.session.run(None, {self._input_name: batch})[0]
+
+
+def load_backend(name='keras', path=None, num_threads=None):
+    """
+    Load the classifier with the given backend ('keras', 'tflite' or
+    'onnxruntime'). 'tflite' uses the int8 export when present and falls
+    back to float16; path overrides the default file location.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend '{name}', expected one of {BACKENDS}")
+    if path is None:
+        path = DEFAULT_PATHS[name]
+        if name == 'tflite' and not os.path.exists(path):
+            path = DEFAULT_PATHS['tflite-fp16']
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"No {name} model at {path}")
+    if name == 'keras':
+        return KerasBackend(path)
+    if name == 'tflite':
+        return TFLiteBackend(path, num_threads=num_threads)
+    return OnnxBackend(path, num_threads=num_threads)
+
+
+def import_runtime(name='keras'):
+    """
+    Import only the runtime module the given backend needs, so callers can
+    time (or fail) the import separately from loading the weights.
+    """
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown backend '{name}', expected one of {BACKENDS}")
+    if name == 'tflite':
+        try:
+            import tflite_runtime.interpreter as runtime
+            return runtime
+        except ImportError:
+            pass
+    if name == 'onnxruntime':
+        import onnxruntime as runtime
+        return runtime
+    import tensorflow as runtime
+    return runtime
@@ -0,0 +1,141 @@
+# batching.py
+import threading
+import time
+from collections import deque
+
+
+class _Request:
+    __slots__ = ("item", "event", "result", "error")
+
+    def __init__(self, item):
+        self.item = item
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """
+    Collects concurrent requests into batches and runs them through one call.
+    run_batch(items) receives a list of items and must return a list with one
+    result per item, in the same order. Batches are capped by max_batch_size
+    and by max_wait_ms counted from the first request of the batch.
+    """
+    def __init__(self, run_batch, max_batch_size=8, max_wait_ms=10, name="micro-batcher"):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_ms = max(0.0, float(max_wait_ms))
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._running = True
+
+        # stats
+        self._batches = 0
+        self._items = 0
+        self._errors = 0
+        self._last_batch_size = 0
+        self._size_counts = {}
+
+        self._thread = threading.Thread(target=self._loop, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, item, timeout=None):
+        """Queue one item and block until its result is ready."""
+        req = _Request(item)
+        with self._cond:
+            if not self._running:
+                raise RuntimeError("Batcher is stopped")
+            self._pending.append(req)
+            self._cond.notify()
+        if not req.event.wait(timeout):
+            raise TimeoutError("Timed out waiting for batched inference")
+        if req.error is not None:
+            raise req.error
+        return req.result
+
+    def submit_many(self, items, timeout=None):
+        """Queue several items at once so they share a batch; returns their results in order."""
+        reqs = [_Request(item) for item in items]
+        with self._cond:
+            if not self._running:
+                raise RuntimeError("Batcher is stopped")
+            self._pending.extend(reqs)
+            self._cond.notify()
+        results = []
+        for req in reqs:
+            if not req.event.wait(timeout):
+                raise TimeoutError("Timed out waiting for batched inference")
+            if req.error is not None:
+                raise req.error
+            results.append(req.result)
+        return results
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+    def _collect(self):
+        with self._cond:
+            while self._running and not self._pending:
+                self._cond.wait()
+            if not self._running:
+                return []
+            # wait a little for more requests to join the batch
+            deadline = time.monotonic() + self.max_wait_ms / 1000.0
+            while self._running and len(self._pending) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            n = min(len(self._pending), self.max_batch_size)
+            return [self._pending.popleft() for _ in range(n)]
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                if not self._running:
+                    break
+                continue
+            try:
+                results = self.run_batch([req.item for req in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(f"run_batch returned {len(results)} results for {len(batch)} items")
+                for req, res in zip(batch, results):
+                    req.result = res
+            except Exception as e:
+                self._errors += 1
+                for req in batch:
+                    req.error = e
+            finally:
+                self._batches += 1
+                self._items += len(batch)
+                self._last_batch_size = len(batch)
+                self._size_counts[len(batch)] = self._size_counts.get(len(batch), 0) + 1
+                for req in batch:
+                    req.event.set()
+
+        # fail anything still waiting after shutdown
+        with self._cond:
+            while self._pending:
+                req = self._pending.popleft()
+                req.error = RuntimeError("Batcher is stopped")
+                req.event.set()
+
+    def queue_depth(self):
+        with self._cond:
+            return len(self._pending)
+
+    def stats(self):
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait_ms,
+            'queue_depth': self.queue_depth(),
+            'batches': self._batches,
+            'items': self._items,
+            'errors': self._errors,
+            'last_batch_size': self._last_batch_size,
+            'avg_batch_size': round(self._items / self._batches, 2) if self._batches else 0.0,
+            'batch_size_counts': {str(k): v for k, v in sorted(self._size_counts.items())},
+        }
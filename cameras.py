@@ -0,0 +1,210 @@
+# cameras.py
+import threading
+import time
+
+import cv2
+
+from streaming import FrameBroadcaster, LatestFrameReader, InferenceGovernor
+
+
+def parse_sources(spec):
+    """
+    Parse a comma-separated camera list: device indices and/or video file
+    paths or stream URLs, e.g. "0,1,/data/kitchen.mp4".
+    """
+    sources = []
+    for part in str(spec).split(','):
+        part = part.strip()
+        if not part:
+            continue
+        sources.append(int(part) if part.isdigit() else part)
+    return sources
+
+
+class _FileSource:
+    """Wraps a video-file capture so it plays at its native rate and loops."""
+    def __init__(self, cap):
+        self.cap = cap
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        self.period = 1.0 / fps if fps and fps > 0 else 1.0 / 25
+        self._next = time.monotonic()
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def read(self):
+        now = time.monotonic()
+        if self._next > now:
+            time.sleep(self._next - now)
+        self._next = max(self._next, now) + self.period
+        ok, frame = self.cap.read()
+        if not ok:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.cap.read()
+        return ok, frame
+
+    def release(self):
+        self.cap.release()
+
+
+class Camera:
+    """
+    One video source with its own capture thread, inference governor, latest
+    detections and MJPEG broadcaster. render(frame, predictions) must return
+    the encoded bytes to publish (or None).
+    """
+    def __init__(self, cam_id, source, render, governor_kwargs=None, on_read=None, notify=None):
+        self.cam_id = str(cam_id)
+        self.source = source
+        self.render = render
+        self.on_read = on_read
+        self.notify = notify
+        self.governor = InferenceGovernor(**(governor_kwargs or {}))
+        self.broadcaster = FrameBroadcaster(self._produce, name=f"camera-{self.cam_id}-producer")
+        self.cap = None
+        self.reader = None
+        self.available = False
+        self._lock = threading.Lock()
+        self._predictions = []
+        self._display_seq = 0
+
+    def open(self):
+        try:
+            cap = cv2.VideoCapture(self.source)
+            if cap is not None and cap.isOpened():
+                ok, _ = cap.read()
+                if ok:
+                    if isinstance(self.source, str):
+                        cap = _FileSource(cap)
+                    self.cap = cap
+                    self.reader = LatestFrameReader(cap, name=f"camera-{self.cam_id}-reader",
+                                                    on_read=self.on_read, notify=self.notify)
+                    self.available = True
+                    return True
+                cap.release()
+        except Exception as e:
+            print(f"[Camera {self.cam_id}] could not open {self.source!r}: {e}")
+        self.available = False
+        return False
+
+    def active(self):
+        """True while anyone is watching this camera's stream."""
+        return self.broadcaster.stats()['subscribers'] > 0
+
+    def set_predictions(self, predictions):
+        with self._lock:
+            self._predictions = predictions
+
+    def latest_predictions(self):
+        with self._lock:
+            return self._predictions
+
+    def _produce(self):
+        if not self.available:
+            return None
+        self.reader.start()
+        self.governor.wait_display_slot()
+        seq, frame = self.reader.wait(self._display_seq, timeout=1.0)
+        if frame is None or seq == self._display_seq:
+            return None
+        self._display_seq = seq
+        return self.render(frame, self.latest_predictions())
+
+    def subscribe(self):
+        return self.broadcaster.subscribe()
+
+    def release(self):
+        self.broadcaster.stop()
+        if self.reader is not None:
+            self.reader.stop()
+        if self.cap is not None:
+            self.cap.release()
+
+    def stats(self):
+        out = {'source': str(self.source), 'available': self.available}
+        out.update(self.broadcaster.stats())
+        out.update(self.governor.stats())
+        if self.reader is not None:
+            out.update(self.reader.stats())
+        return out
+
+
+class MultiCameraDetector:
+    """
+    One inference thread for all cameras. Each pass walks the cameras
+    round-robin (starting one further along every time so none is starved),
+    takes the freshest frame of every watched camera whose governor says it is
+    due, and runs them through predict_many(frames) as a single batch.
+    """
+    def __init__(self, cameras, predict_many, max_batch=8, notify=None, name="camera-detector"):
+        self.cameras = cameras
+        self.predict_many = predict_many
+        self.max_batch = max(1, int(max_batch))
+        self.notify = notify or threading.Event()
+        self.name = name
+        self._running = False
+        self._thread = None
+        self._rr = 0
+        self.batches = 0
+        self.frames = 0
+        self.errors = 0
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self.notify.set()
+
+    def _due_frames(self, inferred):
+        batch = []
+        n = len(self.cameras)
+        for k in range(n):
+            cam = self.cameras[(self._rr + k) % n]
+            if not cam.available or not cam.active():
+                continue
+            seq, frame = cam.reader.latest()
+            last = inferred.get(cam.cam_id, 0)
+            if frame is None or seq == last or not cam.governor.should_infer(seq - last):
+                continue
+            batch.append((cam, seq, frame))
+            if len(batch) >= self.max_batch:
+                break
+        self._rr = (self._rr + 1) % max(1, n)
+        return batch
+
+    def _loop(self):
+        inferred = {}
+        while self._running:
+            self.notify.wait(timeout=0.5)
+            self.notify.clear()
+            batch = self._due_frames(inferred)
+            if not batch:
+                continue
+            t0 = time.perf_counter()
+            try:
+                outputs = self.predict_many([frame for _, _, frame in batch])
+            except Exception:
+                self.errors += 1
+                outputs = None
+            elapsed = time.perf_counter() - t0
+            self.batches += 1
+            self.frames += len(batch)
+            for i, (cam, seq, _) in enumerate(batch):
+                inferred[cam.cam_id] = seq
+                # each camera is charged its share of the batch
+                cam.governor.record_inference(elapsed / len(batch), cam.reader.fps)
+                if outputs is not None:
+                    cam.set_predictions(outputs[i])
+
+    def stats(self):
+        return {
+            'batches': self.batches,
+            'frames': self.frames,
+            'avg_batch_size': round(self.frames / self.batches, 2) if self.batches else 0.0,
+            'errors': self.errors,
+        }
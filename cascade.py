@@ -0,0 +1,223 @@
+# cascade.py
+"""
+Gates in front of the Google Vision API. ChangeGate skips frames that look
+like the last one evaluated. In the local-model cascade the classifier or
+YOLO model then screens each candidate frame; only frames it is unsure about
+or flags as a possible pest are sent to Vision, and the two sets of
+detections are merged into one result.
+"""
+import os
+import threading
+
+import cv2
+import numpy as np
+
+from tracking import iou
+
+CLEAN_BELOW = 0.20   # local pest score below which a frame is trusted clean (no remote call)
+TRUST_ABOVE = 1.01   # local pest score at/above which the local detection is trusted (> 1 = always confirm)
+CHANGE_THUMB_SIZE = (64, 48)  # grey thumbnail compared by ChangeGate
+CHANGE_PIXEL_DELTA = 20       # grey levels a thumbnail pixel must move to count as changed
+CHANGE_FRACTION = 0.01        # share of changed thumbnail pixels that makes a frame "changed"
+MAX_STALE_SECONDS = 10.0      # a frame is evaluated at least this often, changed or not
+
+
+def is_clean_label(label):
+    return 'hygi' in str(label).lower()
+
+
+class ChangeGate:
+    """
+    Passes a frame when enough of its grey thumbnail differs from the last
+    passed frame's (at least `fraction` of the pixels by `pixel_delta` grey
+    levels, so a small moving object counts but sensor noise does not), or
+    when max_stale seconds have gone by. fraction=0 passes every frame.
+    With check(..., commit=False) the frame only becomes the reference once
+    commit() is called, e.g. after it was actually sent.
+    """
+    def __init__(self, fraction=CHANGE_FRACTION, pixel_delta=CHANGE_PIXEL_DELTA, max_stale=MAX_STALE_SECONDS,
+                 size=CHANGE_THUMB_SIZE):
+        self.fraction = float(fraction)
+        self.pixel_delta = int(pixel_delta)
+        self.max_stale = float(max_stale)
+        self.size = tuple(size)
+        self._last = None
+        self._last_time = None
+        self._candidate = None
+        self._diff = np.empty((self.size[1], self.size[0]), np.uint8)
+        self.passed_changed = 0
+        self.passed_stale = 0
+        self.skipped = 0
+
+    def check(self, frame, now, commit=True):
+        """True if frame should be evaluated; it then becomes the reference (now, or on commit())."""
+        self._candidate = None
+        if self.fraction <= 0:
+            self._candidate = (None, now, True)
+        else:
+            grey = cv2.cvtColor(cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+            if self._last is None:
+                changed = True
+            else:
+                cv2.absdiff(grey, self._last, dst=self._diff)
+                changed = np.count_nonzero(self._diff >= self.pixel_delta) >= self.fraction * self._diff.size
+            stale = self._last_time is None or now - self._last_time >= self.max_stale
+            if not changed and not stale:
+                self.skipped += 1
+                return False
+            self._candidate = (grey, now, changed)
+        if commit:
+            self.commit()
+        return True
+
+    def commit(self):
+        """Make the frame passed by the last check() the reference; a no-op if there is none."""
+        if self._candidate is None:
+            return
+        grey, now, changed = self._candidate
+        self._candidate = None
+        if changed:
+            self.passed_changed += 1
+        else:
+            self.passed_stale += 1
+        if grey is not None:
+            self._last = grey
+            self._last_time = now
+
+    def stats(self):
+        checked = self.passed_changed + self.passed_stale + self.skipped
+        return {
+            'checked': checked,
+            'passed_changed': self.passed_changed,
+            'passed_stale': self.passed_stale,
+            'skipped_unchanged': self.skipped,
+            'skipped_ratio': round(self.skipped / checked, 3) if checked else 0.0,
+        }
+
+
+class LocalScreen:
+    """
+    First cascade stage. screen(frame) returns (pest_score, detections): the
+    local model's probability that the frame shows a pest, and its non-clean
+    detections as {'label', 'confidence', 'box', 'source': 'local'} dicts.
+    """
+    def __init__(self, predict, kind):
+        self.predict = predict
+        self.kind = kind
+
+    @classmethod
+    def load(cls, backend='keras', model_path=None, yolo_path=None, class_file=None):
+        if yolo_path and os.path.exists(yolo_path):
+            from ultralytics import YOLO
+            from inference import yolo_boxes
+            model = YOLO(yolo_path)
+
+            def predict(frame):
+                preds = yolo_boxes(model(frame, verbose=False), model.names)[0]
+                pests = [p for p in preds if not is_clean_label(p['label'])]
+                return max((p['confidence'] for p in pests), default=0.0), pests
+            return cls(predict, 'yolo')
+
+        from backends import load_backend
+        from inference import InputBuffer, decode_keras_output, pest_scores
+        model = load_backend(backend, path=model_path)
+        names = ['hygienic', 'insects', 'ratimages']
+        if class_file and os.path.exists(class_file):
+            with open(class_file, 'r', encoding='utf-8') as f:
+                names = [line.strip() for line in f.readlines() if line.strip()]
+        buffer = InputBuffer((224, 224), capacity=1)
+
+        def predict(frame):
+            probs = model.predict(buffer.fill([frame]))
+            score = float(pest_scores(probs, names, is_clean_label)[0])
+            label, conf = decode_keras_output(probs[0], names)
+            if is_clean_label(label):
+                return score, []
+            h, w = frame.shape[:2]
+            return score, [{'label': label, 'confidence': conf, 'box': [0, 0, int(w), int(h)]}]
+        return cls(predict, backend)
+
+    def screen(self, frame):
+        score, detections = self.predict(frame)
+        for d in detections:
+            d['source'] = 'local'
+        return float(score), detections
+
+
+class CascadeGate:
+    """
+    Decides per screened frame: 'clean' (pest score below clean_below),
+    'trusted' (at or above trust_above) or 'remote' (in the band between,
+    where Vision is asked). Counts the calls avoided either way; a 'remote'
+    frame only counts as a call once sent() confirms it went out.
+    """
+    def __init__(self, clean_below=CLEAN_BELOW, trust_above=TRUST_ABOVE):
+        if clean_below > trust_above:
+            raise ValueError("clean_below must not exceed trust_above")
+        self.clean_below = float(clean_below)
+        self.trust_above = float(trust_above)
+        self._lock = threading.Lock()
+        self.screened = 0
+        self.remote = 0
+        self.avoided_clean = 0
+        self.avoided_trusted = 0
+
+    def decide(self, pest_score):
+        with self._lock:
+            self.screened += 1
+            if pest_score < self.clean_below:
+                self.avoided_clean += 1
+                return 'clean'
+            if pest_score >= self.trust_above:
+                self.avoided_trusted += 1
+                return 'trusted'
+            return 'remote'
+
+    def sent(self):
+        with self._lock:
+            self.remote += 1
+
+    def stats(self):
+        with self._lock:
+            avoided = self.avoided_clean + self.avoided_trusted
+            return {
+                'band': [self.clean_below, self.trust_above],
+                'screened': self.screened,
+                'remote_calls': self.remote,
+                'remote_not_sent': self.screened - avoided - self.remote,
+                'avoided_clean': self.avoided_clean,
+                'avoided_trusted': self.avoided_trusted,
+                'avoided_ratio': round(avoided / self.screened, 3) if self.screened else 0.0,
+            }
+
+
+def _overlaps(local_box, remote_box, iou_threshold):
+    """IoU match, or the remote box lying mostly inside the local one (e.g. a whole-frame label)."""
+    if iou(local_box, remote_box) >= iou_threshold:
+        return True
+    lx, ly, lw, lh = local_box
+    rx, ry, rw, rh = remote_box
+    ix = max(0, min(lx + lw, rx + rw) - max(lx, rx))
+    iy = max(0, min(ly + lh, ry + rh) - max(ly, ry))
+    return rw * rh > 0 and ix * iy >= 0.5 * rw * rh
+
+
+def merge_detections(local, remote, iou_threshold=0.3):
+    """
+    One result from both stages. remote=None means Vision was not asked and
+    the local detections stand. Otherwise Vision's detections are kept, each
+    noting the overlapping local label if any; local detections Vision did
+    not confirm are dropped.
+    """
+    if remote is None:
+        return list(local)
+    merged = []
+    for r in remote:
+        r = dict(r)
+        match = next((l for l in local if _overlaps(l['box'], r['box'], iou_threshold)), None)
+        if match is not None:
+            r['local_label'] = match['label']
+            r['local_confidence'] = match['confidence']
+            r['source'] = 'local+remote'
+        merged.append(r)
+    return merged
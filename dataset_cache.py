@@ -0,0 +1,170 @@
+# dataset_cache.py
+"""
+Decode-once image store for the training input pipeline. build() decodes and
+resizes every image in dataset/ to uint8 pixels in a memory-mapped array
+(via FeatureCache) and writes manifest.json with the class names and the
+file list; rebuilds only decode files that are new or changed since the last
+build. load_datasets() then serves train/validation tf.data pipelines from
+that array, so epochs never touch the JPEGs again.
+
+    python dataset_cache.py --data_dir dataset --out models/image_cache
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from feature_cache import FeatureCache
+
+MANIFEST_FILE = 'manifest.json'
+IMAGE_EXTENSIONS = ('.bmp', '.gif', '.jpeg', '.jpg', '.png')  # what image_dataset_from_directory reads
+SHUFFLE_BUFFER = 2048
+
+
+def list_images(data_dir):
+    """(paths, labels, class_names): class folders sorted by name, files sorted within each."""
+    class_names = sorted(d for d in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, d)))
+    paths, labels = [], []
+    for label, name in enumerate(class_names):
+        found = []
+        for root, _, files in os.walk(os.path.join(data_dir, name)):
+            found += [os.path.join(root, f) for f in files if f.lower().endswith(IMAGE_EXTENSIONS)]
+        paths += sorted(found)
+        labels += [label] * len(found)
+    return paths, labels, class_names
+
+
+def _open(out_dir, img_size):
+    return FeatureCache(out_dir, dim=img_size[0] * img_size[1] * 3, dtype='uint8')
+
+
+def build(data_dir, out_dir, img_size=(224, 224), batch_size=64):
+    """Bring the store in out_dir up to date with data_dir; returns the manifest."""
+    import tensorflow as tf
+
+    t0 = time.perf_counter()
+    paths, labels, class_names = list_images(data_dir)
+    cache = _open(out_dir, img_size)
+    known = len(cache.entries)
+    cache.prune(paths)
+    removed = known - len(cache.entries)
+    todo = [path for path, _ in cache.missing(paths, 1)]
+    print(f"Image cache: {len(paths)} images, {len(todo)} to decode, {removed} removed")
+
+    def load(path):
+        img = tf.image.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+        img = tf.image.resize(img, img_size)  # bilinear, like image_dataset_from_directory
+        return tf.cast(tf.clip_by_value(tf.round(img), 0, 255), tf.uint8)
+
+    if todo:
+        decoded = (tf.data.Dataset.from_tensor_slices(todo)
+                   .map(load, num_parallel_calls=tf.data.AUTOTUNE, deterministic=True)
+                   .batch(batch_size)
+                   .prefetch(tf.data.AUTOTUNE))
+        done = 0
+        for batch in decoded:
+            for img in batch.numpy():
+                cache.put(todo[done], 0, img.reshape(-1))
+                done += 1
+            cache.save()
+    cache.save()
+
+    manifest = {
+        'data_dir': os.path.abspath(data_dir),
+        'img_size': list(img_size),
+        'class_names': class_names,
+        # relative to data_dir, so the manifest works from any working directory
+        'files': [[os.path.relpath(path, data_dir), label] for path, label in zip(paths, labels)],
+        'built_at': time.time(),
+        'last_build': {'decoded': len(todo), 'removed': removed,
+                       'seconds': round(time.perf_counter() - t0, 2)},
+    }
+    tmp = os.path.join(out_dir, MANIFEST_FILE + '.tmp')
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(out_dir, MANIFEST_FILE))
+    print(f"Image cache: {cache.stats()} in {manifest['last_build']['seconds']}s")
+    return manifest
+
+
+def _read_manifest(out_dir):
+    with open(os.path.join(out_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _paths(manifest):
+    """Absolute paths of the manifest's files."""
+    return [os.path.join(manifest['data_dir'], p) for p, _ in manifest['files']]
+
+
+def split_indices(count, val_split=0.2, seed=1337):
+    """Seeded (train, validation) index split of the manifest's file list."""
+    order = np.arange(count)
+    np.random.RandomState(seed).shuffle(order)
+    num_val = int(val_split * count)
+    return order[:count - num_val], order[count - num_val:]
+
+
+def split_paths(out_dir, val_split=0.2, seed=1337):
+    """(train_paths, val_paths, class_names) exactly as load_datasets splits them."""
+    manifest = _read_manifest(out_dir)
+    paths = _paths(manifest)
+    train_idx, val_idx = split_indices(len(paths), val_split, seed)
+    return [paths[i] for i in train_idx], [paths[i] for i in val_idx], manifest['class_names']
+
+
+def load_datasets(out_dir, batch_size=16, val_split=0.2, seed=1337, shuffle_buffer=SHUFFLE_BUFFER):
+    """
+    (train_ds, val_ds, class_names) from a built store, with the same labels
+    as prepare_datasets (binary for two classes, else one-hot) and a seeded
+    train/validation split. Training batches are reshuffled every epoch;
+    batches are gathered from the memory map on parallel map calls.
+    """
+    import tensorflow as tf
+
+    manifest = _read_manifest(out_dir)
+    h, w = manifest['img_size']
+    class_names = manifest['class_names']
+    paths = _paths(manifest)
+    labels = np.array([l for _, l in manifest['files']])
+    cache = _open(out_dir, (h, w))
+    rows = cache.rows(paths)
+
+    if len(class_names) == 2:
+        targets = labels.astype('float32')[:, None]
+    else:
+        targets = np.eye(len(class_names), dtype='float32')[labels]
+
+    train_idx, val_idx = split_indices(len(paths), val_split, seed)
+
+    def gather(r):
+        return cache.read(r)
+
+    def pixels(r, y):
+        images = tf.numpy_function(gather, [r], tf.uint8)
+        return tf.cast(tf.reshape(images, (-1, h, w, 3)), tf.float32), y
+
+    def make(idx, training):
+        ds = tf.data.Dataset.from_tensor_slices((rows[idx], targets[idx]))
+        if training:
+            ds = ds.shuffle(min(len(idx), shuffle_buffer), seed=seed, reshuffle_each_iteration=True)
+        ds = ds.batch(batch_size).map(pixels, num_parallel_calls=tf.data.AUTOTUNE)
+        return ds.prefetch(tf.data.AUTOTUNE)
+
+    print(f"Using {len(train_idx)} cached images for training, {len(val_idx)} for validation.")
+    return make(train_idx, True), make(val_idx, False), class_names
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Decode and resize dataset/ once into a reusable image cache.")
+    parser.add_argument("--data_dir", type=str, default="dataset")
+    parser.add_argument("--out", type=str, default=os.path.join("models", "image_cache"))
+    parser.add_argument("--img_size", type=int, default=224)
+    args = parser.parse_args()
+    build(args.data_dir, args.out, img_size=(args.img_size, args.img_size))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+# export_model.py
+import os
+import json
+import time
+import random
+import argparse
+import numpy as np
+import cv2
+import tensorflow as tf
+from utils import preprocess_roi
+from backends import DEFAULT_PATHS, load_backend
+from train import split_files
+
+
+def list_samples(paths, class_names, per_class, seed=1337):
+    """
+    Returns [(path, class_index)], up to per_class random images per class
+    from paths, labelled by their class folder.
+    """
+    rng = random.Random(seed)
+    by_class = {name: [] for name in class_names}
+    for p in sorted(paths):
+        by_class[os.path.basename(os.path.dirname(p))].append(p)
+    samples = []
+    for idx, name in enumerate(class_names):
+        files = by_class[name]
+        rng.shuffle(files)
+        samples.extend((p, idx) for p in files[:per_class])
+    return samples
+
+
+def load_sample(path, input_size=(224, 224)):
+    img = cv2.imread(path, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    return preprocess_roi(img, target_size=input_size)
+
+
+def representative_dataset(train_paths, class_names, num_samples):
+    """Calibration generator for full-int8 quantization, drawn from the training split only."""
+    samples = list_samples(train_paths, class_names, per_class=max(1, num_samples // len(class_names)), seed=7)
+    def gen():
+        for path, _ in samples:
+            inp = load_sample(path)
+            if inp is not None:
+                yield [inp]
+    return gen
+
+
+def export_tflite_fp16(model, out_path):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.target_spec.supported_types = [tf.float16]
+    with open(out_path, 'wb') as f:
+        f.write(converter.convert())
+    print(f"Saved float16 TFLite model: {out_path}")
+
+
+def export_tflite_int8(model, out_path, train_paths, class_names, num_samples):
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    converter.representative_dataset = representative_dataset(train_paths, class_names, num_samples)
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+    # Pixels are already integers in 0-255, so a uint8 input represents them exactly
+    converter.inference_input_type = tf.uint8
+    converter.inference_output_type = tf.uint8
+    with open(out_path, 'wb') as f:
+        f.write(converter.convert())
+    print(f"Saved int8 TFLite model: {out_path}")
+
+
+def export_onnx(model, out_path, input_size=(224, 224)):
+    try:
+        import tf2onnx
+    except ImportError:
+        print("Skipping ONNX export: tf2onnx is not installed (pip install tf2onnx onnxruntime).")
+        return False
+    spec = (tf.TensorSpec((None, input_size[1], input_size[0], 3), tf.float32, name='input'),)
+    tf2onnx.convert.from_keras(model, input_signature=spec, opset=13, output_path=out_path)
+    print(f"Saved ONNX model: {out_path}")
+    return True
+
+
+def export_paths(model_path):
+    """(backend, path) for the Keras model and every export written next to it."""
+    out_dir = os.path.dirname(model_path) or '.'
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    return [
+        ('keras', model_path),
+        ('tflite', os.path.join(out_dir, f"{stem}_fp16.tflite")),
+        ('tflite', os.path.join(out_dir, f"{stem}_int8.tflite")),
+        ('onnxruntime', os.path.join(out_dir, f"{stem}.onnx")),
+    ]
+
+
+def benchmark(val_paths, class_names, per_class, candidates, warmup=3):
+    """
+    Accuracy and per-image (batch 1) latency of each (backend, path) candidate
+    on the same random sample of held-out validation images.
+    """
+    samples = list_samples(val_paths, class_names, per_class)
+    inputs = [(load_sample(p), y) for p, y in samples]
+    inputs = [(x, y) for x, y in inputs if x is not None]
+
+    report = []
+    for name, path in candidates:
+        try:
+            backend = load_backend(name, path=path)
+        except Exception as e:
+            print(f"[{name}] skipped: {e}")
+            continue
+        for x, _ in inputs[:warmup]:
+            backend.predict(x)
+        correct = 0
+        latencies = []
+        for x, y in inputs:
+            t0 = time.perf_counter()
+            probs = backend.predict(x)
+            latencies.append((time.perf_counter() - t0) * 1000.0)
+            probs = np.asarray(probs).ravel()
+            pred = int(np.argmax(probs)) if probs.shape[-1] > 1 else int(probs[0] >= 0.5)
+            correct += int(pred == y)
+        lat = np.asarray(latencies)
+        report.append({
+            'backend': name,
+            'model': os.path.basename(backend.path),
+            'size_mb': round(os.path.getsize(backend.path) / (1024 * 1024), 2),
+            'images': len(inputs),
+            'accuracy': round(correct / max(1, len(inputs)), 4),
+            'latency_ms_mean': round(float(lat.mean()), 2),
+            'latency_ms_p50': round(float(np.percentile(lat, 50)), 2),
+            'latency_ms_p95': round(float(np.percentile(lat, 95)), 2),
+        })
+    return report
+
+
+def print_report(report):
+    print("\n--- Backend Comparison ---")
+    print(f"{'backend':<12} {'model':<32} {'MB':>7} {'acc':>7} {'mean ms':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for r in report:
+        print(f"{r['backend']:<12} {r['model']:<32} {r['size_mb']:>7} {r['accuracy']:>7} "
+              f"{r['latency_ms_mean']:>8} {r['latency_ms_p50']:>8} {r['latency_ms_p95']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the Keras classifier to TFLite/ONNX and compare backends.")
+    parser.add_argument("--model", type=str, default=DEFAULT_PATHS['keras'])
+    parser.add_argument("--data_dir", type=str, default="dataset",
+                        help="training data; int8 calibration uses its training split, the report its validation split")
+    parser.add_argument("--val_split", type=float, default=0.2, help="must match the split the model was trained with")
+    parser.add_argument("--seed", type=int, default=1337, help="must match the split the model was trained with")
+    parser.add_argument("--image_cache", type=str, default=None,
+                        help="decode-once store the model was trained from (train.py --image_cache); its split is used")
+    parser.add_argument("--calib_samples", type=int, default=150, help="representative images for int8 calibration")
+    parser.add_argument("--report_per_class", type=int, default=50, help="validation images per class in the report")
+    parser.add_argument("--skip_export", action="store_true", help="only run the comparison report")
+    parser.add_argument("--no_report", action="store_true")
+    args = parser.parse_args()
+
+    train_paths, val_paths, class_names = split_files(args.data_dir, val_split=args.val_split, seed=args.seed,
+                                                      image_cache=args.image_cache)
+    print(f"Split: {len(train_paths)} training images (calibration), {len(val_paths)} validation images (report)")
+
+    if not args.skip_export:
+        model = tf.keras.models.load_model(args.model, safe_mode=False)
+        _, fp16_path, int8_path, onnx_path = [p for _, p in export_paths(args.model)]
+        export_tflite_fp16(model, fp16_path)
+        export_tflite_int8(model, int8_path, train_paths, class_names, args.calib_samples)
+        export_onnx(model, onnx_path)
+
+    if not args.no_report:
+        report = benchmark(val_paths, class_names, args.report_per_class, export_paths(args.model))
+        print_report(report)
+        out = os.path.join(os.path.dirname(args.model) or '.', 'backend_report.json')
+        with open(out, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved report: {out}")
+
+
+if __name__ == "__main__":
+    main()
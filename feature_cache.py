@@ -0,0 +1,128 @@
+# feature_cache.py
+"""
+On-disk cache of per-image vectors: pooled backbone features for head-only
+(stage 1) training, or decoded uint8 pixels (dataset_cache.py). Vectors live
+in one memory-mapped array (features.bin); index.json maps "<copy>:<path>"
+to its row and the file's mtime/size when it was computed, so only new or
+changed images are recomputed on later runs. Copy 0 is the original image;
+copies 1..N are fixed augmented versions of it.
+"""
+import json
+import os
+
+import numpy as np
+
+INDEX_FILE = 'index.json'
+DATA_FILE = 'features.bin'
+
+
+def file_key(path):
+    """(mtime_ns, size) of path; a change in either invalidates its cached rows."""
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+class FeatureCache:
+    def __init__(self, cache_dir, dim, dtype='float16'):
+        self.cache_dir = cache_dir
+        self.dim = int(dim)
+        self.dtype = np.dtype(dtype)
+        os.makedirs(cache_dir, exist_ok=True)
+        self.entries = {}  # "<copy>:<path>" -> [row, mtime_ns, size]
+        self.capacity = 0
+        index_path = os.path.join(cache_dir, INDEX_FILE)
+        if os.path.exists(index_path):
+            with open(index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+            if index.get('dim') == self.dim and index.get('dtype') == self.dtype.name:
+                self.entries = index['entries']
+                self.capacity = int(index['capacity'])
+            else:
+                print(f"[FeatureCache] {cache_dir} was built with another vector size or dtype; starting over")
+        self._free = sorted(set(range(self.capacity)) - {e[0] for e in self.entries.values()})
+        self._mm = None
+        self._open()
+        self.computed = 0
+        self.reused = 0
+
+    @staticmethod
+    def _key(path, copy):
+        return f"{int(copy)}:{os.path.abspath(path)}"
+
+    def _open(self):
+        data_path = os.path.join(self.cache_dir, DATA_FILE)
+        nbytes = self.capacity * self.dim * self.dtype.itemsize
+        with open(data_path, 'ab') as f:
+            if f.tell() != nbytes:
+                f.truncate(nbytes)
+        self._mm = (np.memmap(data_path, dtype=self.dtype, mode='r+', shape=(self.capacity, self.dim))
+                    if self.capacity else np.zeros((0, self.dim), self.dtype))
+
+    def _grow(self, needed):
+        if self.capacity - len(self.entries) >= needed:
+            return
+        if isinstance(self._mm, np.memmap):
+            self._mm.flush()
+        old = self.capacity
+        self.capacity = max(old * 2, len(self.entries) + needed, 256)
+        self._mm = None
+        self._open()
+        self._free.extend(range(old, self.capacity))
+
+    def missing(self, paths, copies):
+        """[(path, [copy, ...])] for every path with a missing or outdated copy in range(copies)."""
+        todo = []
+        for path in paths:
+            key = file_key(path)
+            need = []
+            for c in range(copies):
+                entry = self.entries.get(self._key(path, c))
+                if entry is None or entry[1:] != key:
+                    need.append(c)
+            if need:
+                todo.append((path, need))
+            self.reused += copies - len(need)
+        return todo
+
+    def put(self, path, copy, vector):
+        k = self._key(path, copy)
+        entry = self.entries.get(k)
+        if entry is None:
+            self._grow(1)
+            row = self._free.pop(0)
+        else:
+            row = entry[0]
+        self._mm[row] = np.asarray(vector, dtype=self.dtype)
+        self.entries[k] = [row, *file_key(path)]
+        self.computed += 1
+
+    def rows(self, paths, copy=0):
+        return np.array([self.entries[self._key(p, copy)][0] for p in paths], dtype=np.int64)
+
+    def read(self, rows):
+        """Stored vectors of the given rows, in the cache's dtype."""
+        return self._mm[np.asarray(rows)]
+
+    def get(self, paths, copy=0):
+        """(len(paths), dim) float32 features of one copy of each path."""
+        return np.asarray(self.read(self.rows(paths, copy)), dtype=np.float32)
+
+    def prune(self, paths):
+        """Forget rows of files that are no longer in the dataset."""
+        keep = {os.path.abspath(p) for p in paths}
+        for k in [k for k in self.entries if k.split(':', 1)[1] not in keep]:
+            self._free.append(self.entries.pop(k)[0])
+        self._free.sort()
+
+    def save(self):
+        if isinstance(self._mm, np.memmap):
+            self._mm.flush()
+        index = {'dim': self.dim, 'dtype': self.dtype.name, 'capacity': self.capacity, 'entries': self.entries}
+        tmp = os.path.join(self.cache_dir, INDEX_FILE + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(tmp, os.path.join(self.cache_dir, INDEX_FILE))
+
+    def stats(self):
+        return {'rows': len(self.entries), 'capacity': self.capacity, 'computed': self.computed,
+                'reused': self.reused, 'bytes': self.capacity * self.dim * self.dtype.itemsize}
@@ -0,0 +1,150 @@
+# inference.py
+"""
+Model-agnostic pieces of the prediction path, shared by the in-process
+batcher in app.py and the worker processes in worker_pool.py.
+A prediction is {'label', 'confidence', 'box': [x, y, w, h]} in the
+coordinates of the image that was passed in.
+"""
+import numpy as np
+from utils import preprocess_into
+
+
+def decode_keras_output(probs, names):
+    """Turn one row of classifier output into (label, confidence)."""
+    probs = np.asarray(probs).ravel()
+    if probs.shape[-1] > 1:
+        idx = int(np.argmax(probs))
+        conf = float(probs[idx])
+        label = names[idx] if idx < len(names) else str(idx)
+    else:
+        prob = float(probs[0])
+        label = names[1] if prob >= 0.5 else names[0]
+        conf = prob if label == names[1] else (1.0 - prob)
+    return label, conf
+
+
+def keras_boxes(preds, images, names):
+    """One whole-image prediction per image from a batch of classifier outputs."""
+    outputs = []
+    for img, row in zip(images, preds):
+        h, w = img.shape[:2]
+        label, conf = decode_keras_output(row, names)
+        outputs.append([{'label': label, 'confidence': conf, 'box': [0, 0, int(w), int(h)]}])
+    return outputs
+
+
+def yolo_boxes(results, names):
+    """Prediction lists from a list of ultralytics Results."""
+    outputs = []
+    for result in results:
+        predictions = []
+        boxes = result.boxes
+        if boxes is not None:
+            for box in boxes:
+                x1, y1, x2, y2 = map(int, box.xyxy[0].cpu().numpy())
+                conf = float(box.conf[0].cpu().numpy())
+                cls_id = int(box.cls[0].cpu().numpy())
+                label = names[cls_id]
+                predictions.append({'label': label, 'confidence': conf, 'box': [x1, y1, x2 - x1, y2 - y1]})
+        outputs.append(predictions)
+    return outputs
+
+
+class InputBuffer:
+    """
+    Reusable float32 (N, H, W, 3) classifier input batch. Not thread-safe:
+    each batching thread or worker process owns its own buffer.
+    """
+    def __init__(self, input_size=(224, 224), capacity=8):
+        self.input_size = tuple(input_size)
+        self._batch = np.empty((max(1, capacity), input_size[1], input_size[0], 3), np.float32)
+        self._scratch = np.empty((input_size[1], input_size[0], 3), np.uint8)
+
+    def fill(self, images):
+        n = len(images)
+        if n > len(self._batch):
+            self._batch = np.empty((n,) + self._batch.shape[1:], np.float32)
+        for i, img in enumerate(images):
+            preprocess_into(img, self._batch[i], self.input_size, scratch=self._scratch)
+        return self._batch[:n]
+
+
+def tile_grid(width, height, tile=224, overlap=0.25, max_tiles=64):
+    """
+    Overlapping square windows (x, y, w, h) covering a width x height image,
+    row-major. The window grows beyond tile pixels when needed to stay within
+    max_tiles; edge windows are shifted inward rather than padded.
+    Returns (windows, rows, cols).
+    """
+    overlap = min(max(float(overlap), 0.0), 0.9)
+    size = float(tile)
+
+    def axis(length, size):
+        if length <= size:
+            return [0]
+        stride = max(1, int(size * (1.0 - overlap)))
+        n = -(-(length - int(size)) // stride) + 1
+        return [min(i * stride, length - int(size)) for i in range(n)]
+
+    while True:
+        xs, ys = axis(width, size), axis(height, size)
+        if len(xs) * len(ys) <= max(1, max_tiles) or size >= max(width, height):
+            break
+        size *= 1.25
+    s = int(size)
+    windows = [(x, y, min(s, width), min(s, height)) for y in ys for x in xs]
+    return windows, len(ys), len(xs)
+
+
+def pest_scores(probs, names, is_clean):
+    """Per-row probability that a tile is not clean (1 - P(clean class)), from classifier outputs."""
+    probs = np.asarray(probs, dtype=np.float32)
+    if probs.ndim == 1:
+        probs = probs[:, None]
+    if probs.shape[1] == 1:
+        # sigmoid output is P(names[1])
+        p = probs[:, 0]
+        return (1.0 - p) if len(names) > 1 and is_clean(names[1]) else p
+    clean = [i for i, n in enumerate(names[:probs.shape[1]]) if is_clean(n)]
+    if not clean:
+        return np.ones(len(probs), np.float32)
+    return 1.0 - probs[:, clean].sum(axis=1)
+
+
+def merge_tile_boxes(tiles, threshold):
+    """
+    Union overlapping or touching pest tiles of the same label into one box
+    each. tiles are {'label', 'confidence', 'pest_score', 'is_pest', 'box'}; returns
+    predictions whose confidence is the best tile's in the group.
+    """
+    hits = [t for t in tiles if t['pest_score'] >= threshold and t['is_pest']]
+    parent = list(range(len(hits)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, a in enumerate(hits):
+        ax, ay, aw, ah = a['box']
+        for j in range(i + 1, len(hits)):
+            b = hits[j]
+            bx, by, bw, bh = b['box']
+            if a['label'] == b['label'] and ax <= bx + bw and bx <= ax + aw and ay <= by + bh and by <= ay + ah:
+                parent[find(j)] = find(i)
+
+    groups = {}
+    for i, t in enumerate(hits):
+        groups.setdefault(find(i), []).append(t)
+    merged = []
+    for group in groups.values():
+        x1 = min(t['box'][0] for t in group)
+        y1 = min(t['box'][1] for t in group)
+        x2 = max(t['box'][0] + t['box'][2] for t in group)
+        y2 = max(t['box'][1] + t['box'][3] for t in group)
+        best = max(group, key=lambda t: t['confidence'])
+        merged.append({'label': best['label'], 'confidence': best['confidence'],
+                       'box': [x1, y1, x2 - x1, y2 - y1], 'tiles': len(group)})
+    merged.sort(key=lambda p: -p['confidence'])
+    return merged
@@ -0,0 +1,178 @@
+# metrics.py
+"""
+Minimal Prometheus-style metrics (counters, gauges, histograms) rendered in
+the text exposition format, plus a stage() timer for pipeline stages.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _fmt_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    body = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+                    for k, v in pairs)
+    return '{' + body + '}'
+
+
+def _fmt_value(v):
+    if v == float('inf'):
+        return '+Inf'
+    return repr(float(v))
+
+
+class _Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, doc, labelnames=()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(v) for v in labels)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1.0):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def get(self, *labels):
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            for key, v in sorted(self._values.items()):
+                lines.append(f"{self.name}{_fmt_labels(self.labelnames, key)} {_fmt_value(v)}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Gauge with set() values; fn, if given, is called at render time instead."""
+    kind = 'gauge'
+
+    def __init__(self, name, doc, labelnames=(), fn=None):
+        super().__init__(name, doc, labelnames)
+        self.fn = fn
+
+    def set(self, value, *labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def render(self):
+        lines = self.header()
+        if self.fn is not None:
+            try:
+                values = self.fn()
+            except Exception:
+                values = {}
+            if not isinstance(values, dict):
+                values = {(): values}
+        else:
+            with self._lock:
+                values = dict(self._values)
+        for key, v in sorted(values.items()):
+            key = key if isinstance(key, tuple) else (key,)
+            lines.append(f"{self.name}{_fmt_labels(self.labelnames, key)} {_fmt_value(v)}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, doc, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, doc, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._values[key] = (counts, total + value)
+
+    def render(self):
+        lines = self.header()
+        with self._lock:
+            items = [(k, list(c), s) for k, (c, s) in sorted(self._values.items())]
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float('inf'),), counts):
+                cumulative += n
+                le = ('le', _fmt_value(bound) if bound != float('inf') else '+Inf')
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {_fmt_value(total)}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics)
+        for m in metrics:
+            lines.extend(m.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    'hygiene_stage_latency_seconds', 'Time spent in each pipeline stage.', ('pipeline', 'stage')))
+STAGE_ERRORS = REGISTRY.register(Counter(
+    'hygiene_stage_errors_total', 'Exceptions raised in each pipeline stage.', ('pipeline', 'stage')))
+MODEL_LOAD_SECONDS = REGISTRY.register(Gauge(
+    'hygiene_model_load_seconds', 'Duration of the last model load.', ('model',)))
+
+
+@contextmanager
+def stage(pipeline, name):
+    """Time a block into STAGE_LATENCY; count (and re-raise) any exception in STAGE_ERRORS."""
+    t0 = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(pipeline, name)
+        raise
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - t0, pipeline, name)
+
+
+def gauge(name, doc, fn, labelnames=()):
+    """Register a gauge whose value is read from fn() at scrape time."""
+    return REGISTRY.register(Gauge(name, doc, labelnames, fn=fn))
+
+
+def render():
+    return REGISTRY.render()
@@ -2,17 +2,11 @@
 import tensorflow as tf
 from tensorflow.keras import layers, models
 
-def build_classifier(input_shape=(224, 224, 3), base_trainable=False, dropout=0.5, num_classes=2):
-    """
-    Builds a more robust, "deeper" transfer-learning image classifier
-    using MobileNetV2 backbone.
-    Returns a compiled model ready for training.
-    """
-    # Input and preprocessing
-    inputs = layers.Input(shape=input_shape)
+FEATURE_DIM = 1280  # MobileNetV2 pooled feature size
 
+def build_augmentation():
     # --- 1. More Aggressive Data Augmentation ---
-    data_augmentation = tf.keras.Sequential([
+    return tf.keras.Sequential([
         layers.RandomFlip("horizontal"),
         layers.RandomRotation(0.2),  # Increased rotation
         layers.RandomZoom(0.2),    # Increased zoom
@@ -20,26 +14,15 @@ def build_classifier(input_shape=(224, 224, 3), base_trainable=False, dropout=0.
         layers.RandomBrightness(0.2) # Added brightness
     ], name="data_augmentation")
 
-    # Apply augmentation to the 0-255 inputs
-    augmented = data_augmentation(inputs)
-
-    # Preprocessing to match MobileNetV2 expectations (scales to -1, 1)
-    preprocessed = tf.keras.applications.mobilenet_v2.preprocess_input(augmented)
-
-    # --- 2. Backbone ---
-    base = tf.keras.applications.MobileNetV2(
+def build_backbone(input_shape=(224, 224, 3)):
+    return tf.keras.applications.MobileNetV2(
         input_shape=input_shape, include_top=False, weights='imagenet',
         # --- THIS IS THE FIX ---
         name="mobilenet_backbone" 
     )
-    base.trainable = base_trainable 
 
-    # --- 3. CRITICAL Bug Fix ---
-    x = base(preprocessed)
-    
-    # --- 4. Deeper, More "Intelligent" Classification Head ---
-    x = layers.GlobalAveragePooling2D()(x) # Pool features
-    
+def _head(x, dropout, num_classes):
+    """Classification head on pooled features; returns (outputs, loss)."""
     # First "thinking" layer
     x = layers.Dense(512, kernel_regularizer=tf.keras.regularizers.l2(0.001))(x)
     x = layers.BatchNormalization()(x) # Stabilizes training
@@ -54,11 +37,34 @@ def build_classifier(input_shape=(224, 224, 3), base_trainable=False, dropout=0.
     
     # --- 5. Output Layer ---
     if num_classes == 2:
-        outputs = layers.Dense(1, activation='sigmoid')(x)
-        loss = 'binary_crossentropy'
-    else:
-        outputs = layers.Dense(num_classes, activation='softmax')(x)
-        loss = 'categorical_crossentropy'
+        return layers.Dense(1, activation='sigmoid')(x), 'binary_crossentropy'
+    return layers.Dense(num_classes, activation='softmax')(x), 'categorical_crossentropy'
+
+def build_classifier(input_shape=(224, 224, 3), base_trainable=False, dropout=0.5, num_classes=2):
+    """
+    Builds a more robust, "deeper" transfer-learning image classifier
+    using MobileNetV2 backbone.
+    Returns a compiled model ready for training.
+    """
+    # Input and preprocessing
+    inputs = layers.Input(shape=input_shape)
+
+    # Apply augmentation to the 0-255 inputs
+    augmented = build_augmentation()(inputs)
+
+    # Preprocessing to match MobileNetV2 expectations (scales to -1, 1)
+    preprocessed = tf.keras.applications.mobilenet_v2.preprocess_input(augmented)
+
+    # --- 2. Backbone ---
+    base = build_backbone(input_shape)
+    base.trainable = base_trainable 
+
+    # --- 3. CRITICAL Bug Fix ---
+    x = base(preprocessed)
+    
+    # --- 4. Deeper, More "Intelligent" Classification Head ---
+    x = layers.GlobalAveragePooling2D()(x) # Pool features
+    outputs, loss = _head(x, dropout, num_classes)
 
     model = models.Model(inputs, outputs, name="HYGEIN-DETECTOR-v2-MobileNet")
     
@@ -71,4 +77,36 @@ def build_classifier(input_shape=(224, 224, 3), base_trainable=False, dropout=0.
         metrics=['accuracy']
     )
 
-    return model
\ No newline at end of file
+    return model
+
+def build_feature_extractor(input_shape=(224, 224, 3)):
+    """Frozen backbone + pooling: 0-255 images -> (N, FEATURE_DIM) features, as the classifier sees them."""
+    inputs = layers.Input(shape=input_shape)
+    x = tf.keras.applications.mobilenet_v2.preprocess_input(inputs)
+    base = build_backbone(input_shape)
+    base.trainable = False
+    x = base(x, training=False)
+    outputs = layers.GlobalAveragePooling2D()(x)
+    return models.Model(inputs, outputs, name="mobilenet_features")
+
+def build_head(dropout=0.5, num_classes=2, feature_dim=FEATURE_DIM):
+    """The classifier's head alone, compiled, for training on cached backbone features."""
+    inputs = layers.Input(shape=(feature_dim,))
+    outputs, loss = _head(inputs, dropout, num_classes)
+    head = models.Model(inputs, outputs, name="classifier_head")
+    head.compile(
+        optimizer=tf.keras.optimizers.Adam(learning_rate=1e-4),
+        loss=loss,
+        metrics=['accuracy']
+    )
+    return head
+
+def copy_head_weights(head, model):
+    """Copy a build_head() model's weights into the matching head layers of a build_classifier() model."""
+    pool = next(i for i, l in enumerate(model.layers) if isinstance(l, layers.GlobalAveragePooling2D))
+    target = [l for l in model.layers[pool + 1:] if l.weights]
+    source = [l for l in head.layers if l.weights]
+    if len(target) != len(source):
+        raise ValueError(f"Head layout mismatch: {len(source)} weighted layers vs {len(target)}")
+    for src, dst in zip(source, target):
+        dst.set_weights(src.get_weights())
@@ -0,0 +1,148 @@
+# model_registry.py
+"""
+Keeps the serving model current without restarts. A background thread polls
+the watched model files; once a change has settled, the new version is loaded
+and warmed off the request path and then swapped in with a single reference
+assignment. Requests that already picked up the old model finish on it.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import deque
+
+
+def file_state(paths):
+    """(path, mtime_ns, size) of each existing path; changes whenever a file is rewritten."""
+    state = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        state.append((path, st.st_mtime_ns, st.st_size))
+    return tuple(state)
+
+
+def version_id(kind, backend, state):
+    """Short, readable version string, e.g. 'keras-20261016-101500-3fa2c1d0e9'."""
+    digest = hashlib.sha1(repr((kind, backend, state)).encode('utf-8')).hexdigest()[:10]
+    newest = max((mtime for _, mtime, _ in state), default=0)
+    stamp = time.strftime('%Y%m%d-%H%M%S', time.localtime(newest / 1e9)) if newest else 'none'
+    return f"{str(kind).lower()}-{stamp}-{digest}"
+
+
+class ModelBundle:
+    """One loaded and warmed model version; never mutated after it is published."""
+    __slots__ = ('kind', 'backend', 'model', 'names', 'version', 'loaded_at')
+
+    def __init__(self, kind, backend, model, names, version):
+        self.kind = kind
+        self.backend = backend
+        self.model = model
+        self.names = list(names)
+        self.version = version
+        self.loaded_at = time.time()
+
+
+class ModelRegistry:
+    """
+    load(state) must return a ready ModelBundle for the given file_state() of
+    watch() (a callable returning the paths to watch). on_swap(new, old) runs
+    after each successful swap. A failed load keeps the current version and is
+    only retried once the files change again.
+    """
+    def __init__(self, load, watch, poll_interval=2.0, on_swap=None, history=10, name="model-registry"):
+        self.load = load
+        self.watch = watch
+        self.poll_interval = float(poll_interval)
+        self.on_swap = on_swap
+        self.name = name
+        self.current = None
+        self._state = None
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.loading = False
+        self.reloads = 0
+        self.failures = 0
+        self.last_error = None
+        self.history = deque(maxlen=history)
+
+    @property
+    def version(self):
+        current = self.current
+        return current.version if current is not None else None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _loop(self):
+        self.reload()
+        if self.poll_interval <= 0:
+            return
+        pending = None
+        while not self._stop.wait(self.poll_interval):
+            state = file_state(self.watch())
+            if state == self._state:
+                pending = None
+                continue
+            # wait for one unchanged poll so half-copied files are not loaded
+            if state != pending:
+                pending = state
+                continue
+            pending = None
+            self.reload(state)
+
+    def reload(self, state=None):
+        """Load the files as they are now and swap them in; returns True on success."""
+        with self._reload_lock:
+            if state is None:
+                state = file_state(self.watch())
+            self.loading = True
+            t0 = time.perf_counter()
+            try:
+                bundle = self.load(state)
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                self._state = state
+                print(f"[ModelRegistry] load failed, keeping {self.version}: {e}")
+                return False
+            finally:
+                self.loading = False
+            old = self.current
+            self.current = bundle  # the swap: a single reference assignment
+            self._state = state
+            if old is not None:
+                self.reloads += 1
+            self.last_error = None
+            self.history.append({'version': bundle.version, 'loaded_at': bundle.loaded_at,
+                                 'load_seconds': round(time.perf_counter() - t0, 3)})
+            if old is not None:
+                print(f"[ModelRegistry] swapped {old.version} -> {bundle.version}")
+            if self.on_swap is not None:
+                self.on_swap(bundle, old)
+            return True
+
+    def stats(self):
+        current = self.current
+        return {
+            'version': current.version if current else None,
+            'kind': current.kind if current else None,
+            'backend': current.backend if current else None,
+            'loaded_at': current.loaded_at if current else None,
+            'loading': self.loading,
+            'reloads': self.reloads,
+            'failures': self.failures,
+            'last_error': self.last_error,
+            'poll_interval': self.poll_interval,
+            'history': list(self.history),
+        }
@@ -0,0 +1,64 @@
+# motion.py
+import cv2
+import numpy as np
+
+
+class MotionDetector:
+    """
+    MOG2 background subtraction on a downscaled copy of each frame.
+    The structuring element and the small-frame/mask buffers are allocated
+    once and reused; boxes are returned in full-resolution coordinates.
+    """
+    def __init__(self, scale=0.5, min_area=5000, history=500, var_threshold=50, detect_shadows=True, kernel_size=5):
+        self.scale = min(1.0, max(0.05, float(scale)))
+        self.min_area = float(min_area)
+        self.back_sub = cv2.createBackgroundSubtractorMOG2(history=history, varThreshold=var_threshold,
+                                                           detectShadows=detect_shadows)
+        # kernel scaled with the frame so the clean-up covers the same real area
+        k = max(3, int(round(kernel_size * self.scale)) | 1)
+        self.kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (k, k))
+        self._size = None
+        self._small = None
+        self._mask = None
+        self._work = None
+
+    def _alloc(self, width, height):
+        sw, sh = max(1, int(round(width * self.scale))), max(1, int(round(height * self.scale)))
+        self._size = (width, height)
+        self._small = np.empty((sh, sw, 3), np.uint8)
+        self._mask = np.empty((sh, sw), np.uint8)
+        self._work = np.empty((sh, sw), np.uint8)
+
+    @property
+    def mask(self):
+        """Foreground mask of the last frame (downscaled)."""
+        return self._mask
+
+    def detect(self, frame):
+        """Return [(area, (x, y, w, h))] of moving regions, full-resolution, largest first."""
+        h, w = frame.shape[:2]
+        if self._size != (w, h):
+            self._alloc(w, h)
+        if self.scale < 1.0:
+            small = cv2.resize(frame, (self._small.shape[1], self._small.shape[0]), dst=self._small,
+                               interpolation=cv2.INTER_AREA)
+        else:
+            small = frame
+        self.back_sub.apply(small, fgmask=self._mask)
+        cv2.morphologyEx(self._mask, cv2.MORPH_OPEN, self.kernel, dst=self._work, iterations=1)
+        cv2.morphologyEx(self._work, cv2.MORPH_DILATE, self.kernel, dst=self._mask, iterations=2)
+
+        contours, _ = cv2.findContours(self._mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        inv = 1.0 / self.scale
+        min_area = self.min_area * self.scale * self.scale
+        boxes = []
+        for cnt in contours:
+            area = cv2.contourArea(cnt)
+            if area < min_area:
+                continue
+            x, y, bw, bh = cv2.boundingRect(cnt)
+            x1, y1 = int(x * inv), int(y * inv)
+            x2, y2 = min(w, int(np.ceil((x + bw) * inv))), min(h, int(np.ceil((y + bh) * inv)))
+            boxes.append((area * inv * inv, (x1, y1, x2 - x1, y2 - y1)))
+        boxes.sort(key=lambda b: -b[0])
+        return boxes
@@ -0,0 +1,282 @@
+# pipeline.py
+"""
+Small threaded stage pipeline for realtime.py. Each stage runs on its own
+thread and hands its output to the next one through a bounded DropQueue that
+discards the oldest item when full, so a slow stage makes the pipeline skip
+frames instead of building up latency. The last stage runs on the calling
+thread (GUI windows need the main thread).
+"""
+import collections
+import http.server
+import json
+import socketserver
+import threading
+import time
+
+import cv2
+
+
+class DropQueue:
+    """Bounded FIFO; put() on a full queue discards the oldest item."""
+    def __init__(self, maxsize=2):
+        self.maxsize = max(1, int(maxsize))
+        self._items = collections.deque()
+        self._cond = threading.Condition()
+        self.dropped = 0
+        self.peak = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self.peak = max(self.peak, len(self._items))
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Oldest item, or None if nothing arrived within timeout."""
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            return self._items.popleft() if self._items else None
+
+    def __len__(self):
+        return len(self._items)
+
+    def stats(self):
+        return {'depth': len(self._items), 'size': self.maxsize, 'peak': self.peak, 'dropped': self.dropped}
+
+
+class Stage:
+    """
+    One pipeline step. fn(item) returns the item for the next stage, or None
+    to pass nothing on. A source stage (no input queue) is called with None
+    and ends the pipeline input by raising StopIteration.
+    """
+    def __init__(self, name, fn, queue_size=2):
+        self.name = name
+        self.fn = fn
+        self.queue_size = queue_size
+        self.inq = None
+        self.outq = None
+        self.upstream = None
+        self.processed = 0
+        self.busy = 0.0
+        self.error = None
+        self._times = collections.deque(maxlen=30)  # finish times of the last items, for fps
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    @property
+    def fps(self):
+        times = list(self._times)
+        if len(times) < 2 or times[-1] <= times[0]:
+            return 0.0
+        return (len(times) - 1) / (times[-1] - times[0])
+
+    def _record(self, seconds):
+        self._times.append(time.monotonic())
+        self.processed += 1
+        self.busy += seconds
+
+    def run(self, stop):
+        try:
+            while not stop.is_set():
+                if self.inq is None:
+                    item = None
+                else:
+                    item = self.inq.get(timeout=0.1)
+                    if item is None:
+                        # upstream finished and everything it sent is consumed
+                        if self.upstream.done and not len(self.inq):
+                            break
+                        continue
+                t0 = time.perf_counter()
+                try:
+                    out = self.fn(item)
+                except StopIteration:
+                    break
+                self._record(time.perf_counter() - t0)
+                if out is not None and self.outq is not None:
+                    self.outq.put(out)
+        except Exception as e:
+            self.error = f"{type(e).__name__}: {e}"
+            print(f"[Pipeline] stage {self.name} failed: {self.error}")
+            stop.set()
+        finally:
+            self._done.set()
+
+    def stats(self):
+        return {
+            'fps': round(self.fps, 2),
+            'processed': self.processed,
+            'busy_ms': round(1000.0 * self.busy / self.processed, 1) if self.processed else 0.0,
+            'queue': self.inq.stats() if self.inq is not None else None,
+            'error': self.error,
+        }
+
+
+class Pipeline:
+    """Runs stages in order; run() blocks on the last one until input ends or stop() is called."""
+    def __init__(self, stages):
+        self.stages = list(stages)
+        self._stop = threading.Event()
+        for prev, stage in zip(self.stages, self.stages[1:]):
+            stage.inq = DropQueue(stage.queue_size)
+            stage.upstream = prev
+            prev.outq = stage.inq
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def stopped(self):
+        return self._stop.is_set()
+
+    def run(self):
+        threads = []
+        for stage in self.stages[:-1]:
+            t = threading.Thread(target=stage.run, args=(self._stop,), name=f"pipeline-{stage.name}", daemon=True)
+            t.start()
+            threads.append(t)
+        try:
+            self.stages[-1].run(self._stop)
+        finally:
+            self._stop.set()
+            for t in threads:
+                t.join(timeout=2.0)
+
+    def stats(self):
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    def readout(self):
+        """One line per call, e.g. 'capture 25.0fps | [1/2 -3] motion 24.9fps 6.1ms | ...'."""
+        parts = []
+        for stage in self.stages:
+            s = stage.stats()
+            q = s['queue']
+            prefix = f"[{q['depth']}/{q['size']} -{q['dropped']}] " if q else ""
+            parts.append(f"{prefix}{stage.name} {s['fps']:.1f}fps {s['busy_ms']:.1f}ms")
+        return " | ".join(parts)
+
+
+# ------------------ Outputs ------------------
+class LogOutput:
+    """Headless output: nothing is drawn or shown; events and readouts go to stdout."""
+    needs_frames = False
+
+    def write(self, frame, mask=None):
+        return None
+
+    def close(self):
+        pass
+
+
+class GuiOutput:
+    """OpenCV windows; write() returns the pressed key (or -1)."""
+    needs_frames = True
+
+    def __init__(self, title="Detections", show_mask=True):
+        self.title = title
+        self.show_mask = show_mask
+
+    def write(self, frame, mask=None):
+        if self.show_mask and mask is not None:
+            cv2.imshow("Mask", mask)
+        cv2.imshow(self.title, frame)
+        return cv2.waitKey(1) & 0xFF
+
+    def close(self):
+        cv2.destroyAllWindows()
+
+
+class MjpegOutput:
+    """
+    Serves the annotated stream as MJPEG at http://host:port/ and the
+    pipeline stats as JSON at /stats. Clients only ever get the newest frame.
+    """
+    needs_frames = True
+
+    def __init__(self, host="0.0.0.0", port=8090, quality=80, stats=None):
+        self.quality = int(quality)
+        self.stats = stats or (lambda: {})
+        self._cond = threading.Condition()
+        self._jpeg = None
+        self._seq = 0
+        self._clients = 0
+        self._closed = False
+        output = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.startswith('/stats'):
+                    body = json.dumps(output.stats()).encode('utf-8')
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                if self.path not in ('/', '/stream'):
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=frame')
+                self.end_headers()
+                try:
+                    for jpeg in output._frames():
+                        self.wfile.write(b'--frame\r\nContent-Type: image/jpeg\r\n\r\n' + jpeg + b'\r\n')
+                except (BrokenPipeError, ConnectionResetError):
+                    pass
+
+        class Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+            daemon_threads = True
+            allow_reuse_address = True
+
+        self._server = Server((host, int(port)), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mjpeg-server", daemon=True)
+        self._thread.start()
+        print(f"MJPEG stream on http://{host}:{self._server.server_address[1]}/ (stats at /stats)")
+
+    def _frames(self):
+        seen = 0
+        with self._cond:
+            self._clients += 1
+        try:
+            while True:
+                with self._cond:
+                    self._cond.wait_for(lambda: self._seq != seen or self._closed, 5.0)
+                    if self._closed:
+                        return
+                    if self._seq == seen:
+                        continue
+                    seen, jpeg = self._seq, self._jpeg
+                yield jpeg
+        finally:
+            with self._cond:
+                self._clients -= 1
+
+    def write(self, frame, mask=None):
+        if not self._clients:
+            return None  # nobody watching: skip the encode
+        ok, buf = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), self.quality])
+        if ok:
+            with self._cond:
+                self._jpeg = buf.tobytes()
+                self._seq += 1
+                self._cond.notify_all()
+        return None
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._server.shutdown()
+        self._server.server_close()
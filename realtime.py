@@ -1,13 +1,21 @@
 # realtime.py
 import cv2
-import numpy as np
-import tensorflow as tf
 import os
-from utils import preprocess_roi, draw_labelled_box, save_snapshot, ensure_dir
+import time
+import argparse
+from utils import draw_labelled_box, save_snapshot, ensure_dir
 from datetime import datetime # Import for saving snapshots
+from snapshot_store import SnapshotWriter, SnapshotDeduper
+from backends import BACKENDS, load_backend
+from inference import InputBuffer, decode_keras_output
+from tracking import RoiTracker, thumbnail
+from motion import MotionDetector
+from cameras import parse_sources
+from pipeline import Pipeline, Stage, GuiOutput, MjpegOutput, LogOutput
 
 # Config
 MODEL_PATH = "models/insect_rat_model.keras"
+BACKEND = "keras"   # keras, tflite or onnxruntime (see export_model.py)
 INPUT_SIZE = (224, 224)
 
 # --- YOUR REQUESTED CHANGES ---
@@ -15,15 +23,42 @@ CONFIDENCE_THRESHOLD = 0.60  # 60% - Only show a box if model is 60% confident
 SNAPSHOT_CONFIDENCE = 0.80   # 80% - Only save snapshots if 80% confident
 # --- END OF CHANGES ---
 
-MIN_CONTOUR_AREA = 5000 
-SNAPSHOT_DIR = "snapshots"
+MIN_CONTOUR_AREA = 5000  # in full-resolution pixels
+MOTION_SCALE = 0.5       # motion detection runs on the frame scaled by this
+MAX_ROIS_PER_FRAME = 8   # largest moving regions classified per frame; the rest are ignored
+RECLASSIFY_EVERY = 15    # frames a tracked region keeps its cached label before it is classified again
+APPEARANCE_CHANGE = 25.0 # ...unless its grey level changes by this much on average (0-255)
+QUEUE_SIZE = 2           # frames buffered between pipeline stages; the oldest is dropped beyond this
+STATS_EVERY = 5.0        # seconds between per-stage FPS / queue readouts (0 = off)
+MJPEG_PORT = 8090
+SNAPSHOT_DIR = os.path.join("snapshots", "realtime")  # app.py owns the top level of snapshots/
+SNAPSHOT_MAX_FILES = 1000               # oldest snapshots are deleted beyond this
+SNAPSHOT_MAX_BYTES = 500 * 1024 * 1024  # ...or beyond this many bytes
+SNAPSHOT_QUEUE_SIZE = 16                # pending writes; extra snapshots are dropped
+SNAPSHOT_COOLDOWN = 10.0                # seconds between snapshots of the same label
+SNAPSHOT_DEDUP_DISTANCE = 8             # dhash bits; closer regions count as the same snapshot
+SNAPSHOT_DEDUP_MEMORY = 300.0           # seconds a saved region's hash is remembered
 CLASS_FILE = os.path.join(os.path.dirname(MODEL_PATH) or '.', 'class_names.txt')
 
-def load_model(path=MODEL_PATH):
-    print(f"Loading model from {path} ...")
+class Packet:
+    """One captured frame on its way through the pipeline."""
+    __slots__ = ('seq', 'frame', 'mask', 'rois', 'detections')
+
+    def __init__(self, seq, frame):
+        self.seq = seq
+        self.frame = frame
+        self.mask = None
+        self.rois = []        # ((x1, y1, x2, y2), crop) from the motion stage
+        self.detections = []  # (box, label, confidence, color) from the classify stage
+
+def load_model(path=MODEL_PATH, backend=BACKEND):
+    # Non-keras backends use their default export location unless a path is given
+    if backend != "keras" and path == MODEL_PATH:
+        path = None
+    print(f"Loading {backend} model from {path or 'default export path'} ...")
     try:
-        model = tf.keras.models.load_model(path, safe_mode=False)
-        print("Model loaded successfully.")
+        model = load_backend(backend, path=path)
+        print(f"Model loaded successfully ({model.path}).")
         return model
     except Exception as e:
         print(f"---!!! ERROR LOADING MODEL !!!---")
@@ -44,7 +79,26 @@ def load_class_names(path=CLASS_FILE, default=None):
     return default
 
 def main():
-    model = load_model()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backend", type=str, default=BACKEND, choices=BACKENDS, help="inference backend")
+    parser.add_argument("--model", type=str, default=MODEL_PATH, help="model file for the chosen backend")
+    parser.add_argument("--source", type=str, default="0", help="camera index or video file path")
+    parser.add_argument("--motion-scale", type=float, default=MOTION_SCALE, help="frame scale for motion detection")
+    parser.add_argument("--max-rois", type=int, default=MAX_ROIS_PER_FRAME, help="max regions classified per frame")
+    parser.add_argument("--reclassify-every", type=int, default=RECLASSIFY_EVERY,
+                        help="frames a tracked region reuses its label (1 = classify every frame)")
+    parser.add_argument("--snapshot-cooldown", type=float, default=SNAPSHOT_COOLDOWN,
+                        help="seconds between snapshots of the same label (0 = off)")
+    parser.add_argument("--output", type=str, default="gui", choices=("gui", "mjpeg", "log"),
+                        help="where annotated frames go: OpenCV window, MJPEG over HTTP, or log only")
+    parser.add_argument("--headless", action="store_true", help="no windows; same as --output log")
+    parser.add_argument("--port", type=int, default=MJPEG_PORT, help="port for --output mjpeg")
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE, help="frames buffered between stages")
+    parser.add_argument("--stats-every", type=float, default=STATS_EVERY,
+                        help="seconds between per-stage FPS/queue readouts (0 = off)")
+    args = parser.parse_args()
+
+    model = load_model(args.model, backend=args.backend)
     if model is None:
         return
 
@@ -63,73 +117,95 @@ def main():
     print(f"Using '{hygienic_class_name}' as the non-pest class.")
 
     ensure_dir(SNAPSHOT_DIR)
+    snapshot_writer = SnapshotWriter(SNAPSHOT_DIR, max_files=SNAPSHOT_MAX_FILES, max_bytes=SNAPSHOT_MAX_BYTES,
+                                     queue_size=SNAPSHOT_QUEUE_SIZE, policy='drop')
+    snapshot_dedup = SnapshotDeduper(max_distance=SNAPSHOT_DEDUP_DISTANCE, cooldown=args.snapshot_cooldown,
+                                     memory=SNAPSHOT_DEDUP_MEMORY)
     ensure_dir(os.path.join("dataset", "hygienic")) # For the 's' key
 
-    cap = cv2.VideoCapture(0)
+    sources = parse_sources(args.source)
+    source = sources[0] if sources else 0
+    cap = cv2.VideoCapture(source)
     if not cap.isOpened():
-        raise RuntimeError("Could not open webcam. Check camera index.")
+        raise RuntimeError(f"Could not open video source {args.source!r}. Check camera index or path.")
 
-    backSub = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=50, detectShadows=True)
+    motion = MotionDetector(scale=args.motion_scale, min_area=MIN_CONTOUR_AREA, history=500, var_threshold=50)
+    # every ROI of a frame goes into this one (N, 224, 224, 3) batch
+    max_rois = max(1, args.max_rois)
+    roi_batch = InputBuffer(INPUT_SIZE, capacity=max_rois)
+    tracker = RoiTracker(reclassify_every=args.reclassify_every, appearance_change=APPEARANCE_CHANGE)
+
+    if args.headless:
+        args.output = "log"
+    if args.output == "gui":
+        output = GuiOutput()
+    elif args.output == "mjpeg":
+        output = MjpegOutput(port=args.port, stats=lambda: pipeline.stats())
+    else:
+        output = LogOutput()
 
     print("\n--- Starting webcam ---")
     print(f"Detecting classes: {class_names}")
     print(f"Confidence to show box: {CONFIDENCE_THRESHOLD*100}%")
     print(f"Confidence to save snapshot: {SNAPSHOT_CONFIDENCE*100}%")
-    print("\n--- CONTROLS ---")
-    print("Press 's' to save a 'hygienic' snapshot for re-training.")
-    print("Press 'q' to quit.")
+    print(f"Output: {args.output}")
+    if args.output == "gui":
+        print("\n--- CONTROLS ---")
+        print("Press 's' to save a 'hygienic' snapshot for re-training.")
+        print("Press 'q' to quit.")
+
+    # Video files are played at their own frame rate, like a live camera,
+    # so the drop-oldest queues behave the same for both
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    period = 1.0 / fps if isinstance(source, str) and fps and fps > 0 else 0.0
+    clock = {'next': time.monotonic(), 'seq': 0}
 
-    while True:
+    def capture(_):
+        if period:
+            delay = clock['next'] - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            clock['next'] = max(clock['next'], time.monotonic()) + period
         ret, frame = cap.read()
         if not ret:
-            break
-
-        original = frame.copy()
-        frame_small = frame.copy()
-        fgmask = backSub.apply(frame_small)
-
-        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5,5))
-        fgmask = cv2.morphologyEx(fgmask, cv2.MORPH_OPEN, kernel, iterations=1)
-        fgmask = cv2.morphologyEx(fgmask, cv2.MORPH_DILATE, kernel, iterations=2)
-
-        contours, _ = cv2.findContours(fgmask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-        for cnt in contours:
-            area = cv2.contourArea(cnt)
-            if area < MIN_CONTOUR_AREA:
-                continue
+            raise StopIteration
+        clock['seq'] += 1
+        return Packet(clock['seq'], frame)
 
-            x,y,w,h = cv2.boundingRect(cnt)
+    def detect_motion(packet):
+        frame = packet.frame
+        # Motion on a downscaled frame; boxes come back in full-resolution
+        # coordinates, largest first, capped so a busy frame is one forward pass
+        boxes = motion.detect(frame)
+        if output.needs_frames:
+            packet.mask = motion.mask.copy()
+        for _, (x, y, w, h) in boxes[:max_rois]:
             pad = 8
             x1 = max(0, x-pad); y1 = max(0, y-pad)
-            x2 = min(frame_small.shape[1], x+w+pad); y2 = min(frame_small.shape[0], y+h+pad)
-
-            roi = frame_small[y1:y2, x1:x2]
+            x2 = min(frame.shape[1], x+w+pad); y2 = min(frame.shape[0], y+h+pad)
+            roi = frame[y1:y2, x1:x2]
             if roi.size == 0:
                 continue
+            packet.rois.append(((x1, y1, x2, y2), roi))
+        return packet
 
-            # --- PREDICTION ---
-            pred_label = None
-            confidence = 0.0
+    def classify(packet):
+        rois = packet.rois
+        # Track regions across frames; only new or changed ones are classified
+        tracks = tracker.update([(x1, y1, x2-x1, y2-y1) for (x1, y1, x2, y2), _ in rois])
+        thumbs = [thumbnail(roi) for _, roi in rois]
+        todo = [i for i, (track, thumb) in enumerate(zip(tracks, thumbs)) if tracker.needs_classification(track, thumb)]
 
-            inp = preprocess_roi(roi, target_size=INPUT_SIZE)
-            preds = model.predict(inp, verbose=0)
-            
-            # This logic handles your 3-class model
-            if preds.shape[-1] > 1: 
-                probs = preds.ravel()
-                idx = int(np.argmax(probs))
-                pred_label = class_names[idx] if idx < len(class_names) else 'Unknown'
-                confidence = float(probs[idx])
-            else:
-                # Fallback for binary models
-                prob = float(preds.ravel()[0])
-                if prob >= 0.5:
-                    pred_label = class_names[1]
-                    confidence = prob
-                else:
-                    pred_label = class_names[0]
-                    confidence = 1.0 - prob
+        # --- PREDICTION (one call for all ROIs that need it) ---
+        if todo:
+            preds = model.predict(roi_batch.fill([rois[i][1] for i in todo]))
+            for i, row in zip(todo, preds):
+                # This logic handles your 3-class model (and binary models)
+                label, conf = decode_keras_output(row, class_names)
+                tracker.set_classification(tracks[i], label, conf, thumbs[i])
+
+        for ((x1, y1, x2, y2), roi), track in zip(rois, tracks):
+            pred_label, confidence = track.label, track.confidence
 
             # --- LOGIC FOR BOXES AND SNAPSHOTS ---
             
@@ -152,35 +228,71 @@ def main():
                     color = (0, 255, 0) # Green (BGR)
                 
                 # 2. Check for Snapshot
-                # Save snapshot only if it's a PEST and confidence is >= 80%
-                if is_pest and confidence >= SNAPSHOT_CONFIDENCE:
-                    snapshot = original.copy()
-                    # Draw the box on the snapshot before saving
-                    draw_labelled_box(snapshot, (x1, y1, x2-x1, y2-y1), pred_label.capitalize(), confidence, color=color)
-                    saved_path = save_snapshot(snapshot, pred_label, out_dir=SNAPSHOT_DIR)
-                    print(f"PEST DETECTED: Saved snapshot: {saved_path} (label={pred_label}, conf={confidence:.3f})")
-
-                # 3. Draw Box on Live Video
-                # Always draw if confidence is >= 60%
-                draw_labelled_box(original, (x1, y1, x2-x1, y2-y1), pred_label.capitalize(), confidence, color=color)
-
-        cv2.imshow("Mask", fgmask)
-        cv2.imshow("Detections", original)
-
-        key = cv2.waitKey(1) & 0xFF
+                # Save snapshot only if it's a PEST and confidence is >= 80%,
+                # once per track (and again only if its label changes), and not
+                # if it looks like a recent snapshot of that label
+                if is_pest and confidence >= SNAPSHOT_CONFIDENCE and track.reported != pred_label:
+                    track.reported = pred_label
+                    saved_path = None
+                    if snapshot_dedup.allow(pred_label, roi):
+                        snapshot = packet.frame.copy()
+                        # Draw the box on the snapshot before saving
+                        draw_labelled_box(snapshot, (x1, y1, x2-x1, y2-y1), pred_label.capitalize(), confidence, color=color)
+                        saved_path = save_snapshot(snapshot, pred_label, out_dir=SNAPSHOT_DIR, writer=snapshot_writer)
+                    print(f"PEST DETECTED: track #{track.id} label={pred_label}, conf={confidence:.3f}"
+                          + (f", saved snapshot: {saved_path}" if saved_path else ", no new snapshot"))
+
+                # 3. Box for the output stage (always if confidence is >= 60%)
+                packet.detections.append(((x1, y1, x2-x1, y2-y1), f"#{track.id} {pred_label.capitalize()}",
+                                          confidence, color))
+        packet.rois = None  # crops are views of the frame; nothing downstream needs them
+        return packet
+
+    last_readout = [time.monotonic()]
+
+    def render(packet):
+        now = time.monotonic()
+        if args.stats_every > 0 and now - last_readout[0] >= args.stats_every:
+            last_readout[0] = now
+            print(f"[pipeline] {pipeline.readout()}")
+        if not output.needs_frames:
+            return None
+        # ROIs were cropped from the clean frame upstream; boxes are drawn on it now
+        frame = packet.frame if args.output != "gui" else packet.frame.copy()
+        for box, label, confidence, color in packet.detections:
+            draw_labelled_box(frame, box, label, confidence, color=color)
+        key = output.write(frame, mask=packet.mask)
         if key == ord('q'):
-            break
+            pipeline.stop()
         
         # Press 's' to save a 'hygienic' snapshot for re-training
-        if key == ord('s'):
+        elif key == ord('s'):
             ts = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
             filename = f"manual_save_{ts}.jpg"
             save_path = os.path.join("dataset", "hygienic", filename)
-            cv2.imwrite(save_path, frame) # Save the *original* frame
+            cv2.imwrite(save_path, packet.frame) # Save the *original* frame
             print(f"SAVED: Manual snapshot to {save_path}")
+        return None
+
+    queue_size = max(1, args.queue_size)
+    pipeline = Pipeline([
+        Stage("capture", capture),
+        Stage("motion", detect_motion, queue_size=queue_size),
+        Stage("classify", classify, queue_size=queue_size),
+        Stage("output", render, queue_size=queue_size),
+    ])
+    try:
+        pipeline.run()
+    except KeyboardInterrupt:
+        pipeline.stop()
 
     cap.release()
-    cv2.destroyAllWindows()
+    output.close()
+    snapshot_writer.close()
+    print(f"Pipeline: {pipeline.readout()}")
+    print(f"Snapshots: {snapshot_writer.stats()}")
+    print(f"Snapshot dedup: {snapshot_dedup.stats()}")
+    print(f"Tracking: {tracker.stats()}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,12 +1,14 @@
 # realtime_api_v3_focused.py
 import cv2
 import io
+import os
 import time
-import threading
-from queue import Queue, Empty
+import argparse
 from typing import Tuple
 
-from google.cloud import vision
+from cascade import (ChangeGate, LocalScreen, CascadeGate, merge_detections, CLEAN_BELOW, TRUST_ABOVE,
+                     CHANGE_FRACTION, MAX_STALE_SECONDS)
+from vision_pool import VisionPool, WORKERS as VISION_WORKERS, BATCH_SIZE as VISION_BATCH_SIZE
 
 # ------------------ CONFIG (LOGIC FOCUSED) ------------------
 
@@ -35,7 +37,12 @@ API_CALL_INTERVAL_SECONDS = 1.5  # seconds between API calls
 
 # Frame preprocessing
 SEND_WIDTH = 640   # width to resize prior to sending to API
-MAX_QUEUE_SIZE = 2
+
+# Cascade (--cascade): the local model screens frames before Vision is asked
+LOCAL_BACKEND = "keras"
+LOCAL_MODEL_PATH = os.path.join("models", "insect_rat_model.keras")
+LOCAL_YOLO_PATH = os.path.join("runs", "train", "pest_detector_v1", "weights", "best.pt")
+LOCAL_CLASS_FILE = os.path.join("models", "class_names.txt")
 
 # ------------------ VISUALS ------------------
 FONT = cv2.FONT_HERSHEY_SIMPLEX
@@ -65,82 +72,160 @@ def draw_labelled_box(img, box, label, prob=None, color=(0,0,255)):
     cv2.rectangle(img, (x, y - th - baseline - 6), (x + tw + 6, y), color, -1)
     cv2.putText(img, text, (x + 3, y - 6), FONT, 0.6, (0,0,0), 1, cv2.LINE_AA)
 
-# ------------------ WORKER THREAD ------------------
-class VisionWorker(threading.Thread):
+def contaminant_detections(objects, img_w, img_h):
+    """Vision objects that are known contaminants, as detection dicts in frame coordinates."""
+    detections = []
+    for obj in objects:
+        try:
+            obj_name = getattr(obj, "name", "")
+            obj_score = getattr(obj, "score", 0.0)
+            if obj_score < OBJ_CONF_THRESHOLD:
+                continue # Ignore low-confidence detections
+
+            # Only known contaminants count; "Human", "Chair", "Food", etc.
+            # are not in UNHYGIENIC_KEYWORDS and are safely ignored.
+            if obj_name in UNHYGIENIC_KEYWORDS:
+                box = scale_box_from_normalized(obj.bounding_poly.normalized_vertices, img_w, img_h)
+                detections.append({"label": obj_name, "confidence": obj_score, "box": list(box), "source": "remote"})
+        except Exception as ex:
+            print("Error processing object:", ex)
+            continue
+    return detections
+
+class FrameEvaluator:
     """
-    Sends API requests in a separate thread to keep the webcam feed smooth.
-    This version ONLY calls object_localization.
+    The remote side of the main loop. step(frame, now) decides whether the
+    frame is evaluated (rate limit, ChangeGate, then the local screen and
+    CascadeGate if given), sends it to the Vision pool if needed and returns
+    the newest result. A frame the pool does not accept is not counted as a
+    call and does not become the ChangeGate reference, so the next frame is
+    tried again. detections(w, h) gives that result's contaminants.
     """
-    def __init__(self, client: vision.ImageAnnotatorClient, request_queue: Queue, result_queue: Queue):
-        super().__init__(daemon=True)
-        self.client = client
-        self.req_q = request_queue
-        self.res_q = result_queue
-        self.running = True
-
-    def run(self):
-        while self.running:
-            try:
-                payload = self.req_q.get(timeout=0.5)
-            except Empty:
-                continue
-            if payload is None:
-                break # Shutdown signal
-            
-            frame_bytes, meta = payload
-            try:
-                image = vision.Image(content=frame_bytes)
-                
-                # We ONLY call object_localization. No more "Label" detection.
-                response_objects = self.client.object_localization(image=image)
-                
-                if getattr(response_objects, "error", None) and response_objects.error.message:
-                    print(f"[VisionWorker] Object localization error: {response_objects.error.message}")
-                    localized_annotations = []
-                else:
-                    localized_annotations = response_objects.localized_object_annotations
-
-                out = {
-                    "timestamp": meta.get("timestamp"),
-                    "objects": localized_annotations,
-                }
-            except Exception as e:
-                print(f"[VisionWorker] Exception calling Vision API: {e}")
-                out = {"timestamp": meta.get("timestamp"), "objects": []}
-
-            try:
-                self.res_q.put_nowait(out)
-            except:
-                pass # Queue full, drop old result
-
-    def stop(self):
-        self.running = False
-        try:
-            self.req_q.put_nowait(None)
-        except:
-            pass
+    def __init__(self, pool, change_gate, screen=None, gate=None, interval=API_CALL_INTERVAL_SECONDS,
+                 send_width=SEND_WIDTH):
+        self.pool = pool
+        self.change_gate = change_gate
+        self.screen = screen
+        self.gate = gate
+        self.interval = float(interval)
+        self.send_width = int(send_width)
+        self.last_api_time = 0.0
+        self.last_result = {"seq": 0, "timestamp": 0, "objects": []}
+        self.seq = 0  # numbers every evaluated frame, so results are only ever replaced by newer ones
+
+    def _send(self, frame, now, local):
+        h, w = frame.shape[:2]
+        scale = self.send_width / float(w)
+        if scale < 1.0:
+            small = cv2.resize(frame, (self.send_width, int(h * scale)), interpolation=cv2.INTER_AREA)
+        else:
+            small = frame
+        is_success, buf = cv2.imencode(".jpg", small, [int(cv2.IMWRITE_JPEG_QUALITY), 75])
+        return is_success and self.pool.submit(buf.tobytes(), {"timestamp": now, "local": local}, seq=self.seq)
+
+    def step(self, frame, now):
+        # --- Send frame to the Vision pool (rate-limited) ---
+        if ((now - self.last_api_time) >= self.interval and self.pool.can_submit()
+                and self.change_gate.check(frame, now, commit=False)):
+            self.seq += 1
+            local = None
+            decision = 'remote'
+            if self.screen is not None:
+                # --- Cascade: the local model decides whether Vision is needed ---
+                score, local = self.screen.screen(frame)
+                decision = self.gate.decide(score)
+            if decision != 'remote':
+                # clean or trusted locally: no API call, the local result is used as is
+                self.last_result = {"seq": self.seq, "timestamp": now, "objects": [], "local": local,
+                                    "decision": decision}
+                self.last_api_time = now
+                self.change_gate.commit()
+            elif self._send(frame, now, local):
+                self.last_api_time = now
+                self.change_gate.commit()
+                if self.gate is not None:
+                    self.gate.sent()
+        return self.refresh()
+
+    def refresh(self):
+        """Take the pool's latest result if it is newer than the one shown."""
+        candidate = self.pool.latest()
+        if candidate is not None and candidate["seq"] > self.last_result["seq"]:
+            self.last_result = candidate
+        return self.last_result
+
+    def detections(self, img_w, img_h):
+        # 1. Only CONTAMINANTS count; the scene is hygienic until one is found
+        result = self.last_result or {}
+        remote = contaminant_detections(result.get("objects", []), img_w, img_h)
+        if self.screen is not None and result.get("local") is not None:
+            # 2. Merge with what the local model saw on the same frame
+            asked = "decision" not in result and not result.get("failed")
+            return merge_detections(result["local"], remote if asked else None)
+        return remote
 
 # ------------------ MAIN ------------------
 def main():
-    print("Starting Focused Hygiene Detector (Google Vision API)...")
-    try:
-        client = vision.ImageAnnotatorClient()
-    except Exception as e:
-        print(f"Failed to create Vision client. Ensure GOOGLE_APPLICATION_CREDENTIALS is set.\nError: {e}")
-        return
+    parser = argparse.ArgumentParser(description="Hygiene detector using the Google Vision API.")
+    parser.add_argument("--source", type=str, default="0", help="camera index or video file path")
+    parser.add_argument("--stub-vision", action="store_true", help="use the offline Vision stub (vision_stub.py)")
+    parser.add_argument("--stub-latency", type=float, default=0.3, help="simulated seconds per stub call")
+    parser.add_argument("--cascade", action="store_true",
+                        help="screen frames with the local model; only ask Vision when it is unsure or sees a pest")
+    parser.add_argument("--local-backend", type=str, default=LOCAL_BACKEND)
+    parser.add_argument("--local-model", type=str, default=LOCAL_MODEL_PATH)
+    parser.add_argument("--local-yolo", type=str, default=LOCAL_YOLO_PATH, help="YOLO weights, used if present")
+    parser.add_argument("--clean-below", type=float, default=CLEAN_BELOW,
+                        help="local pest score below which no remote call is made")
+    parser.add_argument("--trust-above", type=float, default=TRUST_ABOVE,
+                        help="local pest score at/above which the local result is used without a remote call")
+    parser.add_argument("--change-fraction", type=float, default=CHANGE_FRACTION,
+                        help="share of thumbnail pixels that must change before a frame is re-evaluated (0 = always)")
+    parser.add_argument("--max-stale", type=float, default=MAX_STALE_SECONDS,
+                        help="seconds after which a frame is re-evaluated even if the view did not change")
+    parser.add_argument("--vision-workers", type=int, default=VISION_WORKERS, help="concurrent Vision calls")
+    parser.add_argument("--vision-batch", type=int, default=VISION_BATCH_SIZE,
+                        help="max queued frames sent in one batch_annotate_images call")
+    args = parser.parse_args()
 
-    cap = cv2.VideoCapture(0)
+    print("Starting Focused Hygiene Detector (Google Vision API)...")
+    if args.stub_vision:
+        from vision_stub import StubVisionClient
+        client = StubVisionClient(latency=args.stub_latency)
+        print("Using the offline Vision stub.")
+    else:
+        try:
+            # imported here so --stub-vision works without google-cloud-vision installed
+            from google.cloud import vision
+            client = vision.ImageAnnotatorClient()
+        except Exception as e:
+            print(f"Failed to create Vision client. Ensure GOOGLE_APPLICATION_CREDENTIALS is set.\nError: {e}")
+            return
+
+    screen = gate = None
+    if args.cascade:
+        try:
+            screen = LocalScreen.load(args.local_backend, model_path=args.local_model, yolo_path=args.local_yolo,
+                                      class_file=LOCAL_CLASS_FILE)
+        except Exception as e:
+            print(f"Failed to load the local model for --cascade: {e}")
+            return
+        gate = CascadeGate(clean_below=args.clean_below, trust_above=args.trust_above)
+        print(f"Cascade on ({screen.kind}): Vision is asked for local pest scores in "
+              f"[{gate.clean_below:.2f}, {gate.trust_above:.2f})")
+
+    source = int(args.source) if args.source.isdigit() else args.source
+    cap = cv2.VideoCapture(source)
     if not cap.isOpened():
-        print("Could not open camera index 0.")
+        print(f"Could not open video source {args.source!r}.")
         return
 
-    req_q = Queue(maxsize=MAX_QUEUE_SIZE)
-    res_q = Queue(maxsize=MAX_QUEUE_SIZE)
-    worker = VisionWorker(client, req_q, res_q)
-    worker.start()
+    # Vision calls run concurrently and are batched when frames queue up
+    pool = VisionPool(client, workers=args.vision_workers, batch_size=args.vision_batch)
 
-    last_api_time = 0.0
-    last_result = {"timestamp": 0, "objects": []}
+    # Unchanged views are not re-sent (or re-screened); the last result is reused
+    change_gate = ChangeGate(fraction=args.change_fraction, max_stale=args.max_stale)
+    evaluator = FrameEvaluator(pool, change_gate, screen=screen, gate=gate)
 
     try:
         while True:
@@ -151,69 +236,20 @@ def main():
 
             display = frame.copy()
             h, w = display.shape[:2]
-            now = time.time()
-
-            # --- Send frame to worker (rate-limited) ---
-            if (now - last_api_time) >= API_CALL_INTERVAL_SECONDS:
-                scale = SEND_WIDTH / float(w)
-                if scale < 1.0:
-                    small = cv2.resize(frame, (SEND_WIDTH, int(h * scale)), interpolation=cv2.INTER_AREA)
-                else:
-                    small = frame.copy()
-                is_success, buf = cv2.imencode(".jpg", small, [int(cv2.IMWRITE_JPEG_QUALITY), 75])
-                if is_success:
-                    try:
-                        req_q.put_nowait((buf.tobytes(), {"timestamp": now}))
-                        last_api_time = now
-                    except:
-                        pass # Queue full
-
-            # --- Get latest result ---
-            try:
-                candidate = res_q.get_nowait()
-                last_result = candidate
-            except Empty:
-                pass # No new result, just re-use the last one
-
-            # ---------- NEW FOCUSED LOGIC ----------
-            
-            # 1. Assume hygienic until a CONTAMINANT is found
-            scene_is_hygienic = True
-            
-            objects_to_draw = [] # Store contaminants here
-            
-            objects = last_result.get("objects", []) if last_result else []
-            for obj in objects:
-                try:
-                    obj_name = getattr(obj, "name", "")
-                    obj_score = getattr(obj, "score", 0.0)
-                    if obj_score < OBJ_CONF_THRESHOLD:
-                        continue # Ignore low-confidence detections
-
-                    # 2. Check if the object is a known contaminant
-                    if obj_name in UNHYGIENIC_KEYWORDS:
-                        scene_is_hygienic = False # We found a pest!
-                        
-                        # Save the box details to draw later
-                        verts = obj.bounding_poly.normalized_vertices
-                        box = scale_box_from_normalized(verts, w, h)
-                        objects_to_draw.append((box, obj_name, obj_score))
-                    
-                    # 3. IF obj_name is "Human", "Chair", "Food", etc.,
-                    # it is NOT in UNHYGIENIC_KEYWORDS, so we do nothing.
-                    # It is completely and safely ignored.
-
-                except Exception as ex:
-                    print("Error processing object:", ex)
-                    continue
+            evaluator.step(frame, time.time())
+
+            # ---------- FOCUSED LOGIC ----------
+            detections = evaluator.detections(w, h)
+            scene_is_hygienic = not detections
             
             # --- Draw Results ---
             
-            # 4. Draw all the contaminant boxes we found
-            for box, name, score in objects_to_draw:
-                draw_labelled_box(display, box, f"UNHYGIENIC: {name}", prob=score, color=(0,0,255))
+            # 3. Draw all the contaminant boxes we found (orange: local model only)
+            for d in detections:
+                color = (0, 165, 255) if d["source"] == "local" else (0, 0, 255)
+                draw_labelled_box(display, tuple(d["box"]), f"UNHYGIENIC: {d['label']}", prob=d["confidence"], color=color)
 
-            # 5. Draw overall status
+            # 4. Draw overall status
             if scene_is_hygienic:
                 status_text = "Status: Hygienic"
                 status_color = (0, 255, 0) # Green
@@ -222,6 +258,10 @@ def main():
                 status_color = (0, 0, 255) # Red
 
             cv2.putText(display, status_text, STATUS_POS, FONT, STATUS_SCALE, status_color, STATUS_THICKNESS, cv2.LINE_AA)
+            if gate is not None:
+                g = gate.stats()
+                cv2.putText(display, f"Vision calls {g['remote_calls']} / avoided {g['avoided_clean'] + g['avoided_trusted']}",
+                            (STATUS_POS[0], STATUS_POS[1] + 30), FONT, 0.6, (255, 255, 255), 1, cv2.LINE_AA)
 
             cv2.imshow("Hygiene Detector (Focused API)", display)
 
@@ -233,11 +273,14 @@ def main():
         print("Interrupted by user.")
     finally:
         # shutdown
-        print("Shutting down worker...")
-        worker.stop()
-        worker.join(timeout=2.0)
+        print("Shutting down Vision workers...")
+        pool.stop()
         cap.release()
         cv2.destroyAllWindows()
+        print(f"Vision pool: {pool.stats()}")
+        print(f"Change gate: {change_gate.stats()}")
+        if gate is not None:
+            print(f"Cascade: {gate.stats()}")
         print("Exit.")
 
 if __name__ == "__main__":
@@ -0,0 +1,237 @@
+# snapshot_store.py
+import os
+import time
+import queue
+import threading
+from collections import OrderedDict, deque
+
+import cv2
+import numpy as np
+
+from utils import ensure_dir
+import metrics
+
+
+class SnapshotWriter:
+    """
+    Writes JPEG snapshots on a background thread and keeps an in-memory index
+    of the files in out_dir (oldest first), so lookups and quota enforcement
+    never scan the directory after start-up. The index is only authoritative
+    if this writer is the only one managing out_dir, so give each process its
+    own directory; exists() still checks the disk in case a file was removed
+    behind its back.
+
+    policy='drop'  -> save() returns None when the queue is full
+    policy='block' -> save() waits up to block_timeout for space, then drops
+    Set max_files / max_bytes to 0 to disable that limit.
+    """
+    def __init__(self, out_dir, max_files=1000, max_bytes=500 * 1024 * 1024,
+                 queue_size=64, policy='drop', block_timeout=2.0, jpeg_quality=90):
+        if policy not in ('drop', 'block'):
+            raise ValueError(f"Unknown snapshot queue policy: {policy}")
+        self.out_dir = out_dir
+        self.max_files = int(max_files)
+        self.max_bytes = int(max_bytes)
+        self.policy = policy
+        self.block_timeout = block_timeout
+        self.jpeg_quality = int(jpeg_quality)
+
+        self._queue = queue.Queue(maxsize=max(1, int(queue_size)))
+        self._lock = threading.Condition()
+        self._index = OrderedDict()  # filename -> size in bytes
+        self._pending = set()
+        self._bytes = 0
+
+        self.written = 0
+        self.dropped = 0
+        self.evicted = 0
+        self.errors = 0
+
+        ensure_dir(out_dir)
+        self._load_index()
+        self._enforce_quota()
+        self._thread = threading.Thread(target=self._loop, name="snapshot-writer", daemon=True)
+        self._thread.start()
+
+    def _load_index(self):
+        entries = []
+        for entry in os.scandir(self.out_dir):
+            if entry.is_file() and entry.name.lower().endswith(('.jpg', '.jpeg', '.png')):
+                st = entry.stat()
+                entries.append((st.st_mtime, entry.name, st.st_size))
+        for _, name, size in sorted(entries):
+            self._index[name] = size
+            self._bytes += size
+
+    def save(self, frame, filename):
+        """Queue frame to be written as out_dir/filename. Returns the path, or None if dropped."""
+        with self._lock:
+            self._pending.add(filename)
+        try:
+            if self.policy == 'block':
+                self._queue.put((frame, filename), timeout=self.block_timeout)
+            else:
+                self._queue.put_nowait((frame, filename))
+        except queue.Full:
+            with self._lock:
+                self._pending.discard(filename)
+                self.dropped += 1
+                self._lock.notify_all()
+            return None
+        return os.path.join(self.out_dir, filename)
+
+    def _loop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                break
+            frame, filename = item
+            try:
+                with metrics.stage('snapshot', 'imwrite'):
+                    ok, buf = cv2.imencode('.jpg', frame, [int(cv2.IMWRITE_JPEG_QUALITY), self.jpeg_quality])
+                    if not ok:
+                        raise ValueError("JPEG encode failed")
+                    data = buf.tobytes()
+                    with open(os.path.join(self.out_dir, filename), 'wb') as f:
+                        f.write(data)
+                with self._lock:
+                    if filename in self._index:
+                        self._bytes -= self._index.pop(filename)
+                    self._index[filename] = len(data)
+                    self._bytes += len(data)
+                    self.written += 1
+                self._enforce_quota()
+            except Exception as e:
+                self.errors += 1
+                print(f"[SnapshotWriter] Failed to write {filename}: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(filename)
+                    self._lock.notify_all()
+                self._queue.task_done()
+
+    def _over_quota(self):
+        return ((self.max_files > 0 and len(self._index) > self.max_files) or
+                (self.max_bytes > 0 and self._bytes > self.max_bytes))
+
+    def _enforce_quota(self):
+        while True:
+            with self._lock:
+                if not self._index or not self._over_quota():
+                    return
+                name, size = self._index.popitem(last=False)
+                self._bytes -= size
+                self.evicted += 1
+            try:
+                os.remove(os.path.join(self.out_dir, name))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                self.errors += 1
+                print(f"[SnapshotWriter] Failed to evict {name}: {e}")
+
+    def exists(self, filename, wait=0.0):
+        """True if filename is indexed and on disk; optionally wait for a queued write to land."""
+        with self._lock:
+            if filename in self._pending and wait > 0:
+                self._lock.wait_for(lambda: filename not in self._pending, wait)
+            if filename not in self._index:
+                return False
+            if os.path.exists(os.path.join(self.out_dir, filename)):
+                return True
+            # deleted outside this writer: forget it so the quota stays accurate
+            self._bytes -= self._index.pop(filename)
+            return False
+
+    def files(self):
+        """Indexed filenames, oldest first."""
+        with self._lock:
+            return list(self._index)
+
+    def flush(self):
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'files': len(self._index),
+                'bytes': self._bytes,
+                'max_files': self.max_files,
+                'max_bytes': self.max_bytes,
+                'queue_depth': self._queue.qsize(),
+                'policy': self.policy,
+                'written': self.written,
+                'dropped': self.dropped,
+                'evicted': self.evicted,
+                'errors': self.errors,
+            }
+
+
+def dhash(image, size=8):
+    """64-bit difference hash (size*size bits) of a BGR or grey image; near-duplicates differ in few bits."""
+    grey = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+    small = cv2.resize(grey, (size + 1, size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class SnapshotDeduper:
+    """
+    Decides whether a detection is worth a new snapshot. A save is suppressed
+    when the same label was saved less than cooldown seconds ago, or when the
+    region's dhash is within max_distance bits of one saved for that label in
+    the last memory seconds. At most index_size recent hashes are kept.
+    """
+    def __init__(self, max_distance=8, cooldown=10.0, memory=300.0, index_size=512):
+        self.max_distance = int(max_distance)
+        self.cooldown = float(cooldown)
+        self.memory = float(memory)
+        self._lock = threading.Lock()
+        self._recent = deque(maxlen=max(1, int(index_size)))  # (saved_at, label, hash), oldest first
+        self._last_saved = {}  # label -> time of the last allowed save
+        self.saved = 0
+        self.suppressed_cooldown = 0
+        self.suppressed_duplicate = 0
+        self.per_label = {}
+
+    def allow(self, label, image, now=None):
+        """True (and remembered as saved) if image should be written for label."""
+        now = time.monotonic() if now is None else now
+        h = dhash(image)
+        with self._lock:
+            counts = self.per_label.setdefault(label, {'saved': 0, 'suppressed': 0})
+            while self._recent and now - self._recent[0][0] > self.memory:
+                self._recent.popleft()
+            last = self._last_saved.get(label)
+            if last is not None and now - last < self.cooldown:
+                self.suppressed_cooldown += 1
+                counts['suppressed'] += 1
+                return False
+            if any(l == label and hamming(h, old) <= self.max_distance for _, l, old in self._recent):
+                self.suppressed_duplicate += 1
+                counts['suppressed'] += 1
+                return False
+            self._recent.append((now, label, h))
+            self._last_saved[label] = now
+            self.saved += 1
+            counts['saved'] += 1
+            return True
+
+    def stats(self):
+        with self._lock:
+            return {
+                'saved': self.saved,
+                'suppressed_cooldown': self.suppressed_cooldown,
+                'suppressed_duplicate': self.suppressed_duplicate,
+                'indexed_hashes': len(self._recent),
+                'per_label': {label: dict(c) for label, c in self.per_label.items()},
+            }
@@ -0,0 +1,236 @@
+# streaming.py
+import threading
+import time
+
+
+class FrameBroadcaster:
+    """
+    Runs one background producer and fans its latest output out to any number
+    of subscribers. produce() is called in a loop and should return encoded
+    frame bytes, or None when no frame is available.
+    Subscribers only ever see the newest frame, so slow clients skip frames
+    instead of queueing them. The producer idles while nobody is watching.
+    """
+    def __init__(self, produce, idle_sleep=0.5, name="frame-broadcaster"):
+        self.produce = produce
+        self.idle_sleep = idle_sleep
+        self.name = name
+        self._cond = threading.Condition()
+        self._frame = None
+        self._seq = 0
+        self._subscribers = 0
+        self._thread = None
+        self._running = False
+        self._fps = 0.0
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+    def _loop(self):
+        last = time.monotonic()
+        while True:
+            with self._cond:
+                while self._running and self._subscribers == 0:
+                    self._cond.wait()
+                if not self._running:
+                    break
+            try:
+                frame = self.produce()
+            except Exception:
+                frame = None
+            if frame is None:
+                time.sleep(self.idle_sleep)
+                continue
+            now = time.monotonic()
+            dt = now - last
+            last = now
+            if dt > 0:
+                self._fps = 0.9 * self._fps + 0.1 * (1.0 / dt)
+            with self._cond:
+                self._frame = frame
+                self._seq += 1
+                self._cond.notify_all()
+
+    def subscribe(self, timeout=5.0):
+        """Yield each new frame as it is published, skipping any missed ones."""
+        self.start()
+        with self._cond:
+            self._subscribers += 1
+            self._cond.notify_all()
+            seen = self._seq
+        try:
+            while self._running:
+                with self._cond:
+                    if self._seq == seen:
+                        self._cond.wait_for(lambda: self._seq != seen or not self._running, timeout)
+                    if self._seq == seen:
+                        continue
+                    seen = self._seq
+                    frame = self._frame
+                yield frame
+        finally:
+            with self._cond:
+                self._subscribers -= 1
+
+    def stats(self):
+        return {
+            'subscribers': self._subscribers,
+            'frames_published': self._seq,
+            'fps': round(self._fps, 2),
+        }
+
+
+class LatestFrameReader:
+    """
+    Reads a cv2.VideoCapture on its own thread and keeps only the newest frame,
+    so consumers never fall behind the camera or steal frames from each other.
+    """
+    def __init__(self, cap, name="frame-reader", on_read=None, notify=None):
+        self.cap = cap
+        self.name = name
+        self.on_read = on_read  # optional callback(seconds, ok) for metrics
+        self.notify = notify    # optional threading.Event set on every new frame
+        self._cond = threading.Condition()
+        self._frame = None
+        self._seq = 0
+        self._running = False
+        self._thread = None
+        self._fps = 0.0
+        self.failures = 0
+
+    def start(self):
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._running = True
+            self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+
+    def _loop(self):
+        last = time.monotonic()
+        while self._running:
+            t0 = time.perf_counter()
+            try:
+                ok, frame = self.cap.read()
+            except Exception:
+                ok, frame = False, None
+            if self.on_read is not None:
+                self.on_read(time.perf_counter() - t0, ok)
+            if not ok:
+                self.failures += 1
+                time.sleep(0.05)
+                continue
+            now = time.monotonic()
+            dt = now - last
+            last = now
+            if dt > 0:
+                self._fps = 0.9 * self._fps + 0.1 * (1.0 / dt)
+            with self._cond:
+                self._frame = frame
+                self._seq += 1
+                self._cond.notify_all()
+            if self.notify is not None:
+                self.notify.set()
+
+    def latest(self):
+        with self._cond:
+            return self._seq, self._frame
+
+    def wait(self, last_seq, timeout=1.0):
+        """Block until a frame newer than last_seq arrives; returns (seq, frame)."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._seq != last_seq or not self._running, timeout)
+            return self._seq, self._frame
+
+    @property
+    def fps(self):
+        return self._fps
+
+    def stats(self):
+        return {
+            'capture_fps': round(self._fps, 2),
+            'frames': self._seq,
+            'failures': self.failures,
+        }
+
+
+class InferenceGovernor:
+    """
+    Decides how many captured frames to skip between inferences.
+    The skip count is raised until inference uses at most cpu_budget of one
+    core (inference_seconds / wall_seconds) and the display keeps up with
+    target_fps; it is lowered again when there is headroom.
+    """
+    def __init__(self, target_fps=15.0, cpu_budget=0.5, max_skip=30):
+        self.target_fps = float(target_fps)
+        self.cpu_budget = max(0.01, float(cpu_budget))
+        self.max_skip = int(max_skip)
+        self.skip = 0
+        self._lock = threading.Lock()
+        self._infer_time = 0.0
+        self._infer_fps = 0.0
+        self._display_fps = 0.0
+        self._last_infer = None
+        self._last_display = None
+
+    def should_infer(self, frames_since_last):
+        """True when enough frames were captured since the last inference."""
+        with self._lock:
+            return frames_since_last > self.skip
+
+    def record_inference(self, seconds, capture_fps):
+        now = time.monotonic()
+        with self._lock:
+            self._infer_time = seconds if self._infer_time == 0 else 0.8 * self._infer_time + 0.2 * seconds
+            if self._last_infer is not None and now > self._last_infer:
+                self._infer_fps = 0.8 * self._infer_fps + 0.2 / (now - self._last_infer)
+            self._last_infer = now
+
+            # frames to skip so inference_time / inference_interval <= cpu_budget
+            fps = capture_fps if capture_fps > 0 else self.target_fps
+            budget_skip = max(0, int(self._infer_time * fps / self.cpu_budget + 0.999) - 1)
+            if self._display_fps and self._display_fps < 0.9 * self.target_fps:
+                skip = max(self.skip + 1, budget_skip)
+            else:
+                skip = max(self.skip - 1, budget_skip)
+            self.skip = min(self.max_skip, skip)
+
+    def wait_display_slot(self):
+        """Sleep so the display loop does not exceed target_fps, then record the frame."""
+        now = time.monotonic()
+        if self._last_display is not None and self.target_fps > 0:
+            delay = (1.0 / self.target_fps) - (now - self._last_display)
+            if delay > 0:
+                time.sleep(delay)
+                now = time.monotonic()
+        with self._lock:
+            if self._last_display is not None and now > self._last_display:
+                self._display_fps = 0.9 * self._display_fps + 0.1 / (now - self._last_display)
+            self._last_display = now
+
+    def stats(self):
+        with self._lock:
+            return {
+                'target_fps': self.target_fps,
+                'cpu_budget': self.cpu_budget,
+                'skip_frames': self.skip,
+                'inference_ms': round(self._infer_time * 1000.0, 1),
+                'inference_fps': round(self._infer_fps, 2),
+                'display_fps': round(self._display_fps, 2),
+            }
+
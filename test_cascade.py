@@ -0,0 +1,154 @@
+# test_cascade.py
+"""
+Runs realtime_google_api.FrameEvaluator (ChangeGate -> LocalScreen ->
+CascadeGate -> VisionPool) on a synthetic clip against the offline stub and
+checks how many remote calls it makes. No model, credentials or network
+needed:
+
+    python test_cascade.py
+"""
+import time
+
+import cv2
+import numpy as np
+
+from cascade import ChangeGate, LocalScreen, CascadeGate, CLEAN_BELOW
+from realtime_google_api import FrameEvaluator
+from vision_pool import VisionPool
+from vision_stub import StubVisionClient
+
+FPS = 10
+SECONDS = 60
+RAT_FRAMES = [range(100, 130), range(400, 420)]  # two 3 s / 2 s visits
+
+
+def synthetic_clip(seed=0):
+    """A static grey kitchen with sensor noise; a bright blob crosses it during RAT_FRAMES."""
+    rng = np.random.default_rng(seed)
+    background = np.full((240, 320, 3), 90, np.uint8)
+    cv2.rectangle(background, (20, 150), (300, 230), (60, 60, 60), -1)
+    for i in range(FPS * SECONDS):
+        frame = cv2.add(background, rng.integers(0, 6, background.shape, dtype=np.uint8))
+        for visit in RAT_FRAMES:
+            if i in visit:
+                x = 30 + 8 * (i - visit.start)
+                cv2.ellipse(frame, (x, 180), (22, 12), 0, 0, 360, (235, 235, 235), -1)
+        yield i, frame
+
+
+def bright_score(frame):
+    """Stand-in local model: pest score from the share of very bright pixels."""
+    grey = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    share = np.count_nonzero(grey > 200) / grey.size
+    score = min(1.0, share * 50)
+    h, w = frame.shape[:2]
+    return score, ([{'label': 'ratimages', 'confidence': score, 'box': [0, 0, w, h]}] if score >= 0.5 else [])
+
+
+class RejectingPool(VisionPool):
+    """A pool whose submit() turns frames away while reject is set, as when the breaker opens mid-tick."""
+    reject = False
+
+    def submit(self, content, meta=None, seq=None):
+        if self.reject:
+            self.rejected += 1
+            return None
+        return super().submit(content, meta, seq)
+
+
+def wait_idle(pool, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        s = pool.stats()
+        if not s['pending'] and s['images'] == s['submitted']:
+            return
+        time.sleep(0.001)
+    raise AssertionError(f"pool did not drain: {pool.stats()}")
+
+
+def make(change_fraction, cascade):
+    client = StubVisionClient(latency=0.0, per_image=0.0)
+    pool = RejectingPool(client, workers=1, batch_size=1)
+    change_gate = ChangeGate(fraction=change_fraction)
+    gate = CascadeGate(clean_below=CLEAN_BELOW) if cascade else None
+    screen = LocalScreen(bright_score, 'stub') if cascade else None
+    return client, pool, FrameEvaluator(pool, change_gate, screen=screen, gate=gate, interval=0)
+
+
+def step(evaluator, frame, now):
+    evaluator.step(frame, now)
+    wait_idle(evaluator.pool)  # the stub answers at once; take its result for this very frame
+    evaluator.refresh()
+    return evaluator.detections(frame.shape[1], frame.shape[0])
+
+
+def run(change_fraction, cascade):
+    client, pool, evaluator = make(change_fraction, cascade)
+    flagged = set()
+    try:
+        for i, frame in synthetic_clip():
+            if step(evaluator, frame, i / FPS):
+                flagged.add(i)
+    finally:
+        pool.stop()
+    return client, evaluator.change_gate, evaluator.gate, flagged
+
+
+def caught_both_visits(flagged):
+    return all(any(i in visit for i in flagged) for visit in RAT_FRAMES)
+
+
+def test_every_frame_without_gates():
+    client, _, _, flagged = run(change_fraction=0, cascade=False)
+    assert client.calls == FPS * SECONDS, client.calls
+    assert caught_both_visits(flagged)
+
+
+def test_change_gate_skips_static_frames():
+    client, change_gate, _, flagged = run(change_fraction=0.01, cascade=False)
+    stats = change_gate.stats()
+    # the empty scene is only re-sent every MAX_STALE_SECONDS; both visits still go out
+    assert client.calls == stats['passed_changed'] + stats['passed_stale']
+    assert client.calls < 0.2 * FPS * SECONDS, client.calls
+    assert caught_both_visits(flagged)
+
+
+def test_cascade_only_calls_for_suspect_frames():
+    client, _, gate, flagged = run(change_fraction=0, cascade=True)
+    stats = gate.stats()
+    assert stats['screened'] == FPS * SECONDS
+    assert client.calls == stats['remote_calls']
+    # clean frames never reach Vision; only frames showing the blob do
+    assert client.calls <= sum(len(v) for v in RAT_FRAMES), client.calls
+    assert caught_both_visits(flagged)
+
+
+def test_rejected_frame_is_retried_not_counted():
+    client, pool, evaluator = make(change_fraction=0.01, cascade=True)
+    try:
+        frames = dict(synthetic_clip())
+        first = RAT_FRAMES[0].start
+        step(evaluator, frames[0], 0.0)
+        pool.reject = True  # the pool turns the first rat frame away
+        assert not step(evaluator, frames[first], first / FPS)
+        stats = evaluator.gate.stats()
+        assert stats['remote_calls'] == 0 and stats['remote_not_sent'] == 1 and client.calls == 0
+        pool.reject = False
+        # the same view is still "changed" against the empty scene, so it goes out on the next tick
+        assert step(evaluator, frames[first], (first + 1) / FPS)
+        assert evaluator.gate.stats()['remote_calls'] == client.calls == 1
+    finally:
+        pool.stop()
+
+
+if __name__ == "__main__":
+    for name, flags in (('no gates', (0, False)), ('change gate', (0.01, False)), ('cascade', (0, True)),
+                        ('change gate + cascade', (0.01, True))):
+        client, change_gate, gate, flagged = run(*flags)
+        print(f"{name:<22} Vision calls {client.calls:>4} / {FPS * SECONDS} frames, "
+              f"both visits caught: {caught_both_visits(flagged)}")
+    test_every_frame_without_gates()
+    test_change_gate_skips_static_frames()
+    test_cascade_only_calls_for_suspect_frames()
+    test_rejected_frame_is_retried_not_counted()
+    print('\nSuccess')
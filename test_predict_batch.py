@@ -0,0 +1,122 @@
+# test_predict_batch.py
+"""
+Checks /api/predict_batch with broken uploads, the per-route upload cap and
+the reduced-decode scale reported by /api/predict_image,
+through Flask's test client with a fake model (no TensorFlow needed):
+
+    python test_predict_batch.py
+"""
+import io
+import json
+import tarfile
+import zipfile
+
+import cv2
+import numpy as np
+
+import app as server
+
+
+def png():
+    return cv2.imencode('.png', np.full((32, 32, 3), 128, np.uint8))[1].tobytes()
+
+
+def fake_predict_many(images):
+    return [([{'label': 'ratimages', 'confidence': 0.9, 'box': [0, 0, 8, 8]}], 'test') for _ in images]
+
+
+def post_batch(files):
+    server.models_loaded = True
+    server.predict_versioned_many = fake_predict_many
+    client = server.app.test_client()
+    data = {'images': [(io.BytesIO(content), name) for name, content in files]}
+    response = client.post('/api/predict_batch', data=data, content_type='multipart/form-data')
+    assert response.status_code == 200
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def zip_bytes():
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, 'w') as zf:
+        zf.writestr('a.png', png())
+        zf.writestr('b.png', png())
+    return buf.getvalue()
+
+
+def tar_gz_bytes():
+    buf = io.BytesIO()
+    with tarfile.open(fileobj=buf, mode='w:gz') as tf:
+        for name in ('a.png', 'b.png'):
+            content = png()
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            tf.addfile(info, io.BytesIO(content))
+    return buf.getvalue()
+
+
+def test_corrupt_archives_report_an_error_and_continue():
+    good_zip = zip_bytes()
+    bad_zip = good_zip[:4] + b'\0' * 64  # zip magic, garbage after it
+    truncated_tar = tar_gz_bytes()[:60]
+    lines = post_batch([('bad.zip', bad_zip), ('cut.tar.gz', truncated_tar), ('ok.png', png()),
+                        ('good.zip', good_zip)])
+    by_name = {line.get('name'): line for line in lines if 'name' in line}
+    assert 'error' in by_name['bad.zip'] and 'error' in by_name['cut.tar.gz'], lines
+    assert by_name['ok.png']['predictions'] and by_name['good.zip/a.png']['predictions']
+    assert lines[-1]['summary']['images'] == 5 and lines[-1]['summary']['errors'] == 2
+
+
+def test_oversized_plain_upload_is_not_read_whole():
+    limit = server.UPLOAD_MAX_BYTES
+    server.UPLOAD_MAX_BYTES = 1024
+    try:
+        lines = post_batch([('big.png', b'\x89PNG' + b'\0' * 4096)])
+    finally:
+        server.UPLOAD_MAX_BYTES = limit
+    assert lines[0] == {'name': 'big.png', 'error': 'Image too large'}
+    assert lines[-1]['summary']['errors'] == 1
+
+
+def test_chunked_upload_to_single_image_route_is_capped():
+    server.models_loaded = True
+    client = server.app.test_client()
+    body = (b'--x\r\nContent-Disposition: form-data; name="image"; filename="a.jpg"\r\n\r\n'
+            + b'\0' * (server.UPLOAD_MAX_BYTES + 1) + b'\r\n--x--\r\n')
+    response = client.post('/api/predict_image', input_stream=io.BytesIO(body),
+                           headers={'Transfer-Encoding': 'chunked',
+                                    'Content-Type': 'multipart/form-data; boundary=x'},
+                           environ_overrides={'wsgi.input_terminated': True})  # as gunicorn sets for chunked bodies
+    assert response.status_code == 413, response.status_code
+
+
+def test_reduced_decode_reports_its_scale():
+    server.models_loaded = True
+    seen = []
+    predict, model_type = server.predict, server.model_type
+    server.predict = lambda img: (seen.append(img.shape) or [{'label': 'ratimages', 'confidence': 0.9,
+                                                              'box': [10, 10, 20, 20]}], 'test')
+    server.model_type = 'Keras'
+    try:
+        jpeg = cv2.imencode('.jpg', np.full((2000, 3000, 3), 128, np.uint8))[1].tobytes()
+        response = server.app.test_client().post('/api/predict_image', content_type='multipart/form-data',
+                                                 data={'image': (io.BytesIO(jpeg), 'big.jpg')})
+    finally:
+        server.predict, server.model_type = predict, model_type
+    result = response.get_json()
+    scale = result['decode_scale']
+    assert seen[0][1] == 3000 * scale < 3000, (seen, scale)
+    # boxes are in upload coordinates; the snapshot is decode_scale times that size
+    assert result['image_size'] == [3000, 2000]
+    assert result['predictions'][0]['box'] == [round(10 / scale)] * 2 + [round(20 / scale)] * 2
+
+
+if __name__ == "__main__":
+    test_corrupt_archives_report_an_error_and_continue()
+    print('Corrupt archives: ok')
+    test_oversized_plain_upload_is_not_read_whole()
+    print('Oversized upload: ok')
+    test_chunked_upload_to_single_image_route_is_capped()
+    print('Chunked upload cap: ok')
+    test_reduced_decode_reports_its_scale()
+    print('Decode scale: ok')
+    print('\nSuccess')
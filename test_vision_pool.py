@@ -0,0 +1,103 @@
+# test_vision_pool.py
+"""
+Exercises VisionPool against the offline stub: batching of queued frames,
+ordered results, retries of transient errors and the circuit breaker's
+closed -> open -> half-open -> closed cycle. No credentials needed:
+
+    python test_vision_pool.py
+"""
+import time
+
+import cv2
+import numpy as np
+
+import vision_pool
+from vision_pool import VisionPool, CircuitBreaker
+from vision_stub import StubVisionClient
+
+
+def jpeg(bright=True):
+    img = np.full((120, 160, 3), 60, np.uint8)
+    if bright:
+        cv2.circle(img, (80, 60), 20, (240, 240, 240), -1)
+    return cv2.imencode('.jpg', img)[1].tobytes()
+
+
+def wait_for(predicate, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def test_queued_frames_are_batched_in_order():
+    client = StubVisionClient(latency=0.2, per_image=0.0)
+    pool = VisionPool(client, workers=1, batch_size=8, max_pending=32)
+    try:
+        first = pool.submit(jpeg(), {'source': 'cam'})
+        time.sleep(0.05)  # the worker is busy with the first frame while the rest queue up
+        seqs = [pool.submit(jpeg(), {'source': 'cam'}) for _ in range(8)]
+        assert wait_for(lambda: pool.stats()['images'] == 9)
+        stats = pool.stats()
+        assert client.calls == stats['batches'] == 2, stats
+        assert stats['mean_batch'] == 4.5
+        latest = pool.latest('cam')
+        assert latest['seq'] == seqs[-1] > first and not latest['failed']
+        assert latest['objects'][0].name == 'Rat'
+    finally:
+        pool.stop()
+
+
+def test_transient_errors_are_retried():
+    vision_pool.BACKOFF_BASE, base = 0.01, vision_pool.BACKOFF_BASE
+    client = StubVisionClient(latency=0.0, per_image=0.0, error_rate=0.5, seed=3)
+    pool = VisionPool(client, workers=2, batch_size=1, retries=5, breaker=CircuitBreaker(failures=100))
+    try:
+        for _ in range(20):
+            pool.submit(jpeg())
+            time.sleep(0.02)
+        assert wait_for(lambda: pool.stats()['images'] == 20)
+        stats = pool.stats()
+        # every error is retried, except the last of a batch that ran out of retries
+        assert stats['retries'] > 0 and client.errors == stats['retries'] + stats['failed'], (stats, client.errors)
+        assert client.calls == stats['images'] + stats['retries']
+        assert stats['failed'] < 20
+    finally:
+        pool.stop()
+        vision_pool.BACKOFF_BASE = base
+
+
+def test_breaker_opens_and_recovers():
+    client = StubVisionClient(latency=0.0, per_image=0.0, error_rate=1.0)
+    breaker = CircuitBreaker(failures=2, reset=0.3)
+    pool = VisionPool(client, workers=1, batch_size=1, retries=0, breaker=breaker)
+    try:
+        for _ in range(2):
+            pool.submit(jpeg(), {'source': 'cam'})
+            assert wait_for(lambda: client.calls == pool.stats()['batches'] and not pool.stats()['pending'])
+        assert breaker.state == 'open' and breaker.opened == 1
+        assert pool.latest('cam')['failed']
+        calls = client.calls
+        assert pool.submit(jpeg()) is None  # rejected without a call while open
+        assert pool.stats()['rejected_breaker_open'] == 1 and client.calls == calls
+
+        assert wait_for(lambda: breaker.state == 'half-open', 2.0)
+        client.error_rate = 0.0  # the API is back: the one trial call succeeds
+        seq = pool.submit(jpeg(), {'source': 'cam'})
+        assert wait_for(lambda: pool.latest('cam')['seq'] == seq)
+        assert breaker.state == 'closed' and not pool.latest('cam')['failed']
+        assert client.calls == calls + 1
+    finally:
+        pool.stop()
+
+
+if __name__ == "__main__":
+    test_queued_frames_are_batched_in_order()
+    print('Batching and ordering: ok')
+    test_transient_errors_are_retried()
+    print('Retries: ok')
+    test_breaker_opens_and_recovers()
+    print('Circuit breaker: ok')
+    print('\nSuccess')
@@ -0,0 +1,123 @@
+# tracking.py
+import cv2
+
+THUMB_SIZE = (16, 16)  # grey thumbnail used to notice appearance changes
+
+
+def iou(a, b):
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    ix = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    iy = max(0, min(ay + ah, by + bh) - max(ay, by))
+    inter = ix * iy
+    union = aw * ah + bw * bh - inter
+    return inter / float(union) if union > 0 else 0.0
+
+
+def thumbnail(roi):
+    grey = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY) if roi.ndim == 3 else roi
+    return cv2.resize(grey, THUMB_SIZE, interpolation=cv2.INTER_AREA)
+
+
+class Track:
+    __slots__ = ('id', 'box', 'label', 'confidence', 'thumb', 'classified_at', 'age', 'misses', 'reported')
+
+    def __init__(self, track_id, box):
+        self.id = track_id
+        self.box = box
+        self.label = None
+        self.confidence = 0.0
+        self.thumb = None          # appearance when last classified
+        self.classified_at = None  # frame number of the last classification
+        self.age = 0
+        self.misses = 0
+        self.reported = None       # label last raised as an event for this track
+
+
+class RoiTracker:
+    """
+    Greedy IoU tracker over motion boxes (x, y, w, h), with a centroid
+    fallback for small fast-moving blobs. Each track caches its last label;
+    needs_classification() says when it is worth running the model again:
+    for a new track, every reclassify_every frames, or once its grey
+    thumbnail has drifted by appearance_change (mean absolute level, 0-255).
+    """
+    def __init__(self, iou_threshold=0.3, max_misses=10, reclassify_every=15, appearance_change=25.0):
+        self.iou_threshold = iou_threshold
+        self.max_misses = max_misses
+        self.reclassify_every = max(1, int(reclassify_every))
+        self.appearance_change = float(appearance_change)
+        self.tracks = []
+        self.frame_no = 0
+        self._next_id = 1
+        self.classifications = 0
+        self.reused = 0
+
+    def update(self, boxes):
+        """Match this frame's boxes to tracks; returns one Track per box, in order."""
+        self.frame_no += 1
+        pairs = []
+        for ti, t in enumerate(self.tracks):
+            for bi, b in enumerate(boxes):
+                score = iou(t.box, b)
+                if score < self.iou_threshold:
+                    # centroid fallback: close relative to the object's size
+                    tx, ty = t.box[0] + t.box[2] / 2.0, t.box[1] + t.box[3] / 2.0
+                    bx, by = b[0] + b[2] / 2.0, b[1] + b[3] / 2.0
+                    reach = 0.5 * max(t.box[2], t.box[3], b[2], b[3])
+                    dist = ((tx - bx) ** 2 + (ty - by) ** 2) ** 0.5
+                    if dist > reach:
+                        continue
+                    score = self.iou_threshold * (1.0 - dist / reach) * 0.99
+                pairs.append((score, ti, bi))
+        pairs.sort(reverse=True)
+
+        assigned = [None] * len(boxes)
+        used = set()
+        for _, ti, bi in pairs:
+            if ti in used or assigned[bi] is not None:
+                continue
+            used.add(ti)
+            track = self.tracks[ti]
+            track.box = boxes[bi]
+            track.misses = 0
+            track.age += 1
+            assigned[bi] = track
+
+        for ti, t in enumerate(self.tracks):
+            if ti not in used:
+                t.misses += 1
+        self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+
+        for bi, b in enumerate(boxes):
+            if assigned[bi] is None:
+                track = Track(self._next_id, b)
+                self._next_id += 1
+                self.tracks.append(track)
+                assigned[bi] = track
+        return assigned
+
+    def needs_classification(self, track, thumb):
+        if track.classified_at is None or self.frame_no - track.classified_at >= self.reclassify_every:
+            return True
+        changed = float(cv2.absdiff(thumb, track.thumb).mean()) >= self.appearance_change
+        if not changed:
+            self.reused += 1
+        return changed
+
+    def set_classification(self, track, label, confidence, thumb):
+        track.label = label
+        track.confidence = confidence
+        track.thumb = thumb
+        track.classified_at = self.frame_no
+        self.classifications += 1
+
+    def stats(self):
+        total = self.classifications + self.reused
+        return {
+            'active_tracks': len(self.tracks),
+            'tracks_seen': self._next_id - 1,
+            'classifications': self.classifications,
+            'reused': self.reused,
+            'reuse_ratio': round(self.reused / total, 3) if total else 0.0,
+        }
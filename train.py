@@ -4,14 +4,23 @@ import matplotlib.pyplot as plt
 import numpy as np
 from sklearn.metrics import confusion_matrix, classification_report
 import tensorflow as tf
-from model import build_classifier
+from model import (build_classifier, build_augmentation, build_feature_extractor, build_head,
+                   copy_head_weights, FEATURE_DIM)
+from feature_cache import FeatureCache
+import dataset_cache
 from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint, ReduceLROnPlateau
 
-def prepare_datasets(data_dir, img_size=(224,224), batch_size=16, val_split=0.2, seed=1337):
+def prepare_datasets(data_dir, img_size=(224,224), batch_size=16, val_split=0.2, seed=1337, image_cache=None):
     """
-    Uses tf.keras.utils.image_dataset_from_directory to read folders directly.
+    Uses tf.keras.utils.image_dataset_from_directory to read folders directly,
+    or, with image_cache, a decode-once store (see dataset_cache.py) that is
+    updated for new or changed files first.
     Returns train_ds, val_ds, class_names
     """
+    if image_cache:
+        dataset_cache.build(data_dir, image_cache, img_size=img_size)
+        return dataset_cache.load_datasets(image_cache, batch_size=batch_size, val_split=val_split, seed=seed)
+
     class_names = sorted([d for d in os.listdir(data_dir) if os.path.isdir(os.path.join(data_dir, d))])
     num_classes = len(class_names)
     label_mode = 'binary' if num_classes == 2 else 'categorical'
@@ -40,6 +49,87 @@ def prepare_datasets(data_dir, img_size=(224,224), batch_size=16, val_split=0.2,
     val_ds = val_ds.prefetch(buffer_size=AUTOTUNE)
     return train_ds, val_ds, class_names
 
+def split_files(data_dir, val_split=0.2, seed=1337, image_cache=None):
+    """
+    The same train/validation split of file paths that prepare_datasets uses.
+    Returns (train_paths, val_paths, class_names); labels follow from each
+    file's class folder.
+    """
+    if image_cache:
+        return dataset_cache.split_paths(image_cache, val_split=val_split, seed=seed)
+
+    def paths(subset):
+        ds = tf.keras.preprocessing.image_dataset_from_directory(
+            data_dir, validation_split=val_split, subset=subset, seed=seed, label_mode='int')
+        return list(ds.file_paths), ds.class_names
+    train_paths, class_names = paths("training")
+    val_paths, _ = paths("validation")
+    return train_paths, val_paths, class_names
+
+def _labels(paths, class_names):
+    idx = np.array([class_names.index(os.path.basename(os.path.dirname(p))) for p in paths])
+    if len(class_names) == 2:
+        return idx.astype('float32')[:, None]
+    return np.eye(len(class_names), dtype='float32')[idx]
+
+def cache_features(cache, paths, copies, img_size=(224,224), batch_size=32):
+    """
+    Compute the frozen backbone's pooled features for every path that is new
+    or changed since the last run: the original (copy 0) and copies-1 fixed
+    augmented versions, each image decoded once.
+    """
+    todo = cache.missing(paths, copies)
+    if not todo:
+        return
+    print(f"Computing backbone features for {len(todo)} of {len(paths)} images ({copies} copies each)...")
+    extractor = build_feature_extractor(input_shape=img_size + (3,))
+    augment = build_augmentation()
+
+    def load(path):
+        img = tf.image.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+        return tf.image.resize(img, img_size)  # bilinear, like image_dataset_from_directory
+
+    for start in range(0, len(todo), batch_size):
+        chunk = todo[start:start + batch_size]
+        images = tf.stack([load(path) for path, _ in chunk])
+        for c in sorted({c for _, need in chunk for c in need}):
+            batch = images if c == 0 else augment(images, training=True)
+            feats = extractor(batch, training=False).numpy()
+            for (path, need), vec in zip(chunk, feats):
+                if c in need:
+                    cache.put(path, c, vec)
+        cache.save()
+
+def train_head_cached(args, model, class_names, callbacks):
+    """
+    Stage 1 on cached features: the head is trained on pooled backbone
+    features (originals + augmented copies) instead of re-running the frozen
+    backbone on every image each epoch. Its weights are then copied into
+    model, which is saved to args.model_out.
+    """
+    train_paths, val_paths, _ = split_files(args.data_dir, image_cache=args.image_cache)
+    copies = 1 + max(0, args.aug_copies)
+    cache = FeatureCache(args.feature_cache, FEATURE_DIM)
+    cache.prune(train_paths + val_paths)
+    cache_features(cache, train_paths, copies)
+    cache_features(cache, val_paths, 1)
+    cache.save()
+    print(f"Feature cache: {cache.stats()}")
+
+    x_train = np.concatenate([cache.get(train_paths, c) for c in range(copies)])
+    y_train = np.concatenate([_labels(train_paths, class_names)] * copies)
+    x_val = cache.get(val_paths, 0)
+    y_val = _labels(val_paths, class_names)
+
+    head = build_head(dropout=0.5, num_classes=len(class_names))
+    stage1_epochs = min(args.stage1_epochs, args.epochs)
+    print(f"Training head on cached features for {stage1_epochs} epochs...")
+    history = head.fit(x_train, y_train, validation_data=(x_val, y_val), epochs=stage1_epochs,
+                       batch_size=args.batch_size, shuffle=True, callbacks=callbacks)
+    copy_head_weights(head, model)
+    model.save(args.model_out)
+    return history
+
 def plot_history(history, out_dir="models"):
     import os
     ensure = lambda p: os.makedirs(p, exist_ok=True)
@@ -112,10 +202,16 @@ def main():
     parser.add_argument("--batch_size", type=int, default=16)
     parser.add_argument("--unfreeze_at", type=int, default=40, help="number of layers from end of backbone to unfreeze (40 is good)")
     parser.add_argument("--model_out", type=str, default="models/insect_rat_model.keras")
+    parser.add_argument("--image_cache", type=str, default=None,
+                        help="decode and resize images once into this folder and train from it (e.g. models/image_cache)")
+    parser.add_argument("--feature_cache", type=str, default=None,
+                        help="train stage 1 on backbone features cached in this folder (e.g. models/feature_cache)")
+    parser.add_argument("--aug_copies", type=int, default=4, help="augmented copies per image in the feature cache")
     args = parser.parse_args()
 
     # Prepare data
-    train_ds, val_ds, class_names = prepare_datasets(args.data_dir, batch_size=args.batch_size)
+    train_ds, val_ds, class_names = prepare_datasets(args.data_dir, batch_size=args.batch_size,
+                                                     image_cache=args.image_cache)
 
     # Build model
     num_classes = len(class_names)
@@ -129,13 +225,21 @@ def main():
 
     # Train head first (stage 1)
     stage1_epochs = min(args.stage1_epochs, args.epochs)
-    print(f"Training head for {stage1_epochs} epochs...")
-    history1 = model.fit(
-        train_ds,
-        validation_data=val_ds,
-        epochs=stage1_epochs,
-        callbacks=[checkpoint, early, reduce_lr]
-    )
+    if args.feature_cache:
+        history1 = train_head_cached(args, model, class_names, callbacks=[early, reduce_lr])
+        # stage 2 only overwrites the saved stage-1 model when it beats it; EarlyStopping restored the
+        # lowest-val_loss epoch, so measure the weights actually saved rather than the best val_accuracy seen
+        _, stage1_acc = model.evaluate(val_ds, verbose=0)
+        print(f"Stage 1 model val_accuracy: {stage1_acc:.4f}")
+        checkpoint.best = stage1_acc
+    else:
+        print(f"Training head for {stage1_epochs} epochs...")
+        history1 = model.fit(
+            train_ds,
+            validation_data=val_ds,
+            epochs=stage1_epochs,
+            callbacks=[checkpoint, early, reduce_lr]
+        )
 
     # If total epochs greater than stage1, unfreeze tail of backbone and fine-tune
     if args.epochs > stage1_epochs:
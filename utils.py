@@ -23,13 +23,17 @@ def draw_labelled_box(frame, box, label, prob=None, color=(0,255,0), thickness=2
     cv2.rectangle(frame, (x, y-20), (x+tw+6, y), color, -1)
     cv2.putText(frame, text, (x+3, y-6), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0,0,0), 1, cv2.LINE_AA)
 
-def save_snapshot(frame, label, out_dir="snapshots"):
+def save_snapshot(frame, label, out_dir="snapshots", writer=None):
     """
     Save snapshot to out_dir with timestamp and label in filename.
+    If a SnapshotWriter is given, the write is queued on its background
+    thread instead (returns None if the writer dropped it).
     """
-    ensure_dir(out_dir)
     ts = datetime.now().strftime("%Y%m%d_%H%M%S_%f")[:-3]
     filename = f"{ts}_{label}.jpg"
+    if writer is not None:
+        return writer.save(frame, filename)
+    ensure_dir(out_dir)
     path = os.path.join(out_dir, filename)
     # write with reasonable JPEG quality
     cv2.imwrite(path, frame, [int(cv2.IMWRITE_JPEG_QUALITY), 90])
@@ -43,4 +47,83 @@ def preprocess_roi(roi, target_size=(224,224)):
     roi_rgb = cv2.cvtColor(roi, cv2.COLOR_BGR2RGB)
     roi_resized = cv2.resize(roi_rgb, target_size, interpolation=cv2.INTER_AREA)
     arr = np.asarray(roi_resized).astype('float32')
-    return np.expand_dims(arr, axis=0)
\ No newline at end of file
+    return np.expand_dims(arr, axis=0)
+
+def preprocess_into(img, out, target_size=(224,224), scratch=None):
+    """
+    Resize a BGR image once (INTER_AREA) and write it as RGB into out,
+    a preallocated (H, W, 3) slot of the model's float32 input batch.
+    scratch, if given, is a reusable uint8 (H, W, 3) buffer for the resize.
+    """
+    resized = cv2.resize(img, target_size, dst=scratch, interpolation=cv2.INTER_AREA)
+    # channel flip and float cast in one pass, straight into the batch slot
+    out[...] = resized[..., ::-1]
+    return out
+
+def jpeg_dimensions(data):
+    """
+    Read (width, height) from a JPEG's SOF header without decoding it.
+    Returns None for non-JPEG or malformed data.
+    """
+    if len(data) < 4 or data[0] != 0xFF or data[1] != 0xD8:
+        return None
+    i = 2
+    n = len(data)
+    while i + 9 < n:
+        if data[i] != 0xFF:
+            i += 1
+            continue
+        marker = data[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            i += 2
+            continue
+        seg_len = (data[i + 2] << 8) | data[i + 3]
+        # SOF0..SOF15, excluding DHT (C4), JPG (C8) and DAC (CC)
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            h = (data[i + 5] << 8) | data[i + 6]
+            w = (data[i + 7] << 8) | data[i + 8]
+            return (w, h) if w and h else None
+        i += 2 + seg_len
+    return None
+
+_REDUCED_FLAGS = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2))
+
+def decode_image(data, min_size=None):
+    """
+    Decode image bytes to BGR. For JPEGs much larger than min_size=(w, h),
+    let libjpeg decode at 1/2, 1/4 or 1/8 scale, keeping both sides >= min_size.
+    Returns (image, (orig_w, orig_h)); image is None if decoding failed.
+    """
+    buf = np.frombuffer(data, np.uint8)
+    dims = jpeg_dimensions(data) if min_size else None
+    flag = cv2.IMREAD_COLOR
+    if dims:
+        w, h = dims
+        for factor, reduced in _REDUCED_FLAGS:
+            if w // factor >= min_size[0] and h // factor >= min_size[1]:
+                flag = reduced
+                break
+    img = cv2.imdecode(buf, flag)
+    if img is None:
+        return None, None
+    dh, dw = img.shape[:2]
+    if not dims or flag == cv2.IMREAD_COLOR:
+        return img, (dw, dh)
+    w, h = dims
+    # EXIF rotation may have swapped the axes relative to the header
+    if (dw > dh) != (w > h):
+        w, h = h, w
+    return img, (w, h)
+
+def scale_predictions(predictions, sx, sy):
+    """Map prediction boxes (x, y, w, h) by per-axis scale factors."""
+    if sx == 1 and sy == 1:
+        return predictions
+    scaled = []
+    for p in predictions:
+        x, y, w, h = p['box']
+        scaled.append(dict(p, box=[int(round(x * sx)), int(round(y * sy)), int(round(w * sx)), int(round(h * sy))]))
+    return scaled
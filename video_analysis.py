@@ -0,0 +1,322 @@
+# video_analysis.py
+"""
+Offline analysis of recorded video. A dedicated thread decodes the file and
+samples frames by stride and, optionally, by scene change; the samples are
+run through the detector in batches and folded into a compact timeline of
+detection intervals instead of per-frame output.
+
+    python video_analysis.py kitchen_cam2.mp4 --sample-fps 2 --scene-threshold 8 --out timeline.json
+"""
+import os
+import json
+import time
+import queue
+import argparse
+import itertools
+import threading
+
+import cv2
+
+SAMPLE_FPS = 2.0          # default frames analysed per second of video
+MIN_CONFIDENCE = 0.6      # detections below this are left out of the timeline
+SCENE_SIZE = (64, 36)     # thumbnail compared for scene-change sampling
+
+
+class FrameSampler:
+    """
+    Decodes a video on its own thread and queues (index, seconds, frame) for
+    every stride-th frame. With scene_threshold > 0 a sample whose thumbnail
+    differs from the last analysed one by less than that mean absolute grey
+    level (0-255) is queued with frame=None, meaning "unchanged", unless
+    max_gap_seconds have passed. Frames in between are only grabbed, not
+    converted.
+    """
+    def __init__(self, path, stride=None, sample_fps=SAMPLE_FPS, scene_threshold=0.0,
+                 max_gap_seconds=10.0, queue_size=32):
+        self.path = path
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise ValueError(f"Could not open video {path!r}")
+        fps = self.cap.get(cv2.CAP_PROP_FPS)
+        self.fps = fps if fps and fps > 0 else 25.0
+        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT) or 0)
+        self.stride = max(1, int(stride or round(self.fps / max(sample_fps, 1e-3))))
+        self.scene_threshold = float(scene_threshold or 0.0)
+        self.max_gap_seconds = float(max_gap_seconds)
+        self.frames_read = 0
+        self.frames_sampled = 0
+        self.frames_skipped_static = 0
+        self.error = None
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="video-decoder", daemon=True)
+
+    @property
+    def duration(self):
+        return self.frame_count / self.fps if self.frame_count else None
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def close(self, timeout=2.0):
+        """Stop decoding and release the capture, whether or not start() was ever called."""
+        self._stop.set()
+        if self._thread.ident is not None:
+            self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self.cap.release()
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _loop(self):
+        last_thumb = None
+        last_time = None
+        index = -1
+        try:
+            while not self._stop.is_set():
+                if not self.cap.grab():
+                    break
+                index += 1
+                self.frames_read += 1
+                if index % self.stride:
+                    continue
+                ok, frame = self.cap.retrieve()
+                if not ok:
+                    continue
+                t = index / self.fps
+                if self.scene_threshold > 0:
+                    thumb = cv2.cvtColor(cv2.resize(frame, SCENE_SIZE, interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2GRAY)
+                    changed = last_thumb is None or float(cv2.absdiff(thumb, last_thumb).mean()) >= self.scene_threshold
+                    if not changed and t - last_time < self.max_gap_seconds:
+                        self.frames_skipped_static += 1
+                        if not self._put((index, t, None)):
+                            break
+                        continue
+                    last_thumb = thumb
+                last_time = t
+                self.frames_sampled += 1
+                if not self._put((index, t, frame)):
+                    break
+        except Exception as e:
+            self.error = str(e)
+        finally:
+            self.cap.release()
+            self._put(None)
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            yield item
+
+
+class Timeline:
+    """
+    Folds per-sample detections into intervals per label. A label's interval
+    stays open while it keeps being seen within gap seconds.
+    """
+    def __init__(self, gap, min_confidence=MIN_CONFIDENCE, ignore=lambda label: False):
+        self.gap = float(gap)
+        self.min_confidence = float(min_confidence)
+        self.ignore = ignore
+        self._open = {}
+        self.intervals = []
+
+    def add(self, t, predictions):
+        best = {}
+        for p in predictions:
+            label, conf = p['label'], float(p['confidence'])
+            if conf < self.min_confidence or self.ignore(label):
+                continue
+            best[label] = max(conf, best.get(label, 0.0))
+        for label, conf in best.items():
+            iv = self._open.get(label)
+            if iv is not None and t - iv['end'] > self.gap:
+                self._close(label)
+                iv = None
+            if iv is None:
+                iv = self._open[label] = {'label': label, 'start': t, 'end': t, 'samples': 0,
+                                          'max_confidence': 0.0, '_sum': 0.0}
+            iv['end'] = t
+            iv['samples'] += 1
+            iv['_sum'] += conf
+            iv['max_confidence'] = max(iv['max_confidence'], conf)
+        for label in [l for l, iv in self._open.items() if t - iv['end'] > self.gap]:
+            self._close(label)
+
+    def _close(self, label):
+        iv = self._open.pop(label)
+        conf_sum = iv.pop('_sum')
+        iv['mean_confidence'] = round(conf_sum / iv['samples'], 4)
+        iv['max_confidence'] = round(iv['max_confidence'], 4)
+        iv['start'] = round(iv['start'], 3)
+        iv['end'] = round(iv['end'], 3)
+        self.intervals.append(iv)
+
+    def finish(self):
+        for label in list(self._open):
+            self._close(label)
+        self.intervals.sort(key=lambda iv: (iv['start'], iv['label']))
+        return self.intervals
+
+
+def analyze(path, predict_many, batch_size=8, stride=None, sample_fps=SAMPLE_FPS, scene_threshold=0.0,
+            min_confidence=MIN_CONFIDENCE, ignore=lambda label: False, progress_every=1.0):
+    """
+    Analyse one video file. Returns a generator that yields ('progress', dict)
+    about every progress_every seconds, then ('result', dict) with the
+    timeline. predict_many(frames) must return one prediction list per frame.
+    Raises ValueError right away if the file cannot be opened.
+    """
+    sampler = FrameSampler(path, stride=stride, sample_fps=sample_fps, scene_threshold=scene_threshold)
+    return run(sampler, predict_many, batch_size, min_confidence, ignore, progress_every)
+
+
+def run(sampler, predict_many, batch_size=8, min_confidence=MIN_CONFIDENCE, ignore=lambda label: False,
+        progress_every=1.0):
+    """
+    Like analyze() on an already opened FrameSampler. The caller keeps the
+    sampler and should close() it when done, since a generator that is never
+    started never runs its own cleanup.
+    """
+    # a detection survives a couple of missed samples before its interval closes
+    gap = max(1.0, 2.5 * sampler.stride / sampler.fps)
+    timeline = Timeline(gap, min_confidence=min_confidence, ignore=ignore)
+    t0 = time.perf_counter()
+    last_report = t0
+    inferred = 0
+    position = 0.0
+
+    def progress():
+        elapsed = time.perf_counter() - t0
+        return {
+            'frames_read': sampler.frames_read,
+            'frames_sampled': sampler.frames_sampled,
+            'frames_inferred': inferred,
+            'position_seconds': round(position, 2),
+            'duration_seconds': round(sampler.duration, 2) if sampler.duration else None,
+            'elapsed_seconds': round(elapsed, 2),
+            'decode_fps': round(sampler.frames_read / elapsed, 1) if elapsed > 0 else 0.0,
+            'speedup': round(position / elapsed, 1) if elapsed > 0 else 0.0,
+        }
+
+    sampler.start()
+    try:
+        pending = []   # samples in order, including unchanged ones
+        frames = 0     # samples in pending that need inference
+        last_preds = []
+        # a trailing None flushes the last, partial batch
+        for item in itertools.chain(sampler, [None]):
+            if item is not None:
+                pending.append(item)
+                if item[2] is not None:
+                    frames += 1
+                if frames < batch_size and len(pending) < 16 * batch_size:
+                    continue
+            if not pending:
+                continue
+            outputs = iter(predict_many([frame for _, _, frame in pending if frame is not None]) if frames else [])
+            for _, t, frame in pending:
+                if frame is not None:
+                    last_preds = next(outputs)
+                # an unchanged scene keeps the last analysed frame's detections
+                timeline.add(t, last_preds)
+            inferred += frames
+            position = pending[-1][1]
+            pending = []
+            frames = 0
+            now = time.perf_counter()
+            if now - last_report >= progress_every:
+                last_report = now
+                yield 'progress', progress()
+    finally:
+        sampler.stop()
+
+    if sampler.duration:
+        position = sampler.duration
+    summary = progress()
+    summary.update({
+        'video': os.path.basename(sampler.path),
+        'fps': round(sampler.fps, 3),
+        'stride': sampler.stride,
+        'scene_threshold': sampler.scene_threshold,
+        'frames_skipped_static': sampler.frames_skipped_static,
+        'error': sampler.error,
+    })
+    yield 'result', {'summary': summary, 'timeline': timeline.finish()}
+
+
+# ------------------ CLI ------------------
+def main():
+    from backends import BACKENDS, load_backend
+    from inference import InputBuffer, keras_boxes, yolo_boxes
+
+    parser = argparse.ArgumentParser(description="Scan a recorded video for pests and print a detection timeline.")
+    parser.add_argument("video", help="video file to analyse")
+    parser.add_argument("--backend", type=str, default="keras", choices=BACKENDS, help="classifier backend")
+    parser.add_argument("--model", type=str, default=None, help="model file for the chosen backend")
+    parser.add_argument("--yolo", type=str, default=None, help="YOLO weights; used instead of the classifier")
+    parser.add_argument("--classes", type=str, default=os.path.join("models", "class_names.txt"))
+    parser.add_argument("--stride", type=int, default=None, help="analyse every Nth frame (default: from --sample-fps)")
+    parser.add_argument("--sample-fps", type=float, default=SAMPLE_FPS)
+    parser.add_argument("--scene-threshold", type=float, default=0.0,
+                        help="only analyse samples whose scene changed by this mean grey level (0 = off)")
+    parser.add_argument("--min-confidence", type=float, default=MIN_CONFIDENCE)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--out", type=str, default=None, help="write the JSON result here")
+    args = parser.parse_args()
+
+    if args.yolo:
+        from ultralytics import YOLO
+        model = YOLO(args.yolo)
+
+        def predict_many(frames):
+            return yolo_boxes(model(frames, conf=args.min_confidence, verbose=False), model.names)
+    else:
+        model = load_backend(args.backend, path=args.model)
+        names = ['hygienic', 'insects', 'ratimages']
+        if os.path.exists(args.classes):
+            with open(args.classes, 'r', encoding='utf-8') as f:
+                names = [line.strip() for line in f.readlines() if line.strip()]
+        buffer = InputBuffer((224, 224), capacity=args.batch_size)
+
+        def predict_many(frames):
+            return keras_boxes(model.predict(buffer.fill(frames)), frames, names)
+
+    result = None
+    for kind, payload in analyze(args.video, predict_many, batch_size=args.batch_size, stride=args.stride,
+                                 sample_fps=args.sample_fps, scene_threshold=args.scene_threshold,
+                                 min_confidence=args.min_confidence, ignore=lambda label: 'hygi' in label.lower()):
+        if kind == 'progress':
+            dur = payload['duration_seconds']
+            pct = f"{100.0 * payload['position_seconds'] / dur:5.1f}%" if dur else f"{payload['position_seconds']:.0f}s"
+            print(f"{pct}  decoded {payload['decode_fps']} fps, {payload['speedup']}x real time")
+        else:
+            result = payload
+
+    for iv in result['timeline']:
+        print(f"{iv['start']:9.2f}s - {iv['end']:9.2f}s  {iv['label']:<12} max {iv['max_confidence']*100:.1f}%  "
+              f"mean {iv['mean_confidence']*100:.1f}%  ({iv['samples']} samples)")
+    s = result['summary']
+    print(f"{s['frames_read']} frames read, {s['frames_inferred']} analysed in {s['elapsed_seconds']}s "
+          f"({s['speedup']}x real time)")
+    if args.out:
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2)
+        print(f"Saved timeline to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
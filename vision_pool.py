@@ -0,0 +1,262 @@
+# vision_pool.py
+"""
+Concurrent client side for the Google Vision API. Several worker threads
+take queued frames and send whatever is waiting (up to batch_size) as one
+batch_annotate_images call. Transient errors are retried with jittered
+exponential backoff; repeated failures open a circuit breaker so a broken
+API is not hammered. Every frame gets a sequence number, and latest() only
+ever moves forward, so a slow call finishing late cannot replace a newer
+result.
+"""
+import random
+import threading
+import time
+from collections import deque
+
+try:
+    from google.cloud import vision
+except ImportError:  # the offline stub (vision_stub.py) takes plain dicts
+    vision = None
+
+WORKERS = 2
+BATCH_SIZE = 8          # frames per batch_annotate_images call (the API allows 16)
+MAX_PENDING = 8         # queued frames; the oldest is dropped beyond this
+RETRIES = 3             # extra attempts for a transient error
+BACKOFF_BASE = 0.5      # seconds; attempt n waits uniform(0, base * 2**n), capped
+BACKOFF_MAX = 8.0
+BREAKER_FAILURES = 3    # consecutive failed batches that open the breaker
+BREAKER_RESET = 30.0    # seconds the breaker stays open before one trial batch
+
+
+def _transient_types():
+    types = [ConnectionError, TimeoutError]
+    try:
+        from google.api_core import exceptions as gexc
+        types += [gexc.ServiceUnavailable, gexc.DeadlineExceeded, gexc.ResourceExhausted,
+                  gexc.InternalServerError, gexc.GatewayTimeout]
+    except ImportError:
+        pass
+    return tuple(types)
+
+
+TRANSIENT_ERRORS = _transient_types()
+
+
+def annotate_request(content):
+    """One object-localization request for batch_annotate_images."""
+    feature = vision.Feature.Type.OBJECT_LOCALIZATION if vision is not None else 'OBJECT_LOCALIZATION'
+    return {'image': {'content': content}, 'features': [{'type_': feature}]}
+
+
+class CircuitBreaker:
+    """closed -> open after `failures` consecutive failures; half-open (one trial) after reset seconds."""
+    def __init__(self, failures=BREAKER_FAILURES, reset=BREAKER_RESET):
+        self.failures = int(failures)
+        self.reset = float(reset)
+        self._lock = threading.Lock()
+        self._consecutive = 0
+        self._opened_at = None
+        self._trial = False
+        self.opened = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state(time.monotonic())
+
+    def _state(self, now):
+        if self._opened_at is None:
+            return 'closed'
+        return 'half-open' if now - self._opened_at >= self.reset else 'open'
+
+    def allow(self):
+        """True if a call may go out now; in half-open only one trial call is allowed."""
+        with self._lock:
+            state = self._state(time.monotonic())
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def accepting(self):
+        """Like allow() but without claiming the half-open trial."""
+        with self._lock:
+            state = self._state(time.monotonic())
+            return state == 'closed' or (state == 'half-open' and not self._trial)
+
+    def record(self, ok):
+        with self._lock:
+            self._trial = False
+            if ok:
+                self._consecutive = 0
+                self._opened_at = None
+                return
+            self._consecutive += 1
+            # reaching the threshold opens the breaker; a failed trial re-opens it
+            if self._opened_at is not None or self._consecutive >= self.failures:
+                if self._opened_at is None:
+                    self.opened += 1
+                self._opened_at = time.monotonic()
+
+
+class VisionPool:
+    """
+    submit(content, meta, seq) queues a JPEG and returns its sequence number
+    (or None if the breaker is open); pass seq to number frames yourself, in
+    increasing order per source. latest(source) returns the newest completed
+    result for meta['source'] as {'seq', 'timestamp', 'objects', 'failed', ...meta}.
+    """
+    def __init__(self, client, workers=WORKERS, batch_size=BATCH_SIZE, max_pending=MAX_PENDING,
+                 retries=RETRIES, breaker=None, name="vision"):
+        self.client = client
+        self.batch_size = max(1, min(16, int(batch_size)))
+        self.max_pending = max(1, int(max_pending))
+        self.retries = max(0, int(retries))
+        self.breaker = breaker or CircuitBreaker()
+        self._cond = threading.Condition()
+        self._pending = deque()
+        self._latest = {}
+        self._seq = 0
+        self._running = True
+        self.submitted = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.batches = 0
+        self.images = 0
+        self.retried = 0
+        self.failed = 0
+        self.stale = 0
+        self._latency = 0.0
+        self._threads = [threading.Thread(target=self._loop, name=f"{name}-{i}", daemon=True)
+                         for i in range(max(1, int(workers)))]
+        for t in self._threads:
+            t.start()
+
+    def can_submit(self):
+        with self._cond:
+            return self._running and len(self._pending) < self.max_pending and self.breaker.accepting()
+
+    def submit(self, content, meta=None, seq=None):
+        with self._cond:
+            if not self.breaker.accepting():
+                self.rejected += 1
+                return None
+            if seq is None:
+                self._seq += 1
+                seq = self._seq
+            if len(self._pending) >= self.max_pending:
+                self._pending.popleft()
+                self.dropped += 1
+            self._pending.append((seq, content, dict(meta or {})))
+            self.submitted += 1
+            self._cond.notify()
+            return seq
+
+    def latest(self, source=None):
+        with self._cond:
+            return self._latest.get(source)
+
+    def _take(self):
+        with self._cond:
+            while self._running and not self._pending:
+                self._cond.wait(0.5)
+            if not self._running:
+                return []
+            n = min(self.batch_size, len(self._pending))
+            return [self._pending.popleft() for _ in range(n)]
+
+    def _call(self, batch):
+        requests = [annotate_request(content) for _, content, _ in batch]
+        attempt = 0
+        while True:
+            try:
+                return self.client.batch_annotate_images(requests=requests).responses
+            except TRANSIENT_ERRORS as e:
+                if attempt >= self.retries or not self._running:
+                    raise
+                delay = random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+                attempt += 1
+                with self._cond:
+                    self.retried += 1
+                print(f"[VisionPool] transient error ({type(e).__name__}: {e}); retry {attempt} in {delay:.2f}s")
+                time.sleep(delay)
+
+    def _loop(self):
+        while self._running:
+            batch = self._take()
+            if not batch:
+                continue
+            if not self.breaker.allow():
+                # breaker opened while these waited: they fail without a call
+                with self._cond:
+                    self.rejected += len(batch)
+                self._publish(batch, None)
+                continue
+            t0 = time.perf_counter()
+            try:
+                responses = self._call(batch)
+                self.breaker.record(True)
+            except Exception as e:
+                self.breaker.record(False)
+                with self._cond:
+                    self.failed += len(batch)
+                print(f"[VisionPool] batch of {len(batch)} failed: {type(e).__name__}: {e}")
+                responses = None
+            seconds = time.perf_counter() - t0
+            with self._cond:
+                self.batches += 1
+                self.images += len(batch)
+                self._latency = seconds if self._latency == 0 else 0.8 * self._latency + 0.2 * seconds
+            self._publish(batch, responses)
+
+    def _publish(self, batch, responses):
+        with self._cond:
+            for i, (seq, _, meta) in enumerate(batch):
+                out = dict(meta)
+                out['seq'] = seq
+                out.setdefault('timestamp', None)
+                response = responses[i] if responses is not None else None
+                error = getattr(getattr(response, 'error', None), 'message', '') if response is not None else ''
+                if response is None or error:
+                    if error:
+                        print(f"[VisionPool] Object localization error: {error}")
+                    out['objects'] = []
+                    out['failed'] = True
+                else:
+                    out['objects'] = list(response.localized_object_annotations)
+                    out['failed'] = False
+                source = meta.get('source')
+                current = self._latest.get(source)
+                if current is not None and current['seq'] > seq:
+                    self.stale += 1  # a newer frame already finished
+                    continue
+                self._latest[source] = out
+
+    def stop(self, timeout=2.0):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout=timeout)
+
+    def stats(self):
+        with self._cond:
+            return {
+                'workers': len(self._threads),
+                'batch_size': self.batch_size,
+                'pending': len(self._pending),
+                'submitted': self.submitted,
+                'dropped': self.dropped,
+                'rejected_breaker_open': self.rejected,
+                'batches': self.batches,
+                'images': self.images,
+                'mean_batch': round(self.images / self.batches, 2) if self.batches else 0.0,
+                'latency_ms': round(self._latency * 1000.0, 1),
+                'retries': self.retried,
+                'failed': self.failed,
+                'stale_discarded': self.stale,
+                'breaker': self.breaker.state,
+                'breaker_opened': self.breaker.opened,
+            }
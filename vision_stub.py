@@ -0,0 +1,74 @@
+# vision_stub.py
+"""
+Offline stand-in for google.cloud.vision.ImageAnnotatorClient, for trying
+realtime_google_api.py without credentials or API cost:
+
+    python realtime_google_api.py --stub-vision --cascade --source kitchen.mp4
+
+object_localization() and batch_annotate_images() report every bright blob
+in the image as a "Rat" after a simulated network delay (latency per call,
+plus per_image for each image in a batch, plus up to jitter), fail with
+ConnectionError at error_rate, and count the calls and images they receive.
+"""
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+
+class StubVisionClient:
+    def __init__(self, latency=0.3, per_image=0.02, jitter=0.0, error_rate=0.0, label="Rat",
+                 brightness=200, min_area=0.005, seed=None):
+        self.latency = float(latency)
+        self.per_image = float(per_image)
+        self.jitter = float(jitter)
+        self.error_rate = float(error_rate)
+        self.label = label
+        self.brightness = int(brightness)
+        self.min_area = float(min_area)  # fraction of the image
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.images = 0
+        self.errors = 0
+
+    def _network(self, images):
+        with self._lock:
+            self.calls += 1
+            self.images += images
+            delay = self.latency + self.per_image * images + self._random.uniform(0, self.jitter)
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+        time.sleep(delay)
+        if fail:
+            raise ConnectionError("stub: simulated transient failure")
+
+    def object_localization(self, image):
+        self._network(1)
+        return self._localize(image.content)
+
+    def batch_annotate_images(self, requests):
+        self._network(len(requests))
+        return SimpleNamespace(responses=[self._localize(r['image']['content']) for r in requests])
+
+    def _localize(self, content):
+        img = cv2.imdecode(np.frombuffer(content, np.uint8), cv2.IMREAD_GRAYSCALE)
+        objects = []
+        if img is not None:
+            h, w = img.shape[:2]
+            _, mask = cv2.threshold(img, self.brightness, 255, cv2.THRESH_BINARY)
+            contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+            for cnt in contours:
+                if cv2.contourArea(cnt) < self.min_area * w * h:
+                    continue
+                x, y, bw, bh = cv2.boundingRect(cnt)
+                score = float(img[y:y + bh, x:x + bw].mean()) / 255.0
+                verts = [SimpleNamespace(x=vx / w, y=vy / h)
+                         for vx, vy in ((x, y), (x + bw, y), (x + bw, y + bh), (x, y + bh))]
+                objects.append(SimpleNamespace(name=self.label, score=score,
+                                               bounding_poly=SimpleNamespace(normalized_vertices=verts)))
+        return SimpleNamespace(error=SimpleNamespace(message=""), localized_object_annotations=objects)
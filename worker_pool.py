@@ -0,0 +1,447 @@
+# worker_pool.py
+"""
+Pool of model worker processes. Each worker loads its own copy of the model
+with its own thread settings. Decoded frames are passed through
+shared-memory slots instead of being pickled; only the slot number, image
+shape and the small prediction lists cross the process boundary.
+"""
+import os
+import sys
+import time
+import types
+import queue
+import threading
+import multiprocessing as mp
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from multiprocessing.connection import wait as wait_connections
+
+import numpy as np
+import cv2
+
+from utils import scale_predictions
+from model_registry import file_state, version_id
+
+RESTART_BACKOFF = 1.0       # seconds before the first restart of a dead worker; doubles per retry
+RESTART_BACKOFF_MAX = 60.0
+MAX_RESTARTS = 5            # consecutive restarts without reaching 'ready' before a worker is given up
+
+
+# ------------------ WORKER PROCESS ------------------
+def _set_thread_env(threads):
+    for var in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS',
+                'TF_NUM_INTRAOP_THREADS'):
+        os.environ[var] = str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+    cv2.setNumThreads(1)
+
+
+def _load_model(config):
+    """Load YOLO if its weights exist, otherwise the configured classifier backend."""
+    threads = config['threads']
+    if config.get('yolo_path') and os.path.exists(config['yolo_path']):
+        try:
+            from ultralytics import YOLO
+            import torch
+            torch.set_num_threads(threads)
+            model = YOLO(config['yolo_path'])
+            names = model.names
+            label_list = list(names.values()) if hasattr(names, 'values') else list(names)
+            info = {'model_type': 'YOLO', 'backend': 'ultralytics', 'classes': label_list,
+                    'version': version_id('YOLO', 'ultralytics', file_state([config['yolo_path']]))}
+            return 'YOLO', model, names, info
+        except ImportError:
+            pass
+
+    from backends import load_backend
+    backend = load_backend(config['backend'], path=config.get('keras_path'), num_threads=threads)
+    if backend.name == 'keras':
+        try:
+            import tensorflow as tf
+            tf.config.threading.set_intra_op_parallelism_threads(threads)
+            tf.config.threading.set_inter_op_parallelism_threads(1)
+        except Exception:
+            pass  # already initialised
+    names = list(config['default_names'])
+    class_file = config.get('class_file')
+    if class_file and os.path.exists(class_file):
+        with open(class_file, 'r', encoding='utf-8') as f:
+            names = [line.strip() for line in f.readlines() if line.strip()]
+    info = {'model_type': 'Keras', 'backend': backend.name, 'classes': names,
+            'version': version_id('Keras', backend.name, file_state([backend.path, class_file or '']))}
+    return 'Keras', backend, names, info
+
+
+def _load_warm(config):
+    kind, model, names, info = _load_model(config)
+    # one throwaway pass so 'ready' means warm, not just loaded
+    w, h = config['input_size']
+    if kind == 'YOLO':
+        model(np.zeros((h, w, 3), np.uint8), verbose=False)
+    else:
+        model.predict(np.zeros((1, h, w, 3), np.float32))
+    return kind, model, names, info
+
+
+def _worker_main(worker_id, config, slot_names, conn):
+    _set_thread_env(config['threads'])
+    from inference import InputBuffer, keras_boxes, yolo_boxes
+
+    try:
+        kind, model, names, info = _load_warm(config)
+    except Exception as e:
+        conn.send(('failed', worker_id, str(e)))
+        return
+    conn.send(('ready', worker_id, info))
+
+    shms = [shared_memory.SharedMemory(name=n) for n in slot_names]
+    input_buffer = InputBuffer(tuple(config['input_size']), capacity=config['max_batch'])
+    control = None
+    try:
+        while control is None:
+            try:
+                task = conn.recv()
+            except EOFError:
+                break
+            tasks = []
+            if isinstance(task, tuple):
+                tasks.append(task)
+            else:
+                control = task or 'stop'
+            # opportunistically batch whatever else is already waiting
+            while control is None and len(tasks) < config['max_batch'] and conn.poll():
+                nxt = conn.recv()
+                if isinstance(nxt, tuple):
+                    tasks.append(nxt)
+                else:
+                    control = nxt or 'stop'
+
+            if tasks:
+                images = [np.ndarray(shape, dtype=np.uint8, buffer=shms[slot].buf) for _, slot, shape in tasks]
+                try:
+                    if kind == 'YOLO':
+                        results = model(images, conf=config['conf'], verbose=False)
+                        outputs = yolo_boxes(results, names)
+                    else:
+                        outputs = keras_boxes(model.predict(input_buffer.fill(images)), images, names)
+                    for (task_id, _, _), preds in zip(tasks, outputs):
+                        conn.send(('result', task_id, preds, None, info['version']))
+                except Exception as e:
+                    for task_id, _, _ in tasks:
+                        conn.send(('result', task_id, None, str(e), info['version']))
+                del images
+
+            if control == 'reload':
+                # everything queued before the reload ran on the old model above
+                control = None
+                try:
+                    kind, model, names, info = _load_warm(config)
+                    conn.send(('ready', worker_id, info))
+                except Exception as e:
+                    conn.send(('reload_failed', worker_id, str(e)))
+    finally:
+        for shm in shms:
+            shm.close()
+
+
+# ------------------ DISPATCHER ------------------
+class _Worker:
+    __slots__ = ('process', 'conn', 'send_lock', 'inflight', 'ready', 'version', 'reload_error')
+
+    def __init__(self, process, conn):
+        self.process = process
+        self.conn = conn
+        self.send_lock = threading.Lock()
+        self.inflight = set()
+        self.ready = False
+        self.version = None
+        self.reload_error = None
+
+
+class ModelWorkerPool:
+    """
+    Dispatches BGR images to num_workers model processes, each over its own
+    pipe, to whichever ready worker has the fewest images in flight.
+    num_slots shared-memory buffers of slot_bytes each bound the number of
+    in-flight images; images larger than a slot are downscaled to fit and their
+    boxes scaled back. Dead workers are restarted and their in-flight
+    requests failed. Futures resolve to (predictions, model_version).
+    """
+    def __init__(self, config, num_workers=2, threads_per_worker=1, num_slots=None,
+                 slot_bytes=16 * 1024 * 1024, max_batch=4):
+        self.num_workers = max(1, int(num_workers))
+        self.config = dict(config, threads=max(1, int(threads_per_worker)), max_batch=max(1, int(max_batch)))
+        self.slot_bytes = int(slot_bytes)
+        num_slots = int(num_slots or self.num_workers * self.config['max_batch'] * 2)
+
+        self._ctx = mp.get_context('spawn')  # never fork a process that may hold TF/torch state
+        self._slots = [shared_memory.SharedMemory(create=True, size=self.slot_bytes) for _ in range(num_slots)]
+        self._free = queue.Queue()
+        for i in range(num_slots):
+            self._free.put(i)
+
+        self._lock = threading.Condition()
+        self._inflight = {}  # task_id -> (future, slot, scale, worker_id)
+        self._next_id = 0
+        self._workers = [None] * self.num_workers
+        self.info = None
+        self.failure = None
+        self._failed = set()  # workers whose model failed to load, or that kept dying
+        self._restart_count = [0] * self.num_workers  # consecutive restarts since the worker was last ready
+        self._restart_due = {}  # worker_id -> monotonic time its replacement is spawned
+        self.completed = 0
+        self.errors = 0
+        self.restarts = 0
+        self._running = True
+
+        for i in range(self.num_workers):
+            self._spawn(i)
+        self._collector = threading.Thread(target=self._collect, name="pool-collector", daemon=True)
+        self._collector.start()
+
+    def _spawn(self, worker_id):
+        parent_conn, child_conn = self._ctx.Pipe()
+        p = self._ctx.Process(target=_worker_main, name=f"model-worker-{worker_id}",
+                              args=(worker_id, self.config, [s.name for s in self._slots], child_conn),
+                              daemon=True)
+        # spawn re-runs the parent's __main__ (e.g. app.py and all its start-up
+        # side effects) in the child; workers only need this module, so hide it
+        main = sys.modules['__main__']
+        sys.modules['__main__'] = types.ModuleType('__main__')
+        try:
+            p.start()
+        finally:
+            sys.modules['__main__'] = main
+        child_conn.close()
+        with self._lock:
+            self._workers[worker_id] = _Worker(p, parent_conn)
+
+    @property
+    def ready(self):
+        return any(w is not None and w.ready for w in self._workers)
+
+    def wait_ready(self, timeout=None):
+        """True once a worker is ready; False if every worker failed to load (see failure) or on timeout."""
+        with self._lock:
+            self._lock.wait_for(lambda: self.ready or self.failure is not None, timeout)
+        return self.ready
+
+    def submit(self, img, timeout=30.0):
+        """Queue one BGR image; returns a Future resolving to (predictions, model_version)."""
+        if not self._running:
+            raise RuntimeError("Worker pool is closed")
+        img = np.ascontiguousarray(img, dtype=np.uint8)
+        scale = 1.0
+        if img.nbytes > self.slot_bytes:
+            scale = (self.slot_bytes / float(img.nbytes)) ** 0.5 * 0.99
+            h, w = img.shape[:2]
+            img = cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+        slot = self._take_slot(timeout)
+        view = np.ndarray(img.shape, dtype=np.uint8, buffer=self._slots[slot].buf)
+        view[...] = img
+        del view
+        fut = Future()
+        with self._lock:
+            # a lone worker may be briefly unavailable while it reloads
+            self._lock.wait_for(lambda: self.ready or self.failure is not None, timeout)
+            ready = [(len(w.inflight), i) for i, w in enumerate(self._workers) if w is not None and w.ready]
+            if not ready:
+                self._free.put(slot)
+                raise RuntimeError(self.failure or "No model workers ready")
+            _, worker_id = min(ready)
+            worker = self._workers[worker_id]
+            task_id = self._next_id
+            self._next_id += 1
+            self._inflight[task_id] = (fut, slot, scale, worker_id)
+            worker.inflight.add(task_id)
+        try:
+            with worker.send_lock:
+                worker.conn.send((task_id, slot, img.shape))
+        except (OSError, ValueError) as e:
+            self._finish(task_id, None, f"worker unavailable: {e}")
+        return fut
+
+    def _take_slot(self, timeout, poll=0.25):
+        """A free shared-memory slot; raises if none frees up within timeout or the pool closes."""
+        waited = 0.0
+        while True:
+            if not self._running:
+                raise RuntimeError("Worker pool is closed")
+            if timeout is not None and waited >= timeout:
+                raise TimeoutError(f"no free worker slot within {timeout}s")
+            step = poll if timeout is None else min(poll, timeout - waited)
+            try:
+                return self._free.get(timeout=step)
+            except queue.Empty:
+                waited += step
+
+    def predict(self, img, timeout=30.0):
+        return self.submit(img, timeout=timeout).result(timeout=timeout)
+
+    def reload(self, timeout=300.0):
+        """
+        Reload the model in every worker, one at a time so the others keep
+        serving. A reloading worker takes no new requests; those already sent
+        to it finish on the old model first. Returns the new model info.
+        """
+        for worker_id in range(self.num_workers):
+            with self._lock:
+                worker = self._workers[worker_id]
+                if worker is None or not worker.ready:
+                    continue
+                worker.ready = False
+                worker.reload_error = None
+            try:
+                with worker.send_lock:
+                    worker.conn.send('reload')
+            except (OSError, ValueError):
+                continue  # the collector restarts it with the new files anyway
+            with self._lock:
+                done = self._lock.wait_for(
+                    lambda: worker.ready or worker.reload_error is not None or self._workers[worker_id] is not worker,
+                    timeout)
+                if worker.reload_error is not None:
+                    raise RuntimeError(worker.reload_error)
+                if not done:
+                    raise TimeoutError(f"worker {worker_id} did not reload within {timeout}s")
+        return self.info
+
+    def _finish(self, task_id, preds, error, version=None):
+        with self._lock:
+            entry = self._inflight.pop(task_id, None)
+            if entry is None:
+                return
+            fut, slot, scale, worker_id = entry
+            worker = self._workers[worker_id]
+            if worker is not None:
+                worker.inflight.discard(task_id)
+        self._free.put(slot)
+        if error is not None:
+            self.errors += 1
+            fut.set_exception(RuntimeError(error))
+        else:
+            self.completed += 1
+            if scale != 1.0:
+                preds = scale_predictions(preds, 1.0 / scale, 1.0 / scale)
+            fut.set_result((preds, version))
+
+    def _collect(self):
+        while self._running:
+            with self._lock:
+                conns = {w.conn: i for i, w in enumerate(self._workers) if w is not None}
+            for conn in wait_connections(list(conns), timeout=1.0):
+                worker_id = conns[conn]
+                try:
+                    msg = conn.recv()
+                except (EOFError, OSError):
+                    self._restart(worker_id)
+                    continue
+                kind = msg[0]
+                if kind == 'result':
+                    _, task_id, preds, error, version = msg
+                    self._finish(task_id, preds, error, version)
+                elif kind == 'ready':
+                    with self._lock:
+                        worker = self._workers[worker_id]
+                        worker.ready = True
+                        self._restart_count[worker_id] = 0
+                        worker.version = msg[2]['version']
+                        self.info = msg[2]
+                        self._lock.notify_all()
+                elif kind == 'reload_failed':
+                    print(f"[ModelWorkerPool] worker {worker_id} failed to reload, keeping old model: {msg[2]}")
+                    with self._lock:
+                        worker = self._workers[worker_id]
+                        worker.reload_error = msg[2]
+                        worker.ready = True
+                        self._lock.notify_all()
+                elif kind == 'failed':
+                    print(f"[ModelWorkerPool] worker {worker_id} failed to load model: {msg[2]}")
+                    with self._lock:
+                        worker = self._workers[worker_id]
+                        self._workers[worker_id] = None
+                        self._give_up(worker_id, msg[2])
+                    worker.process.join(timeout=1.0)
+                    worker.conn.close()
+            for i, w in enumerate(list(self._workers)):
+                # a worker that exited right after sending 'failed' is handled on the next pass, not restarted
+                if w is not None and not w.process.is_alive() and not w.conn.poll():
+                    self._restart(i)
+            now = time.monotonic()
+            for i, due in list(self._restart_due.items()):
+                if now >= due and self._running:
+                    del self._restart_due[i]
+                    self._spawn(i)
+
+    def _give_up(self, worker_id, reason):
+        """Mark a worker as permanently failed; start-up fails once no worker is left that could come up."""
+        self._failed.add(worker_id)
+        if len(self._failed) == self.num_workers:
+            self.failure = reason
+        self._lock.notify_all()
+
+    def _restart(self, worker_id):
+        with self._lock:
+            worker = self._workers[worker_id]
+            if worker is None or not self._running:
+                return
+            self._workers[worker_id] = None
+            pending = list(worker.inflight)
+            self._lock.notify_all()
+        worker.process.join(timeout=1.0)
+        worker.conn.close()
+        # whatever it held is lost; fail its requests so callers don't hang
+        for task_id in pending:
+            self._finish(task_id, None, "worker process died")
+        count = self._restart_count[worker_id]
+        if count >= MAX_RESTARTS:
+            print(f"[ModelWorkerPool] worker {worker_id} exited ({worker.process.exitcode}) "
+                  f"after {count} restarts; giving up on it")
+            with self._lock:
+                self._give_up(worker_id, f"worker {worker_id} kept exiting ({worker.process.exitcode})")
+            return
+        delay = min(RESTART_BACKOFF_MAX, RESTART_BACKOFF * 2 ** count)
+        print(f"[ModelWorkerPool] worker {worker_id} exited ({worker.process.exitcode}); restarting in {delay:.1f}s")
+        self._restart_count[worker_id] = count + 1
+        self.restarts += 1
+        self._restart_due[worker_id] = time.monotonic() + delay
+
+    def close(self):
+        self._running = False
+        workers = [w for w in self._workers if w is not None]
+        for w in workers:
+            try:
+                with w.send_lock:
+                    w.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for w in workers:
+            w.process.join(timeout=5)
+            if w.process.is_alive():
+                w.process.terminate()
+            w.conn.close()
+        for shm in self._slots:
+            shm.close()
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            workers = [w for w in self._workers if w is not None]
+            return {
+                'workers': self.num_workers,
+                'alive': sum(1 for w in workers if w.process.is_alive()),
+                'ready': sum(1 for w in workers if w.ready),
+                'versions': sorted({w.version for w in workers if w.version}),
+                'threads_per_worker': self.config['threads'],
+                'slots': len(self._slots),
+                'free_slots': self._free.qsize(),
+                'inflight': len(self._inflight),
+                'completed': self.completed,
+                'errors': self.errors,
+                'restarts': self.restarts,
+                'restarting': len(self._restart_due),
+                'given_up': len(self._failed),
+            }